@@ -1,15 +1,18 @@
 from typing import NamedTuple
-from models.Object import Object, CompiledFunction
+from models.Object import Object, CompiledFunction, ClosureObject
 from models.Code import Instructions, make, OpCode, as_string
 from models.AST import Program
 from exec.Lexer import Lexer
 from exec.Parser import Parser
 from exec.Compiler import Compiler
+from exec.PassManager import DEFAULT_OPTIMIZATION_LEVEL
+from models.SymbolTable import SymbolTable, ScopeType
 
 class CompilerTestCase(NamedTuple):
     input_src: str
     expected_constants: list
     expected_instructions: list[Instructions]
+    level: int = DEFAULT_OPTIMIZATION_LEVEL
 
 
 def test_builder():
@@ -56,24 +59,33 @@ def test_builder():
         ]),
         CompilerTestCase("if true { 10; }; 3333;", [10, 3333], [
             make(OpCode.OpTrue),
-            make(OpCode.OpJumpNotTruthy, 10),
+            make(OpCode.OpJumpNotTruthy, 8),
             make(OpCode.OpConstant, 0),
-            make(OpCode.OpJump, 11),
-            make(OpCode.OpNull),
             make(OpCode.OpPop),
             make(OpCode.OpConstant, 1),
             make(OpCode.OpPop)
         ]),
         CompilerTestCase("if true { 10; } else { 20; }; 3333;", [10, 20, 3333], [
             make(OpCode.OpTrue),
-            make(OpCode.OpJumpNotTruthy, 10),
+            make(OpCode.OpJumpNotTruthy, 11),
             make(OpCode.OpConstant, 0),
-            make(OpCode.OpJump, 13),
+            make(OpCode.OpPop),
+            make(OpCode.OpJump, 15),
             make(OpCode.OpConstant, 1),
             make(OpCode.OpPop),
             make(OpCode.OpConstant, 2),
             make(OpCode.OpPop)
         ]),
+        CompilerTestCase("let a = if true { 10 }; a;", [10], [
+            make(OpCode.OpTrue),
+            make(OpCode.OpJumpNotTruthy, 10),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpJump, 11),
+            make(OpCode.OpNull),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpGetGlobal, 0),
+            make(OpCode.OpPop)
+        ]),
         CompilerTestCase("let one = 1; let two = 2;", [1, 2], [
             make(OpCode.OpConstant, 0),
             make(OpCode.OpSetGlobal, 0),
@@ -85,15 +97,40 @@ def test_builder():
             make(OpCode.OpSetGlobal, 0),
             make(OpCode.OpGetGlobal, 0),
             make(OpCode.OpPop)
+        ], level=0),
+        CompilerTestCase("let one = 1; one;", [1], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("let one = 1; let f = fn() { one = 2; }; one;", [1, 2, [
+                make(OpCode.OpConstant, 1),
+                make(OpCode.OpSetGlobal, 0),
+                make(OpCode.OpReturn)
+            ]
+        ], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpSetGlobal, 1),
+            make(OpCode.OpGetGlobal, 0),
+            make(OpCode.OpPop)
         ]),
         CompilerTestCase("[]", [], [
             make(OpCode.OpArray, 0),
             make(OpCode.OpPop)
         ]),
-        CompilerTestCase("[1, 2, 3]", [1, 2, 3], [
+        CompilerTestCase("[1, 2, 3]", ["[1, 2, 3]"], [
+            make(OpCode.OpCopyConstant, 0),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("[1, 2 + 3, [4, -5]]", [1, 2, 3, "[4, -5]"], [
             make(OpCode.OpConstant, 0),
             make(OpCode.OpConstant, 1),
             make(OpCode.OpConstant, 2),
+            make(OpCode.OpAdd),
+            make(OpCode.OpCopyConstant, 3),
             make(OpCode.OpArray, 3),
             make(OpCode.OpPop)
         ]),
@@ -101,35 +138,213 @@ def test_builder():
             make(OpCode.OpHash, 0),
             make(OpCode.OpPop)
         ]),
-        CompilerTestCase("{1: 2, 3: 4, 5: 6}", [1, 2, 3, 4, 5, 6], [
+        CompilerTestCase("{1: 2, 3: 4, 5: 6}", ["{1: 2, 3: 4, 5: 6}"], [
+            make(OpCode.OpCopyConstant, 0),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("{1: 2, 3: true}", [1, 2, 3], [
             make(OpCode.OpConstant, 0),
             make(OpCode.OpConstant, 1),
             make(OpCode.OpConstant, 2),
-            make(OpCode.OpConstant, 3),
-            make(OpCode.OpConstant, 4),
-            make(OpCode.OpConstant, 5),
-            make(OpCode.OpHash, 6),
+            make(OpCode.OpTrue),
+            make(OpCode.OpHash, 4),
             make(OpCode.OpPop)
         ]),
-        CompilerTestCase("[1, 2, 3][1 + 1];", [1, 2, 3, 1, 1], [
+        CompilerTestCase("{\"b\": 1 + 1, \"a\": 2}", ["b", 1, 1, "a", 2], [
             make(OpCode.OpConstant, 0),
             make(OpCode.OpConstant, 1),
             make(OpCode.OpConstant, 2),
-            make(OpCode.OpArray, 3),
+            make(OpCode.OpAdd),
             make(OpCode.OpConstant, 3),
             make(OpCode.OpConstant, 4),
+            make(OpCode.OpHash, 4),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("[1, 2, 3][1 + 1];", ["[1, 2, 3]", 1, 1], [
+            make(OpCode.OpCopyConstant, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpConstant, 2),
             make(OpCode.OpAdd),
             make(OpCode.OpIndex),
             make(OpCode.OpPop)
         ]),
-        CompilerTestCase("{1: 2}[2 - 1];", [1, 2, 2, 1], [
+        CompilerTestCase("{1: 2}[2 - 1];", ["{1: 2}", 2, 1], [
+            make(OpCode.OpCopyConstant, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpSub),
+            make(OpCode.OpIndex),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("let s = \"ab\"; let i = 0; while i < len(s) { i = i + 1; }", ["ab", 0, 1], [
             make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpSetGlobal, 1),
+            make(OpCode.OpGetBuiltin, 0),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpCall, 1),
+            make(OpCode.OpSetGlobal, 2),
+            make(OpCode.OpGetGlobal, 2),
+            make(OpCode.OpGetGlobal, 1),
+            make(OpCode.OpGreaterThan),
+            make(OpCode.OpJumpNotTruthy, 45),
+            make(OpCode.OpGetGlobal, 1),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpAdd),
+            make(OpCode.OpSetGlobal, 1),
+            make(OpCode.OpLoop, 21)
+        ]),
+        CompilerTestCase("let sq = fn(x) { x * x }; let n = 2; sq(n + 1);", [[
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpMul),
+                make(OpCode.OpReturnValue)
+            ], 2, 1
+        ], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpSetGlobal, 1),
             make(OpCode.OpConstant, 1),
-            make(OpCode.OpHash, 2),
             make(OpCode.OpConstant, 2),
+            make(OpCode.OpAdd),
+            make(OpCode.OpSetGlobal, 2),
+            make(OpCode.OpGetGlobal, 2),
+            make(OpCode.OpGetGlobal, 2),
+            make(OpCode.OpMul),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("let sq = fn(x) { x * x }; let area = fn(w) { sq(w) + 1 }; area(4);", [[
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpMul),
+                make(OpCode.OpReturnValue)
+            ], 1, [
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpMul),
+                make(OpCode.OpConstant, 1),
+                make(OpCode.OpAdd),
+                make(OpCode.OpReturnValue)
+            ], 17
+        ], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpSetGlobal, 1),
             make(OpCode.OpConstant, 3),
-            make(OpCode.OpSub),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("fn(x) { let a = x + 1; let b = a * 2; b };", [1, 2, [
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpConstant, 0),
+                make(OpCode.OpAdd),
+                make(OpCode.OpSetLocal, 0),
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpConstant, 1),
+                make(OpCode.OpMul),
+                make(OpCode.OpSetLocal, 0),
+                make(OpCode.OpGetLocal, 0),
+                make(OpCode.OpReturnValue)
+            ]
+        ], [
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("let a = {}; let i = 0; a[i] + a[i] * 2;", [0, 2], [
+            make(OpCode.OpHash, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 1),
+            make(OpCode.OpGetGlobal, 0),
+            make(OpCode.OpConstant, 0),
             make(OpCode.OpIndex),
+            make(OpCode.OpSetGlobal, 2),
+            make(OpCode.OpGetGlobal, 2),
+            make(OpCode.OpGetGlobal, 2),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpMul),
+            make(OpCode.OpAdd),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("let a = 1; let b = a * 2.5; a > b; a + \"x\";", [1, 2.5, "x"], [
+            make(OpCode.OpConstantShort, 0),
+            make(OpCode.OpSetGlobalShort, 0),
+            make(OpCode.OpConstantShort, 0),
+            make(OpCode.OpConstantShort, 1),
+            make(OpCode.OpMulFloat),
+            make(OpCode.OpSetGlobalShort, 1),
+            make(OpCode.OpConstantShort, 0),
+            make(OpCode.OpGetGlobalShort, 1),
+            make(OpCode.OpGreaterThanNumber),
+            make(OpCode.OpPop),
+            make(OpCode.OpConstantShort, 0),
+            make(OpCode.OpConstantShort, 2),
+            make(OpCode.OpAdd),
+            make(OpCode.OpPop)
+        ], level=2),
+        CompilerTestCase("let i = 0; while i < 3 { i = i + 1; }", [0, 3, 1], [
+            make(OpCode.OpConstantShort, 0),
+            make(OpCode.OpSetGlobalShort, 0),
+            make(OpCode.OpConstantShort, 1),
+            make(OpCode.OpGetGlobalShort, 0),
+            make(OpCode.OpGreaterThanNumber),
+            make(OpCode.OpJumpNotTruthyShort, 20),
+            make(OpCode.OpGetGlobalShort, 0),
+            make(OpCode.OpConstantShort, 2),
+            make(OpCode.OpAddInt),
+            make(OpCode.OpSetGlobalShort, 0),
+            make(OpCode.OpLoopShort, 15)
+        ], level=2),
+        CompilerTestCase("let n = 3; for (let i = 0; i < n; i = i + 1) { i; }", [3, 0], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpSetGlobal, 1),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpRangeTest, 0, 1, 33),
+            make(OpCode.OpGetGlobal, 1),
+            make(OpCode.OpPop),
+            make(OpCode.OpRangeStep, 0, 1, 1, 15),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("if true && false { 10; } true || false;", [10], [
+            make(OpCode.OpTrue),
+            make(OpCode.OpJumpNotTruthy, 12),
+            make(OpCode.OpFalse),
+            make(OpCode.OpJumpNotTruthy, 12),
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpPop),
+            make(OpCode.OpTrue),
+            make(OpCode.OpJumpNotTruthy, 20),
+            make(OpCode.OpTrue),
+            make(OpCode.OpJump, 21),
+            make(OpCode.OpFalse),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("for (let i = 0; i < 3; i = i + 1) { if i > 1 { break; } continue; }", [0, 3, 1], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpSetGlobal, 0),
+            make(OpCode.OpConstant, 1),
+            make(OpCode.OpRangeTest, 0, 0, 36),
+            make(OpCode.OpGetGlobal, 0),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpGreaterThan),
+            make(OpCode.OpJumpNotTruthy, 28),
+            make(OpCode.OpJump, 36),
+            make(OpCode.OpRangeStep, 0, 0, 1, 9),
+            make(OpCode.OpPop)
+        ]),
+        CompilerTestCase("match 2 { 1 => { 10; }, 2, 3 => { 20; } }; 1;", [2, "JumpTable[3 labels]", 10, 20, 1], [
+            make(OpCode.OpConstant, 0),
+            make(OpCode.OpMatch, 1, 19),
+            make(OpCode.OpConstant, 2),
+            make(OpCode.OpPop),
+            make(OpCode.OpJump, 19),
+            make(OpCode.OpConstant, 3),
+            make(OpCode.OpPop),
+            make(OpCode.OpConstant, 4),
             make(OpCode.OpPop)
         ]),
         CompilerTestCase("fn() { return 5 + 10; }", [
@@ -204,9 +419,17 @@ def test_constants(expected: list, actual: list[Object]) -> str:
             err = test_integer_object(int(constant), actual[i])
             if err is not None:
                 return f"constant {i} - testIntegerObject failed: {err}"
+        elif isinstance(constant, str):
+            if actual[i].inspect() != constant:
+                return f"constant {i} - wrong value. got={actual[i].inspect()}, want={constant}"
         elif isinstance(constant, list):
-            if not isinstance(actual[i], CompiledFunction):
+            fn = actual[i].fn if isinstance(actual[i], ClosureObject) else actual[i]
+            if not isinstance(fn, CompiledFunction):
                 return f"constant {i} - not a function: {actual[i]}"
+
+            err = test_instructions(constant, fn.instructions)
+            if err is not None:
+                return f"constant {i} - testInstructions failed: {err}"
             
 def test_integer_object(expected: int, actual: Object) -> str:
     if not actual.type() == "INTEGER":
@@ -223,13 +446,29 @@ def concat_instructions(s: list[Instructions]) -> Instructions:
     
     return out
 
+def test_symbol_table() -> str:
+    global_table: SymbolTable = SymbolTable()
+    global_table.define_builtin(0, "len")
+    global_table.define("g")
+
+    # Builtins and globals are loaded directly from any depth, never captured as free variables
+    nested: SymbolTable = SymbolTable(outer=SymbolTable(outer=global_table))
+    for name, scope in [("len", ScopeType.BUILTIN_SCOPE), ("g", ScopeType.GLOBAL_SCOPE)]:
+        symbol, ok = nested.resolve(name)
+        if not ok or symbol.scope != scope:
+            return f"{name} resolved as {symbol}, want scope {scope}"
+
+    if len(nested.free_symbols) > 0 or len(nested.outer.free_symbols) > 0:
+        return f"Free symbols defined: {nested.free_symbols} {nested.outer.free_symbols}"
+    return None
+
 def run():
     tests: list[CompilerTestCase] = [t for t in test_builder()]
 
     for t in tests:
         program = parse(t.input_src)
 
-        compiler = Compiler()
+        compiler = Compiler(level=t.level)
         err = compiler.compile(program)
         if err is not None:
             print(f"Compiler error: {err}")
@@ -248,4 +487,9 @@ def run():
             exit(1)
 
 if __name__ == '__main__':
+    err = test_symbol_table()
+    if err is not None:
+        print(f"testSymbolTable failed: {err}")
+        exit(1)
+
     run()
\ No newline at end of file
@@ -0,0 +1,297 @@
+from exec.Lexer import Lexer
+from exec.Parser import Parser
+from exec.Compiler import Compiler, Bytecode, Module, resolve_import
+from exec.Optimizer import walk, reassigned_names, function_assigned_names
+from exec.PassManager import PassManager
+from exec.Linker import Linker, CompiledModule
+from models.AST import Program
+from models.SymbolTable import ScopeType
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+import os
+
+
+@dataclass
+class ScannedModule:
+    path: str
+    source: str = None
+    # Resolved paths of the files it imports, in the order of the import statements
+    imports: list[str] = field(default_factory=list)
+    # The path each import statement names -> the file it resolved to
+    import_paths: dict[str, str] = field(default_factory=dict)
+    # What it assigns, see Optimizer.reassigned_names and Optimizer.function_assigned_names
+    reassigned: set[str] = field(default_factory=set)
+    function_assigned: set[str] = field(default_factory=set)
+    error: str = None
+
+
+# region Workers
+# Run in the processes of the pool, so they only take and return what pickles
+def parse_file(path: str) -> tuple[Program | None, str, str | None]:
+    try:
+        with open(path, "r") as f:
+            src: str = f.read()
+    except OSError as e:
+        return None, None, f"Could not read {path}: {e}"
+
+    p: Parser = Parser(lexer=Lexer(source=src))
+    program: Program = p.parse_program()
+    if len(p.errors) > 0:
+        return None, src, f"Parser errors in {path}: {'; '.join(p.errors)}"
+    return program, src, None
+
+def scan_module(path: str, search_path: list[str]) -> ScannedModule:
+    module: ScannedModule = ScannedModule(path=path)
+
+    program, module.source, module.error = parse_file(path)
+    if module.error is not None:
+        return module
+
+    for n in walk(program, enter_functions=True):
+        if n.type() != "ImportStatement":
+            continue
+
+        imported, directories = resolve_import(n.file_path, path, search_path)
+        if imported is None:
+            module.error = f"Could not find \"{n.file_path}\" to import, looked in: {', '.join(directories)}"
+            return module
+        module.import_paths[n.file_path] = imported
+        if imported not in module.imports:
+            module.imports.append(imported)
+
+    module.reassigned = reassigned_names(program)
+    module.function_assigned = function_assigned_names(program)
+    return module
+
+def compile_module(path: str, imports: list[str], imported: list[tuple[str, str]], reassigned: set[str], function_assigned: set[str], passes: PassManager, search_path: list[str]) -> CompiledModule:
+    module: CompiledModule = CompiledModule(path=path, imported=imported)
+
+    program, _, module.error = parse_file(path)
+    if module.error is not None:
+        return module
+
+    compiler: Compiler = Compiler(passes=passes, path=path, search_path=search_path)
+
+    # Whole program facts the Compiler would otherwise gather from the imported files themselves
+    compiler.reassigned |= reassigned
+    compiler.function_assigned |= function_assigned
+
+    # The globals of the modules it can see come first, and its imports compile to nothing
+    for name, _ in imported:
+        compiler.symbol_table.define(name)
+    for dep in imports:
+        compiler.modules[dep] = Module(path=dep, program=Program(), compiled=True)
+
+    module.error = compiler.compile(program)
+    if module.error is not None:
+        return module
+
+    # A function of any module may assign these, so any call may change them
+    for symbol in compiler.symbol_table.store.values():
+        if symbol.scope == ScopeType.GLOBAL_SCOPE and symbol.name in function_assigned:
+            compiler.globals_set_by_functions.add(symbol.index)
+
+    bytecode: Bytecode = compiler.bytecode()
+    module.instructions = bytecode.instructions
+    module.constants = bytecode.constants
+    module.num_globals = compiler.symbol_table.num_definitions
+    module.exports = {
+        s.name: s.index for s in compiler.symbol_table.store.values()
+        if s.scope == ScopeType.GLOBAL_SCOPE and s.index >= len(imported) and not s.name.startswith("$")
+    }
+    module.timings = passes.timings
+    module.runs = passes.runs
+    return module
+# endregion
+
+
+class Builder:
+    """ Compiles a program and the files it imports each on its own, in a pool of processes, then links them.
+
+    Files are first parsed in parallel to find their imports and what they assign. A file is compiled as
+    soon as the files it imports are, seeing the globals those define. The linked program runs every file
+    after the files it imports, in the order the imports are first reached. Unlike compiling the program in
+    one piece, a file only sees the globals of the files it imports (directly or not), and cross-file
+    optimizations (inlining, constant globals, compile-time calls) are left out.
+
+    Scanned and compiled files are kept between builds: building again only reads the files modified since
+    (by mtime), and only compiles those and the files importing them, see `watch` in main.py.
+    """
+    def __init__(self, passes: PassManager, search_path: list[str], jobs: int = None) -> None:
+        self.passes: PassManager = passes
+        self.search_path: list[str] = search_path
+        self.jobs: int = os.cpu_count() if jobs is None else jobs
+
+        # Path -> source of every file read besides the program itself, see exec.BytecodeCache
+        self.import_sources: dict[str, str] = {}
+        # (path as written, importing file) -> resolved path of every import, see exec.BytecodeCache
+        self.import_paths: dict[tuple[str, str], str] = {}
+
+        # What the last builds left, by path. `mtimes` holds the mtime of every file read, as of when it
+        # was read (None if it could not be)
+        self.scanned: dict[str, ScannedModule] = {}
+        self.compiled: dict[str, CompiledModule] = {}
+        self.mtimes: dict[str, float | None] = {}
+        # The whole program facts the kept modules were compiled with
+        self.facts: tuple[set[str], set[str]] = (set(), set())
+        # The files the last build read and compiled
+        self.files: set[str] = set()
+        self.recompiled: list[str] = []
+
+    def build(self, path: str) -> tuple[Bytecode | None, str | None]:
+        root: str = os.path.realpath(path)
+
+        for changed in self.changed_files():
+            self.scanned.pop(changed, None)
+            self.compiled.pop(changed, None)
+            del self.mtimes[changed]
+        self.recompiled = []
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            scanned, err = self.scan(pool, root)
+            if err is not None:
+                return None, err
+
+            order, err = self.link_order(root, scanned)
+            if err is not None:
+                return None, err
+
+            compiled, err = self.compile(pool, root, order, scanned)
+            if err is not None:
+                return None, err
+
+        self.import_sources = {p: m.source for p, m in scanned.items() if p != root}
+        self.import_paths = {(written, p): imported for p, m in scanned.items() for written, imported in m.import_paths.items()}
+
+        linker: Linker = Linker(compact=self.passes.is_enabled("compact-encoding"))
+        return linker.link([compiled[p] for p in order]), None
+
+    def changed_files(self) -> set[str]:
+        """ The files the last build read that were modified, created or removed since """
+        changed: set[str] = set()
+        for path in self.files:
+            try:
+                mtime: float | None = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+            if mtime != self.mtimes.get(path):
+                changed.add(path)
+        return changed
+
+    def scan(self, pool: ProcessPoolExecutor, root: str) -> tuple[dict[str, ScannedModule], str | None]:
+        scanned: dict[str, ScannedModule] = {}
+        submitted: set[str] = set()
+        pending: set[Future] = set()
+        self.files = submitted
+
+        def reach(path: str) -> None:
+            if path in submitted:
+                return
+            submitted.add(path)
+
+            if path in self.scanned:
+                scanned[path] = self.scanned[path]
+                for dep in self.scanned[path].imports:
+                    reach(dep)
+                return
+
+            # Taken before reading, so a change made while it is read shows up in the next build
+            try:
+                self.mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                self.mtimes[path] = None
+            pending.add(pool.submit(scan_module, path, self.search_path))
+
+        reach(root)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                module: ScannedModule = future.result()
+                if module.error is not None:
+                    return scanned, module.error
+
+                scanned[module.path] = self.scanned[module.path] = module
+                for dep in module.imports:
+                    reach(dep)
+
+        return scanned, None
+
+    def link_order(self, root: str, scanned: dict[str, ScannedModule]) -> tuple[list[str], str | None]:
+        """ Every file after the files it imports, in the order the imports are reached from `root` """
+        order: list[str] = []
+        stack: list[str] = []
+
+        def visit(path: str) -> str | None:
+            if path in stack:
+                cycle: list[str] = [*stack[stack.index(path):], path]
+                return f"Import cycle: {' -> '.join(os.path.basename(m) for m in cycle)}"
+            if path in order:
+                return None
+
+            stack.append(path)
+            for dep in scanned[path].imports:
+                err = visit(dep)
+                if err is not None:
+                    return err
+            stack.pop()
+
+            order.append(path)
+            return None
+
+        return order, visit(root)
+
+    def compile(self, pool: ProcessPoolExecutor, root: str, order: list[str], scanned: dict[str, ScannedModule]) -> tuple[dict[str, CompiledModule], str | None]:
+        reassigned: set[str] = set().union(*(m.reassigned for m in scanned.values()))
+        function_assigned: set[str] = set().union(*(m.function_assigned for m in scanned.values()))
+
+        # Path -> every file it imports, directly or not
+        deps: dict[str, set[str]] = {}
+        for path in order:
+            deps[path] = set().union(*({d} | deps[d] for d in scanned[path].imports))
+
+        # A file compiled with other facts may have assumed a global is never reassigned, start over
+        if (reassigned, function_assigned) != self.facts:
+            self.compiled = {}
+            self.facts = (reassigned, function_assigned)
+
+        # The globals a file sees may have changed with any file it imports
+        stale: set[str] = set()
+        for path in order:
+            if path not in self.compiled or len(deps[path] & stale) > 0:
+                stale.add(path)
+                self.compiled.pop(path, None)
+
+        compiled: dict[str, CompiledModule] = {p: self.compiled[p] for p in order if p not in stale}
+        waiting: list[str] = [p for p in order if p in stale]
+        pending: dict[Future, str] = {}
+        while len(waiting) > 0 or len(pending) > 0:
+            for path in [p for p in waiting if all(d in compiled for d in scanned[p].imports)]:
+                waiting.remove(path)
+
+                # The globals it sees, a later file's definition of a name shadowing an earlier one
+                visible: dict[str, str] = {}
+                for d in order:
+                    if d in deps[path]:
+                        visible |= {name: d for name in compiled[d].exports}
+
+                future: Future = pool.submit(
+                    compile_module, path, scanned[path].imports, list(visible.items()),
+                    reassigned, function_assigned, self.passes, self.search_path
+                )
+                pending[future] = path
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+
+                module: CompiledModule = future.result()
+                if module.error is not None:
+                    return compiled, module.error if module.path == root else f"In {module.path}: {module.error}"
+
+                for name, elapsed in module.timings.items():
+                    self.passes.timings[name] = self.passes.timings.get(name, 0.0) + elapsed
+                    self.passes.runs[name] = self.passes.runs.get(name, 0) + module.runs[name]
+                compiled[module.path] = self.compiled[module.path] = module
+                self.recompiled.append(module.path)
+
+        return compiled, None
@@ -0,0 +1,172 @@
+from exec.Compiler import Bytecode, COMPILER_VERSION, resolve_import
+from exec.PassManager import PassManager
+from exec.VM import TRUE_OBJ, FALSE_OBJ, NULL_OBJ
+from models.Code import Instructions
+from models.Object import Object, IntegerObject, FloatObject, StringObject, ArrayObject, HashObject
+from models.Object import HashKey, HashPair, CompiledFunction, ClosureObject, JumpTable
+from hashlib import sha256
+import json
+import os
+
+
+def source_hash(src: str) -> str:
+    return sha256(src.encode()).hexdigest()
+
+# region Constant Encoding
+def encode_object(obj: Object) -> dict:
+    """ A JSON-able form of a constant, raises ValueError for objects that only exist at runtime """
+    match obj.type():
+        case "INTEGER" | "FLOAT" | "STRING" | "BOOL":
+            return {"type": obj.type(), "value": obj.value}
+        case "NULL":
+            return {"type": obj.type()}
+        case "ARRAY":
+            return {"type": obj.type(), "elements": [encode_object(e) for e in obj.elements]}
+        case "HASH":
+            return {"type": obj.type(), "pairs": [[encode_object(p.key), encode_object(p.value)] for p in obj.pairs.values()]}
+        case "COMPILED_FUNCTION_OBJ":
+            return {
+                "type": obj.type(),
+                "instructions": obj.instructions.hex(),
+                "num_locals": obj.num_locals,
+                "num_params": obj.num_parameters,
+                "site": obj.site,
+                "sites": obj.sites,
+                "name": obj.name
+            }
+        case "CLOSURE":
+            return {"type": obj.type(), "fn": encode_object(obj.fn), "free": [encode_object(f) for f in obj.free]}
+        case "JUMP_TABLE":
+            return {
+                "type": obj.type(),
+                "cases": [[key.type, key.value, case] for key, case in obj.cases.items()],
+                "targets": [[key.type, key.value, offset] for key, offset in obj.targets.items()]
+            }
+    raise ValueError(f"Can not cache a constant of type {obj.type()}")
+
+def decode_object(data: dict) -> Object:
+    match data["type"]:
+        case "INTEGER":
+            return IntegerObject(value=data["value"])
+        case "FLOAT":
+            return FloatObject(value=data["value"])
+        case "STRING":
+            return StringObject(value=data["value"])
+        case "BOOL":
+            # The VM compares booleans and null by identity
+            return TRUE_OBJ if data["value"] else FALSE_OBJ
+        case "NULL":
+            return NULL_OBJ
+        case "ARRAY":
+            return ArrayObject(elements=[decode_object(e) for e in data["elements"]])
+        case "HASH":
+            pairs: dict[HashKey, HashPair] = {}
+            for key, value in data["pairs"]:
+                k: Object = decode_object(key)
+                pairs[k.hash_key()] = HashPair(key=k, value=decode_object(value))
+            return HashObject(pairs=pairs)
+        case "COMPILED_FUNCTION_OBJ":
+            return CompiledFunction(
+                instructions=Instructions(bytes.fromhex(data["instructions"])),
+                num_locals=data["num_locals"],
+                num_params=data["num_params"],
+                site=data["site"],
+                # JSON object keys are always strings
+                sites={int(k): v for k, v in data["sites"].items()},
+                name=data["name"]
+            )
+        case "CLOSURE":
+            return ClosureObject(fn=decode_object(data["fn"]), free=[decode_object(f) for f in data["free"]])
+        case "JUMP_TABLE":
+            table: JumpTable = JumpTable(cases={HashKey(type=t, value=v): case for t, v, case in data["cases"]})
+            table.targets = {HashKey(type=t, value=v): offset for t, v, offset in data["targets"]}
+            return table
+    raise ValueError(f"Unknown constant type {data['type']}")
+# endregion
+
+
+class BytecodeCache:
+    """ Compiled programs kept on disk, so running an unchanged script again skips lexing, parsing and compiling.
+
+    An entry is a JSON file in `directory` named after the script, the search path and the optimization
+    passes it was built with. Besides the bytecode and its constant pool it holds the hash of the script and of every file it
+    imported, and the file each import resolved to: a change to any of them, a file an import would now find first
+    (e.g. one created earlier on the search path), or another COMPILER_VERSION makes the entry stale.
+    """
+    VERSION: int = 2
+
+    def __init__(self, directory: str, search_path: list[str] = None) -> None:
+        self.directory: str = directory
+
+        # Imports resolve through it, so entries built with another one may have read other files
+        self.search_path: list[str] = [] if search_path is None else search_path
+
+    def entry_path(self, path: str, passes: PassManager) -> str:
+        # Scripts of the same name in other directories may share the cache directory
+        enabled: list[str] = sorted(p.name for p in passes.passes() if passes.is_enabled(p.name))
+        search: str = os.pathsep.join(os.path.abspath(d) for d in self.search_path)
+        settings: str = sha256(f"{os.path.abspath(path)}:{search}:{','.join(enabled)}".encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{os.path.basename(path)}.{settings}.limec")
+
+    def load(self, path: str, source: str, passes: PassManager) -> Bytecode | None:
+        """ The cached bytecode of the script at `path`, None if there is none or it is stale """
+        try:
+            with open(self.entry_path(path, passes), "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != self.VERSION or data.get("compiler") != COMPILER_VERSION or data.get("source") != source_hash(source):
+            return None
+
+        for imported, digest in data["imports"].items():
+            try:
+                with open(imported, "r") as f:
+                    if source_hash(f.read()) != digest:
+                        return None
+            except OSError:
+                return None
+
+        for written, importer, imported in data["import_paths"]:
+            if resolve_import(written, importer, self.search_path)[0] != imported:
+                return None
+
+        try:
+            return Bytecode(
+                instructions=Instructions(bytes.fromhex(data["instructions"])),
+                constants=[decode_object(c) for c in data["constants"]],
+                sites={int(k): v for k, v in data["sites"].items()}
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def save(self, path: str, source: str, imports: dict[str, str], import_paths: dict[tuple[str, str | None], str], bytecode: Bytecode, passes: PassManager) -> str:
+        """ Stores the bytecode of the script at `path`. `imports` are the sources of the files it imported by path,
+        `import_paths` maps each import (the path as written and the importing file) to the file it resolved to """
+        try:
+            constants: list[dict] = [encode_object(c) for c in bytecode.constants]
+        except ValueError as e:
+            return f"Could not cache {path}: {e}"
+
+        data = {
+            "version": self.VERSION,
+            "compiler": COMPILER_VERSION,
+            "source": source_hash(source),
+            "imports": {imported: source_hash(src) for imported, src in imports.items()},
+            "import_paths": [[written, importer, imported] for (written, importer), imported in import_paths.items()],
+            "instructions": bytecode.instructions.hex(),
+            "sites": bytecode.sites,
+            "constants": constants
+        }
+
+        # Written aside and moved in place, so a run starting meanwhile never reads half an entry
+        entry: str = self.entry_path(path, passes)
+        temp: str = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp, entry)
+        except OSError as e:
+            return f"Could not cache {path}: {e}"
+        return None
@@ -0,0 +1,58 @@
+from exec.Compiler import Bytecode
+from models.Code import Instructions, walk_instructions
+from models.Object import CompiledFunction, ClosureObject
+from typing import NamedTuple
+
+
+class FunctionStats(NamedTuple):
+    name: str
+    instructions: int
+    bytes: int
+
+
+class BytecodeStats:
+    """ How densely a Bytecode is encoded: the count and total size of every opcode, and the size of the
+    main program and of each function in the constant pool. Wide instructions are counted apart, as `OpWide <op>` """
+    def __init__(self, bytecode: Bytecode) -> None:
+        self.opcode_counts: dict[str, int] = {}
+        self.opcode_bytes: dict[str, int] = {}
+        self.functions: list[FunctionStats] = []
+        self.num_constants: int = len(bytecode.constants)
+
+        self.add("<main>", bytecode.instructions)
+        for i, constant in enumerate(bytecode.constants):
+            fn = constant.fn if isinstance(constant, ClosureObject) else constant
+            if isinstance(fn, CompiledFunction):
+                self.add(fn.name if fn.name is not None else f"<fn #{i}>", fn.instructions)
+
+    def add(self, name: str, instructions: Instructions) -> None:
+        count: int = 0
+        for _, defin, _, size, wide in walk_instructions(instructions):
+            key: str = f"OpWide {defin.name}" if wide else defin.name
+            self.opcode_counts[key] = self.opcode_counts.get(key, 0) + 1
+            self.opcode_bytes[key] = self.opcode_bytes.get(key, 0) + size
+            count += 1
+
+        self.functions.append(FunctionStats(name=name, instructions=count, bytes=len(instructions)))
+
+    def total_instructions(self) -> int:
+        return sum(f.instructions for f in self.functions)
+
+    def total_bytes(self) -> int:
+        return sum(f.bytes for f in self.functions)
+
+    def report(self) -> str:
+        instructions: int = self.total_instructions()
+        size: int = self.total_bytes()
+        average: float = size / instructions if instructions > 0 else 0.0
+
+        output: str = f"== Bytecode: {instructions} instructions, {size} bytes ({average:.2f} bytes / instruction), {self.num_constants} constants ==\n"
+        for key in sorted(self.opcode_counts, key=lambda k: -self.opcode_bytes[k]):
+            count: int = self.opcode_counts[key]
+            share: float = count / instructions * 100
+            output += f"{key:<28} {count:>7} ({share:>5.1f}%) {self.opcode_bytes[key]:>8} bytes\n"
+
+        output += "== Functions ==\n"
+        for f in sorted(self.functions, key=lambda f: -f.bytes):
+            output += f"{f.name:<28} {f.instructions:>7} instructions {f.bytes:>8} bytes\n"
+        return output
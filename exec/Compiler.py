@@ -1,37 +1,125 @@
 from models.Code import Instructions, OpCode, make
-from models.Object import Object, IntegerObject, StringObject, CompiledFunction, FloatObject
+from models.IR import IRInstruction, ControlFlowGraph
+from models.Object import Object, IntegerObject, StringObject, CompiledFunction, FloatObject, ClosureObject
+from models.Object import ArrayObject, HashObject, HashKey, HashPair, Hashable, BooleanObject, JumpTable, LazyFunction
 from models.Builtins import Builtin_Functions
 from models.AST import Node, Program, ExpressionStatement, InfixExpression, IntegerLiteral, BooleanLiteral, PrefixExpression, IfExpression
 from models.AST import BlockStatement, LetStatement, IdentifierLiteral, StringLiteral, ArrayLiteral, HashLiteral, Expression, IndexExpression
 from models.AST import FunctionLiteral, ReturnStatement, CallExpression, ImportStatement, WhileStatement, AssignStatement, ForStatement, FloatLiteral
+from models.AST import MatchExpression, BreakStatement, ContinueStatement
 from models.SymbolTable import SymbolTable, Symbol, ScopeType
 
-from exec.Lexer import Lexer
+from exec.Lexer import Lexer, TokenReplay
 from exec.Parser import Parser
+from exec.Optimizer import PURE_BUILTINS, LITERAL_TYPES, LoopInvariants, find_loop_invariants, function_assigned_names
+from exec.Optimizer import reassigned_names, free_names, is_inlinable, rename_identifiers, assigned_names
+from exec.Optimizer import find_common_subexpressions, walk, CountedLoop, find_counted_loop, is_pure_function, is_short_circuit
+from exec.PassManager import PassManager, DEFAULT_OPTIMIZATION_LEVEL
+from models.Profile import Profile
 
-from dataclasses import dataclass
+from copy import deepcopy
+import os
+
+from dataclasses import dataclass, field
 
 @dataclass
 class Bytecode:
     instructions: Instructions
     constants: list[Object]
+    sites: dict[int, int] = field(default_factory=dict)
 
 @dataclass
 class EmittedInstruction:
     opcode: OpCode = None
     position: int = None
 
+@dataclass
+class InlineCandidate:
+    fn: FunctionLiteral
+    free: dict[str, Symbol]
+
+@dataclass
+class PureFunction:
+    # Constant pool index of the function's prebuilt closure
+    closure: int
+    # Global index -> constant pool index of every pure function a call may reach
+    globals: dict[int, int]
+
+@dataclass
+class Module:
+    # Resolved, absolute path of the file
+    path: str
+    program: Program
+    # Compiled into the program already: importing it again compiles to nothing
+    compiled: bool = False
+
+@dataclass
+class LoopContext:
+    # The OpJumps of the loop's break / continue statements, patched once the loop is compiled
+    breaks: list[int] = field(default_factory=list)
+    continues: list[int] = field(default_factory=list)
+    # Compiler.value_branches when the loop started
+    value_branches: int = 0
+
 @dataclass
 class CompilationScope:
-    instructions: Instructions
+    instructions: list[IRInstruction]
     last_instruction: EmittedInstruction
     previous_instruction: EmittedInstruction
+    # The loops being compiled, innermost last
+    loops: list[LoopContext] = field(default_factory=list)
+
+
+# Where imports are looked for when they are not next to the importing file
+DEFAULT_SEARCH_PATH: list[str] = ["debug"]
+
+# Bump on any change to the bytecode programs compile to, bytecode cached by another version is recompiled
+COMPILER_VERSION: int = 1
+
+# How much bigger a function the profile says is hot may be and still get inlined
+HOT_INLINE_FACTOR: int = 4
+
+# Most instructions a call evaluated at compile time may run before it is left to runtime
+EVALUATION_BUDGET: int = 10000
+
+# Largest string (in characters) or integer (in bytes) such a call may compute, and how big its result may be
+EVALUATION_SIZE_LIMIT: int = 10000
+
+
+def resolve_import(file_path: str, importer: str | None, search_path: list[str]) -> tuple[str | None, list[str]]:
+    """ The absolute path `file_path` refers to when imported by the file at `importer`, and the directories looked in """
+    directories: list[str] = [os.path.dirname(importer) if importer is not None else os.getcwd(), *search_path]
+    for directory in directories:
+        candidate: str = os.path.realpath(os.path.join(directory, file_path))
+        if os.path.isfile(candidate):
+            return candidate, directories
+    return None, directories
 
 
 class Compiler:
-    def __init__(self, symbol_table: SymbolTable = None, constants: list[Object] = None, debug: bool = False) -> None:
+    def __init__(self, symbol_table: SymbolTable = None, constants: list[Object] = None, debug: bool = False, level: int = DEFAULT_OPTIMIZATION_LEVEL, passes: PassManager = None, inline_threshold: int = 32, profile: Profile = None, lazy: bool = False, path: str = None, search_path: list[str] = None, interactive: bool = False) -> None:
         self.debug: bool = debug
 
+        # Compiling the inputs of a REPL one after the other (see exec.Repl): a later input may assign any
+        # global, so none counts as never reassigned
+        self.interactive: bool = interactive
+
+        # Imports resolve relative to the importing file first (the working directory if the program has no
+        # file), then to each directory of the search path
+        self.search_path: list[str] = DEFAULT_SEARCH_PATH if search_path is None else search_path
+
+        # Imported files are parsed with Parser(lazy=True) too, their function bodies are compiled on first call
+        self.lazy: bool = lazy
+
+        # An earlier run's profile drives inlining, block layout and specialization when given
+        self.profile: Profile | None = profile
+
+        # Decides which optimizations run (by -O level or by name) and times them
+        self.passes: PassManager = PassManager(level=level) if passes is None else passes
+
+        # Largest function body (in AST nodes) that gets inlined at its call sites
+        self.inline_threshold: int = inline_threshold
+
         self.instructions: Instructions = Instructions()
         self.constants: list[Object] = [] if constants is None else constants
 
@@ -43,7 +131,7 @@ class Compiler:
 
         # Handle Scope
         main_scope: CompilationScope = CompilationScope(
-            instructions=Instructions(),
+            instructions=[],
             last_instruction=EmittedInstruction(),
             previous_instruction=EmittedInstruction()
         )
@@ -51,20 +139,102 @@ class Compiler:
         self.scopes: list[CompilationScope] = [main_scope]
         self.scope_index: int = 0
 
+        # Optimizer State
+        self.function_assigned: set[str] = set()
+        self.reassigned: set[str] = set()
+        self.inline_candidates: dict[Symbol, InlineCandidate] = {}
+        self.pure_functions: dict[Symbol, PureFunction] = {}
+
+        # Globals bound once to a constant and never assigned, reading one loads that constant
+        self.constant_globals: dict[Symbol, IRInstruction] = {}
+
+        # Statements directly in a program or imported file, they run exactly once and in order
+        self.top_level: set[int] = set()
+
+        # Resolved path -> every file imported so far
+        self.modules: dict[str, Module] = {}
+        # The files being compiled, the one importing the next innermost last
+        self.module_stack: list[str] = [] if path is None else [os.path.realpath(path)]
+        # Path -> source of every file read for an import, see exec.BytecodeCache
+        self.import_sources: dict[str, str] = {}
+        # (path as written, importing file) -> resolved path of every import, see exec.BytecodeCache
+        self.import_paths: dict[tuple[str, str | None], str] = {}
+        self.substitutions: dict[int, Symbol] = {}
+        self.cached_expressions: dict[int, list[Expression]] = {}
+        self.hidden_count: int = 0
+
+        # Globals assigned from inside some function, any call may change them
+        self.globals_set_by_functions: set[int] = set()
+
+        # Expression statements whose value is used, e.g. the last one of a function body
+        self.value_statements: set[int] = set()
+
+        # How many if / match branches are being compiled for their value
+        self.value_branches: int = 0
+
+        # AST node id -> profiling site, numbered in source order so every build of a program agrees
+        self.sites: dict[int, int] = {}
+        self.site_count: int = 0
+
     def bytecode(self) -> Bytecode:
-        return Bytecode(instructions=self.current_instructions(), constants=self.constants)
+        cfg: ControlFlowGraph = ControlFlowGraph.from_instructions(
+            self.current_instructions(),
+            is_main=True,
+            clobbered_globals=set(self.globals_set_by_functions),
+            constants=self.constants,
+            profile=self.profile
+        )
+        self.passes.run(cfg)
+
+        return Bytecode(instructions=cfg.assemble(), constants=self.constants, sites=cfg.sites)
 
     def compile(self, node: Node) -> str:
+        # Expressions computed ahead of time (e.g. hoisted out of a loop) are just loaded
+        substitute: Symbol | None = self.substitutions.get(id(node))
+        if substitute is not None:
+            self.load_symbol(substitute)
+            return None
+
+        # The first evaluation of a common subexpression keeps a copy for the ones that follow
+        group: list[Expression] | None = self.cached_expressions.pop(id(node), None)
+        if group is not None:
+            err = self.compile(node)
+            if err is not None:
+                return err
+
+            symbol: Symbol = self.define_hidden("cse")
+            self.store_symbol(symbol)
+            self.load_symbol(symbol)
+
+            for expr in group[1:]:
+                self.substitutions[id(expr)] = symbol
+            return None
+
         match node.type():
             # Statements
             case "Program":
                 node: Program = node
-                for stmt in node.statements:
-                    err = self.compile(stmt)
-                    if err is not None:
-                        return err
+                self.number_sites(node)
+                self.top_level |= {id(s) for s in node.statements}
+
+                # What imported files assign counts too, even before they are compiled
+                for program in [node, *self.imported_programs(node, self.current_module())]:
+                    self.function_assigned |= function_assigned_names(program)
+                    self.reassigned |= reassigned_names(program)
+
+                # The value of the last statement is the result of the program
+                err = self.compile_with_value(node.statements)
+                if err is not None:
+                    return err
             case "ExpressionStatement":
                 node: ExpressionStatement = node
+
+                # Nobody looks at the value of an if / match used as a statement, so none is produced
+                if node.expr.type() == "IfExpression" and id(node) not in self.value_statements:
+                    return self.compile_if_statement(node.expr)
+                if node.expr.type() == "MatchExpression" and id(node) not in self.value_statements:
+                    return self.compile_match(node.expr, with_value=False)
+
                 err = self.compile(node.expr)
                 if err is not None:
                     return err
@@ -72,23 +242,33 @@ class Compiler:
                 self.emit(OpCode.OpPop)
             case "BlockStatement":
                 node: BlockStatement = node
-                for stmt in node.statements:
-                    err = self.compile(stmt)
-                    if err is not None:
-                        return err
+
+                err = self.compile_statements(node.statements)
+                if err is not None:
+                    return err
             case "LetStatement":
                 node: LetStatement = node
 
                 symbol: Symbol = self.symbol_table.define(node.name.value)
 
+                start: int = len(self.current_instructions())
                 err = self.compile(node.value)
                 if err is not None:
                     return err
+
+                if self.passes.is_enabled("constant-globals"):
+                    self.register_constant_global(symbol, node, start)
+
+                if node.value.type() == "FunctionLiteral" and self.passes.is_enabled("pure-calls"):
+                    self.register_pure_function(symbol, node.value)
                 
                 if symbol.scope == ScopeType.GLOBAL_SCOPE:
                     self.emit(OpCode.OpSetGlobal, symbol.index)
                 else:
                     self.emit(OpCode.OpSetLocal, symbol.index)
+
+                if node.value.type() == "FunctionLiteral" and self.passes.is_enabled("inline"):
+                    self.register_inline_candidate(symbol, node.value)
             case "ReturnStatement":
                 node: ReturnStatement = node
                 err = self.compile(node.return_value)
@@ -99,63 +279,49 @@ class Compiler:
             case "ImportStatement":
                 node: ImportStatement = node
 
-                with open(f"debug/{node.file_path}", "r") as f:
-                    src: str = f.read()
-
-                l: Lexer = Lexer(source=src)
-                p: Parser = Parser(lexer=l)
+                # Top level statements run exactly once and in order, so compiling a module once runs it once
+                if id(node) not in self.top_level:
+                    return f"`import \"{node.file_path}\"` has to be at the top level of a file"
 
-                err = self.compile(p.parse_program())
+                module, err = self.load_module(node.file_path, self.current_module())
                 if err is not None:
                     return err
+
+                if module.path in self.module_stack:
+                    cycle: list[str] = [*self.module_stack[self.module_stack.index(module.path):], module.path]
+                    return f"Import cycle: {' -> '.join(os.path.basename(m) for m in cycle)}"
+
+                if module.compiled:
+                    return None
+                module.compiled = True
+
+                self.module_stack.append(module.path)
+                err = self.compile(module.program)
+                self.module_stack.pop()
+                if err is not None:
+                    return f"In {module.path}: {err}"
             case "WhileStatement":
                 node: WhileStatement = node
 
-                start_loop_pos: int = len(self.current_instructions())
-
-                err = self.compile(node.condition)
+                err = self.compile_loop(node)
                 if err is not None:
                     return err
+            case "BreakStatement" | "ContinueStatement":
+                node: BreakStatement | ContinueStatement = node
 
-                jump_not_truthy_pos: int = self.emit(OpCode.OpJumpNotTruthy, 6969)
-
-                err = self.compile(node.body)
+                err = self.compile_loop_jump(node)
                 if err is not None:
                     return err
-                
-                offset = len(self.current_instructions()) - start_loop_pos + 1
-                self.emit(OpCode.OpLoop, offset)
-
-                after_body_pos: int = len(self.current_instructions())
-                self.change_operand(jump_not_truthy_pos, after_body_pos)
             case "ForStatement":
                 node: ForStatement = node
 
                 err = self.compile(node.initializer)
                 if err is not None:
                     return err
-                
-                start_condition_pos: int = len(self.current_instructions())
-
-                err = self.compile(node.condition)
-                if err is not None:
-                    return err
-                
-                jump_not_truthy_pos: int = self.emit(OpCode.OpJumpNotTruthy, 6969)
 
-                err = self.compile(node.increment)
-                if err is not None:
-                    return err
-                
-                err = self.compile(node.body)
+                err = self.compile_loop(node)
                 if err is not None:
                     return err
-                
-                offset = len(self.current_instructions()) - start_condition_pos + 1
-                self.emit(OpCode.OpLoop, offset)
-
-                after_body_pos: int = len(self.current_instructions())
-                self.change_operand(jump_not_truthy_pos, after_body_pos)
             case "AssignStatement":
                 node: AssignStatement = node
 
@@ -175,6 +341,10 @@ class Compiler:
             # Expressions
             case "InfixExpression":
                 node: InfixExpression = node
+                site: int | None = self.sites.get(id(node))
+
+                if is_short_circuit(node):
+                    return self.compile_short_circuit(node)
 
                 if node.operator == "<":
                     err = self.compile(node.right_node)
@@ -185,7 +355,7 @@ class Compiler:
                     if err is not None:
                         return err
                     
-                    self.emit(OpCode.OpGreaterThan)
+                    self.emit(OpCode.OpGreaterThan, site=site)
                     return None
             
                 err = self.compile(node.left_node)
@@ -198,15 +368,15 @@ class Compiler:
                 
                 match node.operator:
                     case "+":
-                        self.emit(OpCode.OpAdd)
+                        self.emit(OpCode.OpAdd, site=site)
                     case "-":
-                        self.emit(OpCode.OpSub)
+                        self.emit(OpCode.OpSub, site=site)
                     case "*":
-                        self.emit(OpCode.OpMul)
+                        self.emit(OpCode.OpMul, site=site)
                     case "/":
-                        self.emit(OpCode.OpDiv)
+                        self.emit(OpCode.OpDiv, site=site)
                     case ">":
-                        self.emit(OpCode.OpGreaterThan)
+                        self.emit(OpCode.OpGreaterThan, site=site)
                     case "==":
                         self.emit(OpCode.OpEqual)
                     case "!=":
@@ -229,36 +399,39 @@ class Compiler:
                         return f"Unknown Prefix Operator: {node.operator}"
             case "IfExpression":
                 node: IfExpression = node
-                err = self.compile(node.condition)
+                false_jumps: list[int] = []
+                err = self.compile_condition(node.condition, false_jumps, site=self.sites.get(id(node)))
                 if err is not None:
                     return err
-                
-                jump_not_truthy_pos: int = self.emit(OpCode.OpJumpNotTruthy, 6969)
 
-                err = self.compile(node.consequence)
+                self.value_branches += 1
+
+                err = self.compile_branch_value(node.consequence)
                 if err is not None:
                     return err
-                
-                if self.last_instruction_is(OpCode.OpPop):
-                    self.remove_last_pop()
 
                 jump_pos: int = self.emit(OpCode.OpJump, 420)
 
                 after_consequence_pos: int = len(self.current_instructions())
-                self.change_operand(jump_not_truthy_pos, after_consequence_pos)
+                for pos in false_jumps:
+                    self.change_operand(pos, after_consequence_pos)
 
                 if node.alternative is None:
                     self.emit(OpCode.OpNull)
                 else:
-                    err = self.compile(node.alternative)
+                    err = self.compile_branch_value(node.alternative)
                     if err is not None:
                         return err
-                    
-                    if self.last_instruction_is(OpCode.OpPop):
-                        self.remove_last_pop()
+
+                self.value_branches -= 1
                     
                 after_alternative_pos: int = len(self.current_instructions())
                 self.change_operand(jump_pos, after_alternative_pos)
+            case "MatchExpression":
+                node: MatchExpression = node
+                err = self.compile_match(node, with_value=True)
+                if err is not None:
+                    return err
             case "IndexExpression":
                 node: IndexExpression = node
                 err = self.compile(node.left)
@@ -272,6 +445,16 @@ class Compiler:
                 self.emit(OpCode.OpIndex)
             case "CallExpression":
                 node: CallExpression = node
+
+                value: Object | None = self.evaluate_pure_call(node)
+                if value is not None:
+                    self.emit_value(value)
+                    return None
+
+                candidate: InlineCandidate | None = self.inline_candidate(node)
+                if candidate is not None:
+                    return self.compile_inlined(node, candidate)
+
                 err = self.compile(node.function)
                 if err is not None:
                     return err
@@ -315,6 +498,12 @@ class Compiler:
                 self.emit(OpCode.OpConstant, self.add_constant(string))
             case "ArrayLiteral":
                 node: ArrayLiteral = node
+
+                prebuilt: ArrayObject | None = self.constant_collection(node)
+                if prebuilt is not None:
+                    self.emit(OpCode.OpCopyConstant, self.add_constant(prebuilt))
+                    return None
+
                 for element in node.elements:
                     err = self.compile(element)
                     if err is not None:
@@ -324,13 +513,12 @@ class Compiler:
             case "HashLiteral":
                 node: HashLiteral = node
 
-                keys: list[Expression] = []
-                for k in node.pairs:
-                    keys.append(k)
-                
-                keys.sort(key=lambda key: key.string())
+                prebuilt: HashObject | None = self.constant_collection(node)
+                if prebuilt is not None:
+                    self.emit(OpCode.OpCopyConstant, self.add_constant(prebuilt))
+                    return None
 
-                for ky in keys:
+                for ky in self.hash_keys(node):
                     err = self.compile(ky)
                     if err is not None:
                         return err
@@ -343,39 +531,901 @@ class Compiler:
             case "FunctionLiteral":
                 node: FunctionLiteral = node
 
-                self.enter_scope()
+                if node.body is None:
+                    return self.compile_lazy_function(node)
 
-                if not node.name == "":
-                    self.symbol_table.define_function_name(node.name)
-
-                for param in node.parameters:
-                    self.symbol_table.define(param.value)
-
-                err = self.compile(node.body)
+                compiled_fn, free_symbols, err = self.compile_function(node)
                 if err is not None:
                     return err
-                
-                if self.last_instruction_is(OpCode.OpPop):
-                    self.replace_last_pop_with_return()
-
-                if not self.last_instruction_is(OpCode.OpReturnValue):
-                    self.emit(OpCode.OpReturn)
-                
-                free_symbols = self.symbol_table.free_symbols
-                num_locals: int = self.symbol_table.num_definitions
-                ins = self.leave_scope()
 
                 for sym in free_symbols:
                     self.load_symbol(sym)
 
-                compiled_fn: CompiledFunction = CompiledFunction(instructions=ins, num_locals=num_locals, num_params=len(node.parameters))
+                # Nothing to capture: every evaluation can share one closure, built right here
+                if len(free_symbols) == 0:
+                    self.emit(OpCode.OpConstant, self.add_constant(ClosureObject(fn=compiled_fn, free=[])))
+                    return None
+
                 fn_index: int = self.add_constant(compiled_fn)
                 
                 self.emit(OpCode.OpClosure, fn_index, len(free_symbols))
 
+    # region Function Helpers
+    def compile_function(self, node: FunctionLiteral, captured: list[str] = None) -> tuple[CompiledFunction, list[Symbol], str]:
+        """ Compiles the body of `node` in a scope of its own. Returns it with the symbols its closure captures,
+        in the order the closure holds them. `captured` are the free variables of a LazyFunction, known up front """
+        self.enter_scope()
+
+        if not node.name == "":
+            self.symbol_table.define_function_name(node.name)
+
+        for param in node.parameters:
+            self.symbol_table.define(param.value)
+
+        for name in captured or []:
+            self.symbol_table.define_free(Symbol(name=name, scope=ScopeType.FREE_SCOPE, index=0))
+
+        # The value of the last statement is returned
+        err = self.compile_with_value(node.body.statements)
+        if err is not None:
+            return None, [], err
+        
+        if self.last_instruction_is(OpCode.OpPop):
+            self.replace_last_pop_with_return()
+
+        if not self.last_instruction_is(OpCode.OpReturnValue):
+            self.emit(OpCode.OpReturn)
+        
+        free_symbols = self.symbol_table.free_symbols
+        num_locals: int = self.symbol_table.num_definitions
+        ins = self.leave_scope()
+
+        cfg: ControlFlowGraph = ControlFlowGraph.from_instructions(
+            ins,
+            num_locals=num_locals,
+            num_params=len(node.parameters),
+            constants=self.constants,
+            profile=self.profile
+        )
+        self.passes.run(cfg)
+
+        compiled_fn: CompiledFunction = CompiledFunction(
+            instructions=cfg.assemble(),
+            num_locals=cfg.num_locals,
+            num_params=cfg.num_params,
+            site=self.sites.get(id(node)),
+            sites=cfg.sites,
+            name=node.name if node.name != "" else None
+        )
+        return compiled_fn, free_symbols, None
+
+    def compile_lazy_function(self, node: FunctionLiteral) -> str:
+        """ Emits a closure over a LazyFunction. Its body was only scanned, so every name in it that is a local
+        here gets captured, whether the body really refers to that variable or to one of its own """
+        own: set[str] = {p.value for p in node.parameters} | {node.name}
+
+        captured: list[Symbol] = []
+        for name in sorted(node.lazy_body.names - own):
+            symbol: Symbol | None = self.symbol_table.lookup(name)
+            if symbol is not None and symbol.scope not in (ScopeType.GLOBAL_SCOPE, ScopeType.BUILTIN_SCOPE):
+                captured.append(self.symbol_table.resolve(name)[0])
+
+        # The body may only see the globals defined before it, like it would when compiled right here
+        global_table: SymbolTable = self.symbol_table
+        while global_table.outer is not None:
+            global_table = global_table.outer
+        globs: dict[str, Symbol] = {name: global_table.store[name] for name in node.lazy_body.names if name in global_table.store}
+
+        # Any call may run the body, so the globals it assigns count as changed by calls right away
+        for name in node.lazy_body.assigned:
+            symbol: Symbol | None = self.symbol_table.lookup(name)
+            if symbol is not None and symbol.scope == ScopeType.GLOBAL_SCOPE:
+                self.globals_set_by_functions.add(symbol.index)
+
+        lazy_fn: LazyFunction = LazyFunction(
+            literal=node,
+            captured=[s.name for s in captured],
+            globals=globs,
+            compiler=self,
+            site=self.sites.get(id(node))
+        )
+
+        for sym in captured:
+            self.load_symbol(sym)
+
+        if len(captured) == 0:
+            self.emit(OpCode.OpConstant, self.add_constant(ClosureObject(fn=lazy_fn, free=[])))
+            return None
+
+        self.emit(OpCode.OpClosure, self.add_constant(lazy_fn), len(captured))
+        return None
+
+    def compile_lazy_body(self, lazy_fn: LazyFunction) -> tuple[CompiledFunction | None, str | None]:
+        """ Parses and compiles the body of a LazyFunction, called by the VM on its first call """
+        node: FunctionLiteral = lazy_fn.literal
+        name: str = node.name if node.name != "" else "<anonymous>"
+
+        p: Parser = Parser(lexer=TokenReplay(node.lazy_body.tokens), lazy=True)
+        body: BlockStatement = p.parse_block()
+        if len(p.errors) > 0:
+            return None, f"Parser errors in function {name}: {'; '.join(p.errors)}"
+        node.body = body
+
+        # Compiled on top of the finished main program, against the globals the function saw
+        saved_table: SymbolTable = self.symbol_table
+        saved_scopes: list[CompilationScope] = list(self.scopes)
+        saved_scope_index: int = self.scope_index
+
+        self.symbol_table = SymbolTable()
+        self.symbol_table.store = dict(lazy_fn.globals)
+        compiled_fn, _, err = self.compile_function(node, captured=lazy_fn.captured)
+
+        self.symbol_table = saved_table
+        self.scopes = saved_scopes
+        self.scope_index = saved_scope_index
+
+        if err is not None:
+            return None, f"Compiler error in function {name}: {err}"
+        return compiled_fn, None
+    # endregion
+
+    # region Block Helpers
+    def compile_statements(self, statements: list[Node]) -> str:
+        groups: list[list[Expression]] = []
+        if self.passes.is_enabled("cse"):
+            with self.passes.timer("cse"):
+                groups = find_common_subexpressions(
+                    statements,
+                    is_builtin=self.is_builtin,
+                    is_pure_builtin=self.is_pure_builtin,
+                    function_assigned=self.function_assigned,
+                    excluded=lambda n: id(n) in self.substitutions
+                )
+
+        for group in groups:
+            self.cached_expressions[id(group[0])] = group
+
+        for stmt in statements:
+            err = self.compile(stmt)
+            if err is not None:
+                return err
+
+        for group in groups:
+            self.cached_expressions.pop(id(group[0]), None)
+            for expr in group[1:]:
+                self.substitutions.pop(id(expr), None)
+    # endregion
+
+    # region Constant Helpers
+    def constant_collection(self, node: ArrayLiteral | HashLiteral) -> ArrayObject | HashObject | None:
+        """ The prebuilt object for a non-empty array / hash literal made only of constants.
+
+        Each evaluation still gets its own object (equality is by identity), but copying the prebuilt
+        one is a single list / dict copy instead of pushing every element and hashing every key again.
+        """
+        if not self.passes.is_enabled("constant-collections"):
+            return None
+
+        size: int = len(node.elements) if node.type() == "ArrayLiteral" else len(node.pairs)
+        if size == 0:
+            return None
+
+        with self.passes.timer("constant-collections"):
+            return self.constant_value(node)
+
+    def constant_value(self, node: Node) -> Object | None:
+        match node.type():
+            case "IntegerLiteral":
+                return IntegerObject(value=node.value)
+            case "FloatLiteral":
+                return FloatObject(value=node.value)
+            case "StringLiteral":
+                return StringObject(value=node.value)
+            case "PrefixExpression":
+                if node.operator == "-" and node.right_node.type() in ("IntegerLiteral", "FloatLiteral"):
+                    operand = self.constant_value(node.right_node)
+                    operand.value = -operand.value
+                    return operand
+            case "ArrayLiteral":
+                elements: list[Object] = []
+                for element in node.elements:
+                    value: Object | None = self.constant_value(element)
+                    if value is None:
+                        return None
+                    elements.append(value)
+
+                return ArrayObject(elements=elements)
+            case "HashLiteral":
+                pairs: dict[HashKey, HashPair] = {}
+                for key_node in self.hash_keys(node):
+                    key: Object | None = self.constant_value(key_node)
+                    value: Object | None = self.constant_value(node.pairs[key_node])
+
+                    # Unusable keys are left to fail at runtime, like they always did
+                    if key is None or value is None or not isinstance(key, Hashable):
+                        return None
+
+                    pairs[key.hash_key()] = HashPair(key=key, value=value)
+
+                return HashObject(pairs=pairs)
+
+        # Booleans have to stay the VM's singletons, everything else is computed at runtime
+        return None
+
+    def hash_keys(self, node: HashLiteral) -> list[Expression]:
+        """ The keys of a hash literal in the order they are evaluated: source order, which the parser's dict keeps """
+        return list(node.pairs)
+    # endregion
+
+    # region Conditional Helpers
+    def compile_with_value(self, statements: list[Node]) -> str:
+        """ Compiles `statements` so that the last one, if it is an expression statement, leaves its value behind """
+        tail: Node | None = statements[-1] if len(statements) > 0 and statements[-1].type() == "ExpressionStatement" else None
+        if tail is not None:
+            self.value_statements.add(id(tail))
+
+        err = self.compile_statements(statements)
+
+        if tail is not None:
+            self.value_statements.discard(id(tail))
+        return err
+
+    def compile_branch_value(self, block: BlockStatement) -> str:
+        err = self.compile_with_value(block.statements)
+        if err is not None:
+            return err
+
+        if self.last_instruction_is(OpCode.OpPop):
+            self.remove_last_pop()
+        else:
+            # The branch ends in something without a value (an assignment, a loop, ...)
+            self.emit(OpCode.OpNull)
+
+    def compile_if_statement(self, node: IfExpression) -> str:
+        """ An if whose value is thrown away: pure control flow, no OpNull for a missing else and no OpPop after it """
+        false_jumps: list[int] = []
+        err = self.compile_condition(node.condition, false_jumps, site=self.sites.get(id(node)))
+        if err is not None:
+            return err
+
+        err = self.compile(node.consequence)
+        if err is not None:
+            return err
+
+        if node.alternative is None:
+            for pos in false_jumps:
+                self.change_operand(pos, len(self.current_instructions()))
+            return None
+
+        jump_pos: int = self.emit(OpCode.OpJump, 420)
+        for pos in false_jumps:
+            self.change_operand(pos, len(self.current_instructions()))
+
+        err = self.compile(node.alternative)
+        if err is not None:
+            return err
+
+        self.change_operand(jump_pos, len(self.current_instructions()))
+
+    def compile_match(self, node: MatchExpression, with_value: bool) -> str:
+        """ A single OpMatch looks the subject up in a JumpTable constant and jumps to its arm (or the default).
+
+        Like an if, only `with_value` leaves a value behind: the arm's, or null when nothing matched and there is no default.
+        """
+        err = self.compile(node.subject)
+        if err is not None:
+            return err
+
+        # Label -> index of its arm, the first arm with a label wins
+        cases: dict[HashKey, int] = {}
+        for i, (labels, _) in enumerate(node.arms):
+            for label in labels:
+                value: Object | None = self.match_label(label)
+                if value is None:
+                    return f"Match labels have to be integer, string or boolean literals, got: {label.string()}"
+                cases.setdefault(value.hash_key(), i)
+
+        match_pos: int = self.emit(OpCode.OpMatch, self.add_constant(JumpTable(cases=cases)), 6969)
+
+        if with_value:
+            self.value_branches += 1
+
+        arm_starts: list[int] = []
+        end_jumps: list[int] = []
+        for _, body in node.arms:
+            arm_starts.append(len(self.current_instructions()))
+
+            err = self.compile_branch_value(body) if with_value else self.compile(body)
+            if err is not None:
+                return err
+
+            end_jumps.append(self.emit(OpCode.OpJump, 420))
+
+        self.current_instructions()[match_pos].targets = arm_starts
+        self.change_operand(match_pos, len(self.current_instructions()))
+
+        if node.default is not None:
+            err = self.compile_branch_value(node.default) if with_value else self.compile(node.default)
+            if err is not None:
+                return err
+        elif with_value:
+            self.emit(OpCode.OpNull)
+
+        if with_value:
+            self.value_branches -= 1
+
+        for pos in end_jumps:
+            self.change_operand(pos, len(self.current_instructions()))
+
+    def match_label(self, label: Expression) -> Object | None:
+        """ The value of a match label, None when it is not a literal that can be looked up in a JumpTable """
+        if label.type() == "BooleanLiteral":
+            return BooleanObject(value=label.value)
+
+        value: Object | None = self.constant_value(label)
+        return value if isinstance(value, (IntegerObject, StringObject)) else None
+    # endregion
+
+    # region Short Circuit Helpers
+    def compile_condition(self, node: Expression, false_jumps: list[int], site: int | None) -> str:
+        """ Compiles a branch condition straight into jumps, `&&` and `||` included: control falls through
+        when it holds, the jumps added to `false_jumps` have to be pointed at where it does not.
+
+        `site` only goes to a plain condition's jump, the jumps of a compound one each see just a part of it.
+        """
+        # Hoisted or cached as a whole, it is just a value
+        if not is_short_circuit(node) or id(node) in self.substitutions or id(node) in self.cached_expressions:
+            err = self.compile(node)
+            if err is not None:
+                return err
+
+            false_jumps.append(self.emit(OpCode.OpJumpNotTruthy, 6969, site=site))
+            return None
+
+        if node.operator == "&&":
+            err = self.compile_condition(node.left_node, false_jumps, site=None)
+            if err is not None:
+                return err
+
+            return self.compile_condition(node.right_node, false_jumps, site=None)
+
+        left_false_jumps: list[int] = []
+        err = self.compile_condition(node.left_node, left_false_jumps, site=None)
+        if err is not None:
+            return err
+
+        true_jump_pos: int = self.emit(OpCode.OpJump, 420)
+        for pos in left_false_jumps:
+            self.change_operand(pos, len(self.current_instructions()))
+
+        err = self.compile_condition(node.right_node, false_jumps, site=None)
+        if err is not None:
+            return err
+
+        self.change_operand(true_jump_pos, len(self.current_instructions()))
+
+    def compile_short_circuit(self, node: InfixExpression) -> str:
+        """ `a && b` / `a || b` as a value: `b` only runs when `a` does not decide, the result is always a boolean """
+        err = self.compile(node.left_node)
+        if err is not None:
+            return err
+
+        jump_not_truthy_pos: int = self.emit(OpCode.OpJumpNotTruthy, 6969, site=self.sites.get(id(node)))
+
+        if node.operator == "&&":
+            err = self.compile_boolean(node.right_node)
+            if err is not None:
+                return err
+
+            jump_pos: int = self.emit(OpCode.OpJump, 420)
+            self.change_operand(jump_not_truthy_pos, len(self.current_instructions()))
+            self.emit(OpCode.OpFalse)
+        else:
+            self.emit(OpCode.OpTrue)
+
+            jump_pos: int = self.emit(OpCode.OpJump, 420)
+            self.change_operand(jump_not_truthy_pos, len(self.current_instructions()))
+
+            err = self.compile_boolean(node.right_node)
+            if err is not None:
+                return err
+
+        self.change_operand(jump_pos, len(self.current_instructions()))
+
+    def compile_boolean(self, node: Expression) -> str:
+        """ Compiles `node` and turns its value into TRUE / FALSE by truthiness, unless it already is a boolean """
+        err = self.compile(node)
+        if err is not None:
+            return err
+
+        is_boolean: bool = node.type() == "BooleanLiteral" \
+            or (node.type() == "PrefixExpression" and node.operator == "!") \
+            or (node.type() == "InfixExpression" and node.operator in ("<", ">", "==", "!=", "&&", "||"))
+        if not is_boolean:
+            self.emit(OpCode.OpBang)
+            self.emit(OpCode.OpBang)
+    # endregion
+
+    # region Loop Helpers
+    def compile_loop(self, node: WhileStatement | ForStatement) -> str:
+        invariants: LoopInvariants = LoopInvariants()
+        if self.passes.is_enabled("licm"):
+            with self.passes.timer("licm"):
+                invariants = find_loop_invariants(
+                    node,
+                    is_builtin=self.is_builtin,
+                    is_pure_builtin=self.is_pure_builtin,
+                    function_assigned=self.function_assigned,
+                    excluded=lambda n: id(n) in self.substitutions
+                )
+
+        counted: CountedLoop | None = None
+        if node.type() == "ForStatement" and self.passes.is_enabled("counted-loops"):
+            with self.passes.timer("counted-loops"):
+                counted = find_counted_loop(
+                    node,
+                    is_builtin=self.is_builtin,
+                    is_pure_builtin=self.is_pure_builtin,
+                    function_assigned=self.function_assigned
+                )
+
+        hoisted: list[list[Expression]] = invariants.before_condition + invariants.before_body
+
+        err = self.hoist(invariants.before_condition)
+        if err is not None:
+            return err
+
+        # A counted loop evaluates its limit once and keeps it on the stack until the loop is done
+        counter: Symbol | None = None
+        if counted is not None:
+            counter = self.symbol_table.lookup(counted.counter)
+
+            err = self.compile(counted.limit)
+            if err is not None:
+                return err
+
+        exit_jumps: list[int] = []
+        jump_to_body_pos: int = None
+
+        # Rotate the first condition check in front of the loop, so values needed by
+        # the body are only computed once the loop is known to run at all
+        if len(invariants.before_body) > 0:
+            err = self.emit_loop_test(node, counter, exit_jumps, site=None)
+            if err is not None:
+                return err
+
+            err = self.hoist(invariants.before_body)
+            if err is not None:
+                return err
+
+            jump_to_body_pos = self.emit(OpCode.OpJump, 6969)
+
+        start_loop_pos: int = len(self.current_instructions())
+
+        err = self.emit_loop_test(node, counter, exit_jumps, site=self.sites.get(id(node)))
+        if err is not None:
+            return err
+
+        if jump_to_body_pos is not None:
+            self.change_operand(jump_to_body_pos, len(self.current_instructions()))
+
+        loop: LoopContext = LoopContext(value_branches=self.value_branches)
+        self.scopes[self.scope_index].loops.append(loop)
+
+        err = self.compile(node.body)
+        if err is not None:
+            return err
+
+        self.scopes[self.scope_index].loops.pop()
+
+        # `continue` goes on with the increment (or the OpLoop back to the condition)
+        for pos in loop.continues:
+            self.change_operand(pos, len(self.current_instructions()))
+
+        if counter is not None:
+            self.emit(OpCode.OpRangeStep, self.is_local(counter), counter.index, counted.step, start_loop_pos, site=self.sites.get(id(node)))
+        else:
+            if node.type() == "ForStatement":
+                err = self.compile(node.increment)
+                if err is not None:
+                    return err
+
+            self.emit(OpCode.OpLoop, start_loop_pos, site=self.sites.get(id(node)))
+
+        after_body_pos: int = len(self.current_instructions())
+        for pos in exit_jumps + loop.breaks:
+            self.change_operand(pos, after_body_pos)
+
+        if counter is not None:
+            # The limit
+            self.emit(OpCode.OpPop)
+
+        for group in hoisted:
+            for expr in group:
+                del self.substitutions[id(expr)]
+
+    def compile_loop_jump(self, node: BreakStatement | ContinueStatement) -> str:
+        """ Emits the OpJump of a break / continue, compile_loop points it where it goes """
+        keyword: str = "break" if node.type() == "BreakStatement" else "continue"
+
+        loops: list[LoopContext] = self.scopes[self.scope_index].loops
+        if len(loops) == 0:
+            return f"`{keyword}` outside of a loop"
+
+        # The values already on the stack would be left behind (and a counted loop would pop one of them as its limit)
+        loop: LoopContext = loops[-1]
+        if self.value_branches != loop.value_branches:
+            return f"`{keyword}` can not leave an if / match whose value is used"
+
+        pos: int = self.emit(OpCode.OpJump, 420)
+        if node.type() == "BreakStatement":
+            loop.breaks.append(pos)
+        else:
+            loop.continues.append(pos)
+
+    def emit_loop_test(self, node: WhileStatement | ForStatement, counter: Symbol | None, exit_jumps: list[int], site: int | None) -> str:
+        """ Emits the check whether to run another iteration, adding its jump out of the loop to `exit_jumps` """
+        if counter is not None:
+            exit_jumps.append(self.emit(OpCode.OpRangeTest, self.is_local(counter), counter.index, 6969, site=site))
+            return None
+
+        return self.compile_condition(node.condition, exit_jumps, site)
+
+    def hoist(self, groups: list[list[Expression]]) -> str:
+        """ Computes each group of identical invariant expressions once into a hidden variable """
+        for group in groups:
+            err = self.compile(group[0])
+            if err is not None:
+                return err
+
+            symbol: Symbol = self.define_hidden("licm")
+            self.store_symbol(symbol)
+
+            for expr in group:
+                self.substitutions[id(expr)] = symbol
+    # endregion
+
+    # region Inlining Helpers
+    def register_inline_candidate(self, symbol: Symbol, fn: FunctionLiteral):
+        if symbol.scope != ScopeType.GLOBAL_SCOPE or self.is_reassigned(symbol.name):
+            return
+
+        # Functions the profile saw called a lot are worth a bigger body
+        threshold: int = self.inline_threshold
+        if self.profile is not None and self.profile.is_hot(self.sites.get(id(fn))):
+            threshold *= HOT_INLINE_FACTOR
+
+        with self.passes.timer("inline"):
+            if not is_inlinable(fn, threshold):
+                return
+
+        # Remember what the body's names mean here, a call site may only inline if they mean the same there
+        free: dict[str, Symbol] = {}
+        for name in free_names(fn):
+            resolved: Symbol | None = self.symbol_table.lookup(name)
+            if resolved is None or resolved.scope not in (ScopeType.GLOBAL_SCOPE, ScopeType.BUILTIN_SCOPE):
+                return
+            free[name] = resolved
+
+        self.inline_candidates[symbol] = InlineCandidate(fn=fn, free=free)
+
+    def inline_candidate(self, node: CallExpression) -> InlineCandidate | None:
+        if not self.passes.is_enabled("inline") or node.function.type() != "IdentifierLiteral":
+            return None
+
+        symbol: Symbol | None = self.symbol_table.lookup(node.function.value)
+        candidate: InlineCandidate | None = self.inline_candidates.get(symbol)
+        if candidate is None or len(candidate.fn.parameters) != len(node.arguments):
+            return None
+
+        for name, resolved in candidate.free.items():
+            if self.symbol_table.lookup(name) != resolved:
+                return None
+
+        return candidate
+
+    def compile_inlined(self, node: CallExpression, candidate: InlineCandidate) -> str:
+        """ Compiles the body of `candidate` in place of the call, parameters and locals become hidden variables """
+        copies: dict = {}
+        body: BlockStatement = deepcopy(candidate.fn.body, copies)
+
+        # The copy profiles (and is specialized) as the original function body
+        copied_sites: list[int] = []
+        for original in walk(candidate.fn.body, enter_functions=True):
+            duplicate: Node | None = copies.get(id(original))
+            if duplicate is not None and id(original) in self.sites:
+                self.sites[id(duplicate)] = self.sites[id(original)]
+                copied_sites.append(id(duplicate))
+
+        err = self.compile_inlined_body(node, candidate, body)
+
+        for node_id in copied_sites:
+            del self.sites[node_id]
+
+        return err
+
+    def compile_inlined_body(self, node: CallExpression, candidate: InlineCandidate, body: BlockStatement) -> str:
+        assigned: set[str] = assigned_names(body)
+
+        renames: dict[str, str] = {}
+        literals: dict[str, Expression] = {}
+
+        for param, arg in zip(candidate.fn.parameters, node.arguments):
+            # Constant arguments are substituted directly, everything else is evaluated once in call order
+            if arg.type() in LITERAL_TYPES and param.value not in assigned:
+                literals[param.value] = arg
+                continue
+
+            err = self.compile(arg)
+            if err is not None:
+                return err
+
+            symbol: Symbol = self.define_hidden("inline")
+            self.store_symbol(symbol)
+            renames[param.value] = symbol.name
+
+        for name in assigned:
+            if name not in renames and name not in candidate.free:
+                self.hidden_count += 1
+                renames[name] = f"$inline{self.hidden_count}"
+
+        rename_identifiers(body, renames, literals)
+
+        statements = body.statements
+        if len(statements) == 0:
+            self.emit(OpCode.OpNull)
+            return None
+
+        for stmt in statements[:-1]:
+            err = self.compile(stmt)
+            if err is not None:
+                return err
+
+        last = statements[-1]
+        match last.type():
+            case "ExpressionStatement":
+                return self.compile(last.expr)
+            case "ReturnStatement":
+                return self.compile(last.return_value)
+            case _:
+                err = self.compile(last)
+                if err is not None:
+                    return err
+
+                self.emit(OpCode.OpNull)
+    # endregion
+
+    # region Compile-Time Evaluation Helpers
+    def register_pure_function(self, symbol: Symbol, fn: FunctionLiteral):
+        """ Called right after `fn` was compiled, before it is stored into `symbol` """
+        if symbol.scope != ScopeType.GLOBAL_SCOPE or self.is_reassigned(symbol.name):
+            return
+
+        # Only functions without free variables compile to a prebuilt closure the evaluation can call
+        if not self.last_instruction_is(OpCode.OpConstant):
+            return
+        closure: int = self.current_instructions()[-1].operands[0]
+        if not isinstance(self.constants[closure], ClosureObject):
+            return
+
+        needed: dict[int, int] = {}
+        def is_pure_name(name: str) -> bool:
+            if self.is_pure_builtin(name):
+                return True
+
+            resolved: Symbol | None = self.symbol_table.lookup(name)
+            if resolved in self.constant_globals and self.constant_global_value(resolved) is not None:
+                return True
+
+            callee: PureFunction | None = self.pure_functions.get(resolved)
+            if callee is None:
+                return False
+
+            needed[resolved.index] = callee.closure
+            needed.update(callee.globals)
+            return True
+
+        with self.passes.timer("pure-calls"):
+            if is_pure_function(fn, is_pure_name):
+                self.pure_functions[symbol] = PureFunction(closure=closure, globals=needed)
+
+    def evaluate_pure_call(self, node: CallExpression) -> Object | None:
+        """ The result of a call to a pure function with constant arguments, computed in a separate VM.
+
+        None when it cannot be known here: a runtime error, a result that is not plain data, or a call
+        that runs out of EVALUATION_BUDGET or computes a value past EVALUATION_SIZE_LIMIT. The call is then
+        compiled as usual and behaves as it always did.
+        """
+        if not self.passes.is_enabled("pure-calls") or node.function.type() != "IdentifierLiteral":
+            return None
+
+        pure: PureFunction | None = self.pure_functions.get(self.symbol_table.lookup(node.function.value))
+        if pure is None or self.constants[pure.closure].fn.num_parameters != len(node.arguments):
+            return None
+
+        # The VM imports the Compiler
+        from exec.VM import VM, TRUE_OBJ, FALSE_OBJ
+
+        args: list[Object] = []
+        for arg in node.arguments:
+            value: Object | None = self.constant_value(arg)
+            if arg.type() == "BooleanLiteral":
+                value = TRUE_OBJ if arg.value else FALSE_OBJ
+            elif arg.type() == "IdentifierLiteral":
+                value = self.constant_global_value(self.symbol_table.lookup(arg.value))
+            if value is None:
+                return None
+            args.append(value)
+
+        with self.passes.timer("pure-calls"):
+            instructions: Instructions = make(OpCode.OpConstant, pure.closure)
+            for i in range(len(args)):
+                instructions += make(OpCode.OpConstant, len(self.constants) + i)
+            instructions += make(OpCode.OpCall, len(args))
+            instructions += make(OpCode.OpPop)
+
+            globs: list[Object] = [None] * (max(pure.globals, default=-1) + 1)
+            for index, closure in pure.globals.items():
+                globs[index] = self.constants[closure]
+
+            vm = VM(Bytecode(instructions=instructions, constants=[*self.constants, *args]), globs=globs, budget=EVALUATION_BUDGET, max_size=EVALUATION_SIZE_LIMIT)
+            try:
+                err = vm.run()
+            except Exception:
+                # Whatever goes wrong (e.g. a division by zero) has to go wrong at runtime, if that call ever runs
+                return None
+
+        # The size first, is_plain_value looks at every element as often as the result holds it
+        result: Object = vm.stack.last_popped_elem
+        if err is not None or self.constant_size(result, EVALUATION_SIZE_LIMIT) > EVALUATION_SIZE_LIMIT or not self.is_plain_value(result):
+            return None
+        return result
+
+    def constant_size(self, obj: Object, limit: int) -> int:
+        """ How big `obj` is as a constant: one per element plus the value_size of each, counted until past `limit`.
+        An element a collection holds many times counts as often, every copy of the constant repeats it """
+        # The VM imports the Compiler
+        from exec.VM import value_size
+
+        size: int = 1 + value_size(obj)
+        match obj.type():
+            case "ARRAY":
+                children: list[Object] = obj.elements
+            case "HASH":
+                children: list[Object] = [o for p in obj.pairs.values() for o in p]
+            case _:
+                children: list[Object] = []
+
+        for child in children:
+            if size > limit:
+                break
+            size += self.constant_size(child, limit - size)
+        return size
+
+    def is_plain_value(self, obj: Object) -> bool:
+        """ Values `emit_value` can load: numbers, strings, booleans, null and collections of those """
+        match obj.type():
+            case "INTEGER" | "FLOAT" | "STRING" | "BOOL" | "NULL":
+                return True
+            case "ARRAY":
+                return all(self.is_plain_value(el) for el in obj.elements)
+            case "HASH":
+                return all(self.is_plain_value(p.value) for p in obj.pairs.values())
+        return False
+
+    def emit_value(self, obj: Object):
+        match obj.type():
+            case "BOOL":
+                self.emit(OpCode.OpTrue if obj.value else OpCode.OpFalse)
+            case "NULL":
+                self.emit(OpCode.OpNull)
+            case "ARRAY" | "HASH":
+                # Every evaluation of the call built a new collection
+                self.emit(OpCode.OpCopyConstant, self.add_constant(obj))
+            case _:
+                self.emit(OpCode.OpConstant, self.add_constant(obj))
+    # endregion
+
+    # region Constant Global Helpers
+    def register_constant_global(self, symbol: Symbol, node: LetStatement, start: int):
+        """ Called right after the value of `node` was compiled from instruction `start` on, before it is stored into `symbol` """
+        if symbol.scope != ScopeType.GLOBAL_SCOPE or self.is_reassigned(symbol.name) or id(node) not in self.top_level:
+            return
+
+        # A literal, a function without free variables, a folded call or another constant global
+        emitted: list[IRInstruction] = self.current_instructions()[start:]
+        if len(emitted) != 1 or emitted[0].opcode not in (OpCode.OpConstant, OpCode.OpTrue, OpCode.OpFalse, OpCode.OpNull):
+            return
+
+        with self.passes.timer("constant-globals"):
+            self.constant_globals[symbol] = IRInstruction(emitted[0].opcode, list(emitted[0].operands))
+
+    def constant_global_value(self, symbol: Symbol | None) -> Object | None:
+        """ The plain value (no function) a constant global holds, as the VM would load it """
+        load: IRInstruction | None = self.constant_globals.get(symbol)
+        if load is None:
+            return None
+
+        # The VM imports the Compiler
+        from exec.VM import TRUE_OBJ, FALSE_OBJ, NULL_OBJ
+
+        match load.opcode:
+            case OpCode.OpTrue:
+                return TRUE_OBJ
+            case OpCode.OpFalse:
+                return FALSE_OBJ
+            case OpCode.OpNull:
+                return NULL_OBJ
+            case OpCode.OpConstant:
+                value: Object = self.constants[load.operands[0]]
+                return None if isinstance(value, ClosureObject) else value
+
+    def imported_programs(self, program: Program, path: str | None) -> list[Program]:
+        """ Every file `program` (read from `path`) imports, directly or through other imports, each one once.
+        Files that fail to load are left out, compiling their import reports why """
+        programs: list[Program] = []
+        seen: set[str] = set() if path is None else {path}
+
+        def visit(program: Program, path: str | None):
+            for n in walk(program, enter_functions=True):
+                if n.type() != "ImportStatement":
+                    continue
+
+                module, err = self.load_module(n.file_path, path)
+                if err is not None or module.path in seen:
+                    continue
+
+                seen.add(module.path)
+                programs.append(module.program)
+                visit(module.program, module.path)
+
+        visit(program, path)
+        return programs
+
+    def current_module(self) -> str | None:
+        return self.module_stack[-1] if len(self.module_stack) > 0 else None
+
+    def load_module(self, file_path: str, importer: str | None) -> tuple[Module | None, str | None]:
+        """ The module `file_path` refers to in a file at `importer`, read and parsed the first time it is asked for """
+        path, directories = resolve_import(file_path, importer, self.search_path)
+        if path is None:
+            return None, f"Could not find \"{file_path}\" to import, looked in: {', '.join(directories)}"
+        self.import_paths[(file_path, importer)] = path
+
+        module: Module | None = self.modules.get(path)
+        if module is not None:
+            return module, None
+
+        try:
+            with open(path, "r") as f:
+                src: str = f.read()
+        except OSError as e:
+            return None, f"Could not read {path}: {e}"
+
+        l: Lexer = Lexer(source=src)
+        p: Parser = Parser(lexer=l, lazy=self.lazy)
+
+        program: Program = p.parse_program()
+        if len(p.errors) > 0:
+            return None, f"Parser errors in {path}: {'; '.join(p.errors)}"
+
+        module = Module(path=path, program=program)
+        self.modules[path] = module
+        self.import_sources[path] = src
+        return module, None
+    # endregion
+
     # region Compiler Helpers
-    def emit(self, op: OpCode, *operands: int) -> int:
-        ins: Instructions = make(op, *operands)
+    def emit(self, op: OpCode, *operands: int, site: int = None) -> int:
+        """ Appends an instruction, for jumps the operand is the index of the instruction to jump to """
+        ins: IRInstruction = IRInstruction(op, list(operands), site=site)
+        if ins.is_jump():
+            ins.operands = list(operands[:-1])
+            ins.target = operands[-1]
+
+        if op == OpCode.OpSetGlobal and self.scope_index > 0:
+            self.globals_set_by_functions.add(operands[0])
+
         pos: int = self.add_instruction(ins)
 
         self.set_last_instruction(op, pos)
@@ -389,11 +1439,9 @@ class Compiler:
         self.scopes[self.scope_index].previous_instruction = previous
         self.scopes[self.scope_index].last_instruction = last
     
-    def add_instruction(self, ins: Instructions) -> int:
+    def add_instruction(self, ins: IRInstruction) -> int:
         pos_new_ins: int = len(self.current_instructions())
-        updated_ins = self.current_instructions() + ins
-
-        self.scopes[self.scope_index].instructions = updated_ins
+        self.current_instructions().append(ins)
         return pos_new_ins
 
     def add_constant(self, obj: Object) -> int:
@@ -408,7 +1456,7 @@ class Compiler:
     
     def replace_last_pop_with_return(self):
         last_pos = self.scopes[self.scope_index].last_instruction.position
-        self.replace_instruction(last_pos, make(OpCode.OpReturnValue))
+        self.replace_instruction(last_pos, IRInstruction(OpCode.OpReturnValue))
 
         self.scopes[self.scope_index].last_instruction.opcode = OpCode.OpReturnValue
 
@@ -422,22 +1470,30 @@ class Compiler:
         self.scopes[self.scope_index].instructions = new
         self.scopes[self.scope_index].last_instruction = previous
 
-    def replace_instruction(self, pos: int, new_instruction: Instructions):
-        for i in range(0, len(new_instruction), 1):
-            self.scopes[self.scope_index].instructions[pos + i] = new_instruction[i]
+    def replace_instruction(self, pos: int, new_instruction: IRInstruction):
+        self.scopes[self.scope_index].instructions[pos] = new_instruction
     
     def change_operand(self, op_pos: int, operand: int):
-        op: OpCode = OpCode(self.current_instructions()[op_pos])
-        new_instruction: Instructions = make(op, operand)
-
-        self.replace_instruction(op_pos, new_instruction)
+        ins: IRInstruction = self.current_instructions()[op_pos]
+        if ins.is_jump():
+            ins.target = operand
+        else:
+            ins.operands = [operand]
+
+    def reset_main(self):
+        """ Drops the main code compiled so far, the globals and constants it defined stay """
+        self.scopes[0] = CompilationScope(
+            instructions=[],
+            last_instruction=EmittedInstruction(),
+            previous_instruction=EmittedInstruction()
+        )
 
-    def current_instructions(self) -> Instructions:
+    def current_instructions(self) -> list[IRInstruction]:
         return self.scopes[self.scope_index].instructions
     
     def enter_scope(self):
         scope: CompilationScope = CompilationScope(
-            instructions=Instructions(),
+            instructions=[],
             last_instruction=EmittedInstruction(),
             previous_instruction=EmittedInstruction()
         )
@@ -457,8 +1513,42 @@ class Compiler:
 
         return ins
     
-    def load_symbol(self, s: Symbol):
+    def number_sites(self, program: Program):
+        """ Hands out profiling sites to the nodes a profile records something for, continuing across imports """
+        for n in walk(program, enter_functions=True):
+            if n.type() in ("InfixExpression", "IfExpression", "WhileStatement", "ForStatement", "FunctionLiteral"):
+                self.sites[id(n)] = self.site_count
+                self.site_count += 1
+
+    def is_reassigned(self, name: str) -> bool:
+        return self.interactive or name in self.reassigned
+
+    def define_hidden(self, prefix: str) -> Symbol:
+        """ Defines a compiler generated variable, `$` keeps it from clashing with any identifier """
+        self.hidden_count += 1
+        return self.symbol_table.define(f"${prefix}{self.hidden_count}")
+
+    def is_local(self, s: Symbol) -> int:
+        return 1 if s.scope == ScopeType.LOCAL_SCOPE else 0
+
+    def is_builtin(self, name: str) -> bool:
+        symbol: Symbol | None = self.symbol_table.lookup(name)
+        return symbol is not None and symbol.scope == ScopeType.BUILTIN_SCOPE
+
+    def is_pure_builtin(self, name: str) -> bool:
+        return name in PURE_BUILTINS and self.is_builtin(name)
+
+    def store_symbol(self, s: Symbol):
         if s.scope == ScopeType.GLOBAL_SCOPE:
+            self.emit(OpCode.OpSetGlobal, s.index)
+        else:
+            self.emit(OpCode.OpSetLocal, s.index)
+
+    def load_symbol(self, s: Symbol):
+        constant: IRInstruction | None = self.constant_globals.get(s)
+        if constant is not None:
+            self.emit(constant.opcode, *constant.operands)
+        elif s.scope == ScopeType.GLOBAL_SCOPE:
             self.emit(OpCode.OpGetGlobal, s.index)
         elif s.scope == ScopeType.LOCAL_SCOPE:
             self.emit(OpCode.OpGetLocal, s.index)
@@ -61,11 +61,15 @@ class Lexer:
             case ';':
                 tok = self.__new_token(TokenType.SEMICOLON, self.current_char)
             case '=':
-                # Handle '=='
+                # Handle '==' and '=>'
                 if self.__peek_char() == '=':
                     ch = self.current_char
                     self.__read_char()
                     tok = self.__new_token(TokenType.EQ, ch + self.current_char)
+                elif self.__peek_char() == '>':
+                    ch = self.current_char
+                    self.__read_char()
+                    tok = self.__new_token(TokenType.ARROW, ch + self.current_char)
                 else:
                     tok = self.__new_token(TokenType.ASSIGN, self.current_char)
             case '!':
@@ -92,6 +96,22 @@ class Lexer:
                     tok = self.__new_token(TokenType.GT_EQ, ch + self.current_char)
                 else:
                     tok = self.__new_token(TokenType.GT, self.current_char)
+            case '&':
+                # Handle '&&'
+                if self.__peek_char() == '&':
+                    ch = self.current_char
+                    self.__read_char()
+                    tok = self.__new_token(TokenType.AND, ch + self.current_char)
+                else:
+                    tok = self.__new_token(TokenType.ILLEGAL, self.current_char)
+            case '|':
+                # Handle '||'
+                if self.__peek_char() == '|':
+                    ch = self.current_char
+                    self.__read_char()
+                    tok = self.__new_token(TokenType.OR, ch + self.current_char)
+                else:
+                    tok = self.__new_token(TokenType.ILLEGAL, self.current_char)
             case '{':
                 tok = self.__new_token(TokenType.LBRACE, self.current_char)
             case '}':
@@ -181,3 +201,18 @@ class Lexer:
         
         return self.source[position:self.position]
     # endregion
+
+
+class TokenReplay:
+    """ Hands out tokens recorded earlier in place of a Lexer, used to parse lazy function bodies """
+    def __init__(self, tokens: list[Token]) -> None:
+        self.tokens: list[Token] = tokens
+        self.position: int = 0
+
+    def next_token(self) -> Token:
+        if self.position >= len(self.tokens):
+            return Token(TokenType.EOF, "")
+
+        tok: Token = self.tokens[self.position]
+        self.position += 1
+        return tok
@@ -0,0 +1,145 @@
+from exec.Compiler import Bytecode
+from models.Code import Instructions, OpCode, SHORT_OPCODES, walk_instructions
+from models.IR import IRInstruction, ControlFlowGraph
+from models.Object import Object, CompiledFunction, ClosureObject, JumpTable
+from dataclasses import dataclass, field
+from copy import copy
+
+# Short form -> the usual one, `assemble` picks the short form again where it fits
+LONG_OPCODES: dict[OpCode, OpCode] = {short: long for long, short in SHORT_OPCODES.items()}
+
+# Instructions whose first operand is a constant pool index
+CONSTANT_OPCODES: set[OpCode] = {OpCode.OpConstant, OpCode.OpCopyConstant, OpCode.OpClosure, OpCode.OpMatch}
+
+
+@dataclass
+class CompiledModule:
+    """ One file compiled on its own, see exec.Builder """
+    path: str
+    instructions: Instructions = None
+    constants: list[Object] = field(default_factory=list)
+    # The globals of other modules it can see, as (name, path of the module defining it). They take up the
+    # first global slots, the module's own globals follow up to `num_globals`
+    imported: list[tuple[str, str]] = field(default_factory=list)
+    num_globals: int = 0
+    # Name -> global index of what the module itself defines
+    exports: dict[str, int] = field(default_factory=dict)
+    # Time spent in each optimization pass and how often it ran, see PassManager
+    timings: dict[str, float] = field(default_factory=dict)
+    runs: dict[str, int] = field(default_factory=dict)
+    error: str = None
+
+
+def decode(instructions: Instructions, constants: list[Object]) -> list[IRInstruction]:
+    """ Turns assembled instructions back into IR, with jump targets as instruction indices like the Compiler emits them.
+    A jump to the very end targets the index one past the last instruction """
+    decoded: list[tuple[IRInstruction, int, list[int] | None]] = []
+    index_at: dict[int, int] = {}
+    for offset, defin, operands, _, _ in walk_instructions(instructions):
+        opcode: OpCode = OpCode[defin.name]
+        opcode = LONG_OPCODES.get(opcode, opcode)
+        ins: IRInstruction = IRInstruction(opcode, list(operands))
+
+        target: int | None = None
+        cases: list[int] | None = None
+        if opcode == OpCode.OpLoop:
+            # Relative to the OpLoop itself, see ControlFlowGraph.encode
+            target = offset - operands[0] + 1
+            ins.operands = []
+        elif ins.is_jump():
+            target = operands[-1]
+            ins.operands = list(operands[:-1])
+
+        if opcode == OpCode.OpMatch:
+            # An arm whose labels all repeat earlier ones is never jumped to, it gets the default target
+            table: JumpTable = constants[operands[0]]
+            cases = [operands[-1]] * (max(table.cases.values(), default=-1) + 1)
+            for key, case in table.cases.items():
+                cases[case] = table.targets[key]
+
+        index_at[offset] = len(decoded)
+        decoded.append((ins, target, cases))
+
+    index_at[len(instructions)] = len(decoded)
+    for ins, target, cases in decoded:
+        if target is not None:
+            ins.target = index_at[target]
+        if cases is not None:
+            ins.targets = [index_at[c] for c in cases]
+
+    return [ins for ins, _, _ in decoded]
+
+
+class Linker:
+    """ Joins separately compiled modules into one Bytecode.
+
+    Their constant pools are concatenated, so every constant index moves by the size of the pools before it.
+    Every module numbers its globals from 0, the linker gives each module its own range of the program's
+    globals and points the slots of imported globals at the module that defines them. The main code of the
+    modules runs one after the other, in the order given. Profiling sites are dropped, each module numbered
+    its own from 0.
+    """
+    def __init__(self, compact: bool = False) -> None:
+        # Whether the modules were compiled with the compact encoding, see the compact-encoding pass
+        self.compact: bool = compact
+
+        self.constants: list[Object] = []
+        self.exports: dict[str, dict[str, int]] = {}
+        self.num_globals: int = 0
+
+    def link(self, modules: list[CompiledModule]) -> Bytecode:
+        main: list[IRInstruction] = []
+        for module in modules:
+            # Jumps to the end of a module land on the start of the next one
+            base: int = len(main)
+            for ins in self.relocate(module):
+                if ins.is_jump():
+                    ins.target += base
+                    ins.targets = None if ins.targets is None else [t + base for t in ins.targets]
+                main.append(ins)
+
+        cfg: ControlFlowGraph = ControlFlowGraph.from_instructions(main, is_main=True, constants=self.constants)
+        cfg.compact = self.compact
+        return Bytecode(instructions=cfg.assemble(), constants=self.constants)
+
+    def relocate(self, module: CompiledModule) -> list[IRInstruction]:
+        """ Adds the constants of `module` to the program, returns its main code with every index remapped """
+        # The module is left untouched, so it can be linked again (see Builder): whatever relocating
+        # changes is copied, the rest is shared
+        constant_offset: int = len(self.constants)
+        for constant in module.constants:
+            if isinstance(constant, ClosureObject):
+                constant = ClosureObject(fn=copy(constant.fn), free=constant.free)
+            elif isinstance(constant, (CompiledFunction, JumpTable)):
+                constant = copy(constant)
+            self.constants.append(constant)
+
+        globals_map: list[int] = [self.exports[path][name] for name, path in module.imported]
+        for _ in range(len(module.imported), module.num_globals):
+            globals_map.append(self.num_globals)
+            self.num_globals += 1
+        self.exports[module.path] = {name: globals_map[index] for name, index in module.exports.items()}
+
+        for original, constant in zip(module.constants, self.constants[constant_offset:]):
+            fn = constant.fn if isinstance(constant, ClosureObject) else constant
+            if isinstance(fn, CompiledFunction):
+                original_fn: CompiledFunction = original.fn if isinstance(original, ClosureObject) else original
+                ir: list[IRInstruction] = self.remap(decode(original_fn.instructions, module.constants), constant_offset, globals_map)
+
+                cfg: ControlFlowGraph = ControlFlowGraph.from_instructions(ir, constants=self.constants)
+                cfg.compact = self.compact
+                fn.instructions = cfg.assemble()
+                fn.site = None
+                fn.sites = {}
+
+        return self.remap(decode(module.instructions, module.constants), constant_offset, globals_map)
+
+    def remap(self, instructions: list[IRInstruction], constant_offset: int, globals_map: list[int]) -> list[IRInstruction]:
+        for ins in instructions:
+            if ins.opcode in CONSTANT_OPCODES:
+                ins.operands[0] += constant_offset
+            elif ins.opcode in (OpCode.OpGetGlobal, OpCode.OpSetGlobal):
+                ins.operands[0] = globals_map[ins.operands[0]]
+            elif ins.opcode in (OpCode.OpRangeTest, OpCode.OpRangeStep) and ins.operands[0] == 0:
+                ins.operands[1] = globals_map[ins.operands[1]]
+        return instructions
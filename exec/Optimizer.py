@@ -0,0 +1,604 @@
+from models.AST import Node, Expression, Program, InfixExpression, PrefixExpression, IndexExpression, CallExpression, FunctionLiteral
+from models.AST import ForStatement
+from typing import Callable, NamedTuple
+
+# Builtins that neither read nor change any state besides their arguments
+PURE_BUILTINS: set[str] = {"len"}
+
+# Operators the VM evaluates without side effects
+PURE_INFIX_OPERATORS: set[str] = {"+", "-", "*", "/", "<", ">", "==", "!=", "&&", "||"}
+
+# Operators whose right operand only runs when the left one does not decide the result
+SHORT_CIRCUIT_OPERATORS: set[str] = {"&&", "||"}
+PURE_PREFIX_OPERATORS: set[str] = {"!", "-"}
+
+LITERAL_TYPES: set[str] = {"IntegerLiteral", "FloatLiteral", "StringLiteral", "BooleanLiteral"}
+
+
+# region AST Walking Helpers
+def child_nodes(node: Node) -> list[Node]:
+    """ Returns the direct children of `node` in the order the Compiler evaluates them """
+    children: list[Node] = []
+
+    match node.type():
+        case "Program" | "BlockStatement":
+            children = list(node.statements)
+        case "ExpressionStatement":
+            children = [node.expr]
+        case "LetStatement":
+            children = [node.value]
+        case "ReturnStatement":
+            children = [node.return_value]
+        case "AssignStatement":
+            children = [node.right_value]
+        case "WhileStatement":
+            children = [node.condition, node.body]
+        case "ForStatement":
+            children = [node.initializer, node.condition, node.body, node.increment]
+        case "InfixExpression":
+            # `a < b` is compiled as `b > a`
+            if node.operator == "<":
+                children = [node.right_node, node.left_node]
+            else:
+                children = [node.left_node, node.right_node]
+        case "PrefixExpression":
+            children = [node.right_node]
+        case "IfExpression":
+            children = [node.condition, node.consequence, node.alternative]
+        case "MatchExpression":
+            children = [node.subject]
+            for labels, body in node.arms:
+                children += [*labels, body]
+            children.append(node.default)
+        case "IndexExpression":
+            children = [node.left, node.index]
+        case "CallExpression":
+            children = [node.function, *node.arguments]
+        case "ArrayLiteral":
+            children = list(node.elements)
+        case "HashLiteral":
+            for key, value in node.pairs.items():
+                children += [key, value]
+        case "FunctionLiteral":
+            children = [node.body]
+
+    return [c for c in children if c is not None]
+
+def is_short_circuit(node: Node) -> bool:
+    return node.type() == "InfixExpression" and node.operator in SHORT_CIRCUIT_OPERATORS
+
+def unconditional_children(node: Node) -> list[Node]:
+    """ The children of `node` that run whenever `node` does: all of them, except the right operand of `&&` / `||` """
+    if is_short_circuit(node):
+        return [node.left_node]
+    return child_nodes(node)
+
+def walk(node: Node, enter_functions: bool = False):
+    """ Yields `node` and all of its descendants, optionally skipping the bodies of nested function literals """
+    yield node
+
+    if node.type() == "FunctionLiteral" and not enter_functions:
+        return
+
+    for child in child_nodes(node):
+        yield from walk(child, enter_functions)
+# endregion
+
+# region Side Effect Analysis
+def assigned_names(node: Node) -> set[str]:
+    """ Names bound by `let` or re-assigned with `=` inside `node` (nested functions excluded) """
+    names: set[str] = set()
+
+    for n in walk(node):
+        match n.type():
+            case "LetStatement":
+                names.add(n.name.value)
+            case "AssignStatement":
+                names.add(n.ident.value)
+
+    return names
+
+def function_assigned_names(program: Program) -> set[str]:
+    """ Names that some function body assigns without owning them, i.e. names a call can change behind the caller's back """
+    names: set[str] = set()
+
+    for n in walk(program, enter_functions=True):
+        if n.type() != "FunctionLiteral":
+            continue
+
+        # An unparsed body only tells what it assigns, not what it owns
+        if n.body is None:
+            names |= n.lazy_body.assigned if n.lazy_body is not None else set()
+            continue
+
+        own: set[str] = {p.value for p in n.parameters} if n.parameters is not None else set()
+        for inner in walk(n.body):
+            if inner.type() == "LetStatement":
+                own.add(inner.name.value)
+
+        for inner in walk(n.body):
+            if inner.type() == "AssignStatement" and inner.ident.value not in own:
+                names.add(inner.ident.value)
+
+    return names
+
+def identifier_names(node: Node) -> set[str]:
+    return {n.value for n in walk(node) if n.type() == "IdentifierLiteral"}
+
+def may_jump_out(node: Node) -> bool:
+    """ Whether `node` contains a return, break or continue, after which the rest of a loop body does not run """
+    return any(n.type() in ("ReturnStatement", "BreakStatement", "ContinueStatement") for n in walk(node))
+
+def calls_user_function(node: Node, is_builtin: Callable[[str], bool]) -> bool:
+    """ Whether `node` calls anything that is not a builtin (and so might assign globals) """
+    for n in walk(node):
+        if n.type() != "CallExpression":
+            continue
+
+        if n.function.type() != "IdentifierLiteral" or not is_builtin(n.function.value):
+            return True
+
+    return False
+
+def has_side_effect(node: Node, is_pure_builtin: Callable[[str], bool]) -> bool:
+    """ Whether `node` calls anything but a pure builtin (e.g. `print`), whose effect must not be skipped by an error """
+    return any(
+        n.type() == "CallExpression" and (n.function.type() != "IdentifierLiteral" or not is_pure_builtin(n.function.value))
+        for n in walk(node)
+    )
+# endregion
+
+# region Purity Analysis
+def is_invariant(expr: Expression, variant: set[str], is_pure_builtin: Callable[[str], bool]) -> bool:
+    """ Whether `expr` is side effect free and only reads names outside of `variant` """
+    match expr.type():
+        case "IntegerLiteral" | "FloatLiteral" | "StringLiteral" | "BooleanLiteral":
+            return True
+        case "IdentifierLiteral":
+            return expr.value not in variant
+        case "PrefixExpression":
+            expr: PrefixExpression = expr
+            return expr.operator in PURE_PREFIX_OPERATORS and is_invariant(expr.right_node, variant, is_pure_builtin)
+        case "InfixExpression":
+            expr: InfixExpression = expr
+            return expr.operator in PURE_INFIX_OPERATORS \
+                and is_invariant(expr.left_node, variant, is_pure_builtin) \
+                and is_invariant(expr.right_node, variant, is_pure_builtin)
+        case "IndexExpression":
+            expr: IndexExpression = expr
+            return is_invariant(expr.left, variant, is_pure_builtin) and is_invariant(expr.index, variant, is_pure_builtin)
+        case "CallExpression":
+            expr: CallExpression = expr
+            if expr.function.type() != "IdentifierLiteral" or not is_pure_builtin(expr.function.value):
+                return False
+
+            return all(is_invariant(arg, variant, is_pure_builtin) for arg in expr.arguments)
+        case _:
+            return False
+
+def is_number(expr: Expression) -> bool:
+    """ Whether `expr`, if it evaluates at all, evaluates to an integer or float """
+    match expr.type():
+        case "IntegerLiteral" | "FloatLiteral":
+            return True
+        case "PrefixExpression":
+            return expr.operator == "-"
+        case "InfixExpression":
+            if expr.operator == "+":
+                return is_number(expr.left_node) or is_number(expr.right_node)
+            return expr.operator in ("-", "*", "/")
+        case _:
+            return False
+
+def builds_object(expr: Expression) -> bool:
+    """ Whether `expr` may create a new object on every evaluation, which `==` tells apart from an equal one
+    (the VM compares everything but numbers by identity). Of the invariant expressions, only `+` of two strings does """
+    return expr.type() == "InfixExpression" and expr.operator == "+" and not is_number(expr)
+
+def is_trivial(expr: Expression) -> bool:
+    """ Literals and plain identifiers are already a single load, there is nothing to gain by caching them """
+    return expr.type() in LITERAL_TYPES or expr.type() == "IdentifierLiteral"
+
+def expression_key(expr: Expression) -> tuple:
+    """ Equal for two invariant expressions (see is_invariant) exactly when they compute the same value. Unlike
+    `string()`, which prints `"1"` like `1` and `"a"` like `a` """
+    match expr.type():
+        case "IntegerLiteral" | "FloatLiteral" | "StringLiteral" | "BooleanLiteral" | "IdentifierLiteral":
+            return (expr.type(), expr.value)
+        case "PrefixExpression" | "InfixExpression":
+            return (expr.type(), expr.operator, *(expression_key(c) for c in child_nodes(expr)))
+        case "IndexExpression" | "CallExpression":
+            return (expr.type(), *(expression_key(c) for c in child_nodes(expr)))
+        case _:
+            # Never equal to another one
+            return (expr.type(), id(expr))
+# endregion
+
+# region Loop Invariant Code Motion
+class LoopInvariants:
+    def __init__(self) -> None:
+        # Hoisted in front of the first condition check
+        self.before_condition: list[list[Expression]] = []
+
+        # Hoisted once the loop is known to run at least one iteration
+        self.before_body: list[list[Expression]] = []
+
+    def is_empty(self) -> bool:
+        return len(self.before_condition) == 0 and len(self.before_body) == 0
+
+
+def find_loop_invariants(loop: Node, is_builtin: Callable[[str], bool], is_pure_builtin: Callable[[str], bool], function_assigned: set[str], excluded: Callable[[Node], bool]) -> LoopInvariants:
+    """ Collects the maximal pure, loop-invariant expressions of a While- or ForStatement, grouped by expression_key.
+
+    Only expressions that are evaluated on every iteration are considered: the condition, the top-level
+    statements of the body up to the first one that may return, break or continue, and the increment of a for loop.
+    Of those, only the ones evaluated before the first side effect: a hoisted expression that fails (e.g. `n[0]`
+    on an integer) must not lose the output printed before it.
+    """
+    variant: set[str] = assigned_names(loop)
+    if calls_user_function(loop, is_builtin):
+        variant |= function_assigned
+
+    after_side_effect: bool = False
+
+    def collect(node: Node, out: list[Expression]):
+        nonlocal after_side_effect
+        if after_side_effect:
+            return
+
+        collect_unconditional(node, out)
+        after_side_effect = has_side_effect(node, is_pure_builtin)
+
+    def collect_unconditional(node: Node, out: list[Expression]):
+        if excluded(node):
+            return
+
+        match node.type():
+            case "FunctionLiteral":
+                return
+            case "IfExpression":
+                # Only the condition runs unconditionally
+                collect(node.condition, out)
+                return
+            case "MatchExpression":
+                collect(node.subject, out)
+                return
+            case "WhileStatement":
+                collect(node.condition, out)
+                return
+            case "ForStatement":
+                collect(node.initializer, out)
+                return
+
+        if isinstance(node, Expression) and not is_trivial(node) and not builds_object(node) and is_invariant(node, variant, is_pure_builtin):
+            out.append(node)
+            return
+
+        for child in unconditional_children(node):
+            collect(child, out)
+
+    condition_exprs: list[Expression] = []
+    collect(loop.condition, condition_exprs)
+
+    # The body expressions are hoisted after the first condition check, its side effects have happened by then
+    after_side_effect = False
+
+    body_exprs: list[Expression] = []
+    may_exit: bool = False
+    for stmt in loop.body.statements:
+        collect(stmt, body_exprs)
+        if may_jump_out(stmt):
+            may_exit = True
+            break
+
+    if loop.type() == "ForStatement" and not may_exit:
+        collect(loop.increment, body_exprs)
+
+    invariants: LoopInvariants = LoopInvariants()
+
+    groups: dict[tuple, list[Expression]] = {}
+    for expr in condition_exprs:
+        key: tuple = expression_key(expr)
+        if key not in groups:
+            groups[key] = []
+            invariants.before_condition.append(groups[key])
+        groups[key].append(expr)
+
+    for expr in body_exprs:
+        key: tuple = expression_key(expr)
+        if key not in groups:
+            groups[key] = []
+            invariants.before_body.append(groups[key])
+        groups[key].append(expr)
+
+    return invariants
+# endregion
+
+# region Counted Loops
+# Largest step the OpRangeStep operand holds
+MAX_RANGE_STEP: int = 65535
+
+class CountedLoop(NamedTuple):
+    counter: str
+    limit: Expression
+    step: int
+
+def find_counted_loop(loop: ForStatement, is_builtin: Callable[[str], bool], is_pure_builtin: Callable[[str], bool], function_assigned: set[str]) -> CountedLoop | None:
+    """ Recognizes `for (let i = <int>; i < <invariant>; i = i + <int>)` where nothing else changes `i` """
+    init = loop.initializer
+    if init is None or init.value is None or init.value.type() != "IntegerLiteral":
+        return None
+    counter: str = init.name.value
+
+    cond = loop.condition
+    if cond is None or cond.type() != "InfixExpression":
+        return None
+    if cond.operator == "<" and is_identifier(cond.left_node, counter):
+        limit: Expression = cond.right_node
+    elif cond.operator == ">" and is_identifier(cond.right_node, counter):
+        limit: Expression = cond.left_node
+    else:
+        return None
+
+    inc = loop.increment
+    if inc is None or inc.type() != "AssignStatement" or inc.ident.value != counter:
+        return None
+
+    step_expr = inc.right_value
+    if step_expr is None or step_expr.type() != "InfixExpression" or step_expr.operator != "+":
+        return None
+    if is_identifier(step_expr.left_node, counter) and step_expr.right_node.type() == "IntegerLiteral":
+        step: int = step_expr.right_node.value
+    elif is_identifier(step_expr.right_node, counter) and step_expr.left_node.type() == "IntegerLiteral":
+        step: int = step_expr.left_node.value
+    else:
+        return None
+
+    if step <= 0 or step > MAX_RANGE_STEP:
+        return None
+
+    # Only the increment may change the counter, and the limit must not change at all
+    changed: set[str] = assigned_names(loop.body) | assigned_names(loop.condition)
+    if calls_user_function(loop, is_builtin):
+        changed |= function_assigned
+    if counter in changed:
+        return None
+
+    if not is_invariant(limit, changed | {counter}, is_pure_builtin):
+        return None
+
+    return CountedLoop(counter=counter, limit=limit, step=step)
+
+def is_identifier(node: Node, name: str) -> bool:
+    return node is not None and node.type() == "IdentifierLiteral" and node.value == name
+# endregion
+
+# region Function Inlining
+def reassigned_names(program: Program) -> set[str]:
+    """ Every name that is the target of an `=` anywhere in the program, nested functions included """
+    names: set[str] = set()
+    for n in walk(program, enter_functions=True):
+        if n.type() == "AssignStatement":
+            names.add(n.ident.value)
+        elif n.type() == "FunctionLiteral" and n.lazy_body is not None:
+            names |= n.lazy_body.assigned
+    return names
+
+def node_count(node: Node) -> int:
+    return sum(1 for _ in walk(node, enter_functions=True))
+
+def free_names(fn: FunctionLiteral) -> set[str]:
+    """ Names a function body reads or assigns that are neither parameters nor its own `let` bindings """
+    own: set[str] = {p.value for p in fn.parameters}
+    used: set[str] = set()
+
+    for n in walk(fn.body):
+        match n.type():
+            case "LetStatement":
+                own.add(n.name.value)
+            case "AssignStatement":
+                used.add(n.ident.value)
+            case "IdentifierLiteral":
+                used.add(n.value)
+
+    return used - own
+
+def is_inlinable(fn: FunctionLiteral, threshold: int) -> bool:
+    """ Whether calls to `fn` can be replaced by its body: small, straight-line, no closures and no self references """
+    if fn.parameters is None or fn.body is None or node_count(fn.body) > threshold:
+        return False
+
+    # Inlining renames every use of a name the body binds, a use before the `let` means the outer name instead
+    bound: set[str] = {p.value for p in fn.parameters}
+    used: set[str] = set()
+
+    statements: list[Node] = fn.body.statements
+    for i, stmt in enumerate(statements):
+        if stmt.type() not in ("LetStatement", "AssignStatement", "ExpressionStatement", "ReturnStatement"):
+            return False
+
+        used |= identifier_names(stmt) | {n.ident.value for n in walk(stmt) if n.type() == "AssignStatement"}
+        lets: set[str] = {n.name.value for n in walk(stmt) if n.type() == "LetStatement"} - bound
+        if len(lets & used) > 0:
+            return False
+        bound |= lets
+
+        # An early `return` would have to leave the middle of the caller's expression
+        if i < len(statements) - 1 and stmt.type() == "ReturnStatement":
+            return False
+
+        for n in walk(stmt, enter_functions=True):
+            if n.type() == "FunctionLiteral":
+                return False
+            if n is not stmt and n.type() == "ReturnStatement":
+                return False
+            # Inlined into a loop of the caller, these would jump in that loop
+            if n.type() in ("BreakStatement", "ContinueStatement"):
+                return False
+
+    return fn.name == "" or fn.name not in free_names(fn)
+
+def rename_identifiers(node: Node, renames: dict[str, str], literals: dict[str, Expression] = None) -> Node:
+    """ Rewrites `node` in place: identifiers in `renames` get a new name, identifiers in `literals` are replaced by that literal """
+    literals = {} if literals is None else literals
+
+    def replace(expr: Expression) -> Expression:
+        if expr is not None and expr.type() == "IdentifierLiteral" and expr.value in literals:
+            return literals[expr.value]
+        return expr
+
+    for n in walk(node):
+        match n.type():
+            case "IdentifierLiteral":
+                if n.value in renames:
+                    n.value = renames[n.value]
+            case "LetStatement":
+                n.value = replace(n.value)
+                if n.name.value in renames:
+                    n.name.value = renames[n.name.value]
+            case "AssignStatement":
+                n.right_value = replace(n.right_value)
+                if n.ident.value in renames:
+                    n.ident.value = renames[n.ident.value]
+            case "ExpressionStatement":
+                n.expr = replace(n.expr)
+            case "ReturnStatement":
+                n.return_value = replace(n.return_value)
+            case "InfixExpression":
+                n.left_node = replace(n.left_node)
+                n.right_node = replace(n.right_node)
+            case "PrefixExpression":
+                n.right_node = replace(n.right_node)
+            case "IfExpression" | "WhileStatement" | "ForStatement":
+                n.condition = replace(n.condition)
+            case "MatchExpression":
+                n.subject = replace(n.subject)
+            case "IndexExpression":
+                n.left = replace(n.left)
+                n.index = replace(n.index)
+            case "CallExpression":
+                n.function = replace(n.function)
+                n.arguments = [replace(a) for a in n.arguments]
+            case "ArrayLiteral":
+                n.elements = [replace(e) for e in n.elements]
+            case "HashLiteral":
+                n.pairs = {replace(k): replace(v) for k, v in n.pairs.items()}
+
+    return node
+# endregion
+
+# region Compile-Time Evaluation
+def is_pure_function(fn: FunctionLiteral, is_pure_name: Callable[[str], bool]) -> bool:
+    """ Whether a call to `fn` only computes a value from its arguments: no closures, and every name it
+    reads or assigns besides its own is itself pure (a pure builtin, another pure function or `fn` itself) """
+    if fn.parameters is None or fn.body is None:
+        return False
+
+    if any(n.type() == "FunctionLiteral" for n in walk(fn.body)):
+        return False
+
+    return all(name == fn.name or is_pure_name(name) for name in free_names(fn))
+# endregion
+
+# region Common Subexpression Elimination
+def is_worth_caching(expr: Expression) -> bool:
+    """ Storing and reloading a value costs two instructions, so only cache lookups, calls or chains of operators """
+    operations: int = 0
+    for n in walk(expr):
+        match n.type():
+            case "IndexExpression" | "CallExpression":
+                return True
+            case "InfixExpression" | "PrefixExpression":
+                operations += 1
+
+    return operations >= 2
+
+def find_common_subexpressions(statements: list[Node], is_builtin: Callable[[str], bool], is_pure_builtin: Callable[[str], bool], function_assigned: set[str], excluded: Callable[[Node], bool]) -> list[list[Expression]]:
+    """ Groups identical pure expressions within a straight-line list of statements.
+
+    The statements are walked in evaluation order. An expression joins a group only while none of the names it
+    reads has been assigned since the first member of the group was evaluated; loops end every group.
+    The first member of each returned group is the one evaluated first.
+    """
+    available: dict[tuple, list[Expression]] = {}
+    groups: list[list[Expression]] = []
+
+    # The names each available expression reads, and the other way around, so a kill only looks at the
+    # expressions that read an assigned name
+    reads: dict[tuple, set[str]] = {}
+    readers: dict[str, set[tuple]] = {}
+
+    def kill(names: set[str]):
+        for name in names:
+            for key in readers.pop(name, ()):
+                del available[key]
+                for other in reads.pop(key) - {name}:
+                    readers[other].discard(key)
+
+    def visit(node: Node):
+        if excluded(node):
+            return
+
+        match node.type():
+            case "FunctionLiteral":
+                return
+            case "WhileStatement" | "ForStatement":
+                available.clear()
+                reads.clear()
+                readers.clear()
+                return
+            case "IfExpression" | "MatchExpression":
+                # The branches are their own blocks, only what they assign matters here
+                if node.type() == "IfExpression":
+                    visit(node.condition)
+                    branches: list[Node] = [node.consequence, node.alternative]
+                else:
+                    visit(node.subject)
+                    branches: list[Node] = [*(body for _, body in node.arms), node.default]
+
+                for branch in branches:
+                    if branch is None:
+                        continue
+
+                    kill(assigned_names(branch))
+                    if calls_user_function(branch, is_builtin):
+                        kill(function_assigned)
+                return
+
+        key: tuple = None
+        if isinstance(node, Expression) and not is_trivial(node) and not builds_object(node) \
+                and is_invariant(node, set(), is_pure_builtin) and is_worth_caching(node):
+            key = expression_key(node)
+            if key in available:
+                available[key].append(node)
+                return
+
+        for child in unconditional_children(node):
+            visit(child)
+
+        # Like a branch, a right operand that may not run only matters for what it can change
+        if is_short_circuit(node) and calls_user_function(node.right_node, is_builtin):
+            kill(function_assigned)
+
+        if key is not None:
+            available[key] = [node]
+            groups.append(available[key])
+
+            reads[key] = identifier_names(node)
+            for name in reads[key]:
+                readers.setdefault(name, set()).add(key)
+
+        match node.type():
+            case "LetStatement":
+                kill({node.name.value})
+            case "AssignStatement":
+                kill({node.ident.value})
+            case "CallExpression":
+                if node.function.type() != "IdentifierLiteral" or not is_builtin(node.function.value):
+                    kill(function_assigned)
+
+    for stmt in statements:
+        visit(stmt)
+
+    return [g for g in groups if len(g) > 1]
+# endregion
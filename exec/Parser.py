@@ -1,4 +1,4 @@
-from exec.Lexer import Lexer
+from exec.Lexer import Lexer, TokenReplay
 from models.Token import Token, TokenType
 from typing import Callable
 
@@ -6,19 +6,21 @@ from typing import Callable
 from models.AST import Statement, Expression, Program, ExpressionStatement, PrefixExpression, InfixExpression, IntegerLiteral, FloatLiteral
 from models.AST import IdentifierLiteral, LetStatement, BooleanLiteral, IfExpression, BlockStatement, AssignStatement, ReturnStatement
 from models.AST import FunctionLiteral, CallExpression, StringLiteral, ArrayLiteral, HashLiteral, IndexExpression, ImportStatement
-from models.AST import WhileStatement, ForStatement
+from models.AST import WhileStatement, ForStatement, MatchExpression, BreakStatement, ContinueStatement, LazyBody
 
 
 # Precedence Types
 P_LOWEST: int = 0
-P_EQUALS: int = 1
-P_LESSGREATER: int = 2
-P_SUM: int = 3
-P_PRODUCT: int = 4
-P_EXPONENT: int = 5
-P_PREFIX: int = 6
-P_CALL: int = 7
-P_INDEX: int = 8
+P_OR: int = 1
+P_AND: int = 2
+P_EQUALS: int = 3
+P_LESSGREATER: int = 4
+P_SUM: int = 5
+P_PRODUCT: int = 6
+P_EXPONENT: int = 7
+P_PREFIX: int = 8
+P_CALL: int = 9
+P_INDEX: int = 10
 
 # Precedence Mapping
 PRECEDENCES: dict[TokenType, int] = {
@@ -34,16 +36,21 @@ PRECEDENCES: dict[TokenType, int] = {
     TokenType.GT: P_LESSGREATER,
     TokenType.LT_EQ: P_LESSGREATER,
     TokenType.GT_EQ: P_LESSGREATER,
+    TokenType.AND: P_AND,
+    TokenType.OR: P_OR,
     TokenType.LPAREN: P_CALL,
     TokenType.LBRACKET: P_INDEX
 }
 
 
 class Parser:
-    def __init__(self, lexer: Lexer, debug: bool = False) -> None:
+    def __init__(self, lexer: Lexer, debug: bool = False, lazy: bool = False) -> None:
         self.lexer: Lexer = lexer
         self.debug: bool = debug
 
+        # Only scan function bodies, the Compiler parses them when they are first called
+        self.lazy: bool = lazy
+
         self.errors: list[str] = []
 
         self.current_token: Token = None
@@ -60,6 +67,7 @@ class Parser:
             TokenType.TRUE: self.__parse_boolean,
             TokenType.FALSE: self.__parse_boolean,
             TokenType.IF: self.__parse_if_expression,
+            TokenType.MATCH: self.__parse_match_expression,
             TokenType.FUNCTION: self.__parse_function_literal,
             TokenType.LBRACKET: self.__parse_array_literal,
             TokenType.LBRACE: self.__parse_hash_literal
@@ -77,6 +85,8 @@ class Parser:
             TokenType.GT: self.__parse_infix_expression,
             TokenType.LT_EQ: self.__parse_infix_expression,
             TokenType.GT_EQ: self.__parse_infix_expression,
+            TokenType.AND: self.__parse_infix_expression,
+            TokenType.OR: self.__parse_infix_expression,
             TokenType.LPAREN: self.__parse_call_expression,
             TokenType.LBRACKET: self.__parse_index_expression
         }
@@ -137,6 +147,10 @@ class Parser:
             self.__next_token()
         
         return program
+
+    def parse_block(self) -> BlockStatement:
+        """ Parses the block starting at the current `{`, e.g. a LazyBody replayed through a TokenReplay """
+        return self.__parse_block_statement()
     # endregion
 
     # region Parser Execution **STATEMENT** methods
@@ -155,6 +169,10 @@ class Parser:
                 return self.__parse_while_statement()
             case TokenType.FOR:
                 return self.__parse_for_statement()
+            case TokenType.BREAK:
+                return self.__parse_loop_jump_statement(BreakStatement(token=self.current_token))
+            case TokenType.CONTINUE:
+                return self.__parse_loop_jump_statement(ContinueStatement(token=self.current_token))
             case _:
                 return self.__parse_expression_statement()
             
@@ -170,6 +188,12 @@ class Parser:
 
         return stmt
     
+    def __parse_loop_jump_statement(self, stmt: BreakStatement | ContinueStatement) -> Statement:
+        if self.__peek_token_is(TokenType.SEMICOLON):
+            self.__next_token()
+
+        return stmt
+
     def __parse_expression_statement(self) -> ExpressionStatement:
         expr = self.__parse_expression(P_LOWEST)
 
@@ -379,6 +403,49 @@ class Parser:
         
         return IfExpression(token=self.current_token, condition=condition, consequence=consequence, alternative=alternative)
     
+    def __parse_match_expression(self) -> Expression:
+        expr: MatchExpression = MatchExpression(token=self.current_token)
+
+        self.__next_token()
+        expr.subject = self.__parse_expression(P_LOWEST)
+
+        if not self.__expect_peek(TokenType.LBRACE):
+            return None
+
+        while not self.__peek_token_is(TokenType.RBRACE):
+            self.__next_token()
+
+            # `_ => { ... }` is the default arm
+            labels: list[Expression] = []
+            is_default: bool = self.__current_token_is(TokenType.IDENT) and self.current_token.literal == "_"
+            if not is_default:
+                labels.append(self.__parse_expression(P_LOWEST))
+                while self.__peek_token_is(TokenType.COMMA):
+                    self.__next_token()
+                    self.__next_token()
+                    labels.append(self.__parse_expression(P_LOWEST))
+
+            if not self.__expect_peek(TokenType.ARROW):
+                return None
+
+            if not self.__expect_peek(TokenType.LBRACE):
+                return None
+
+            body: BlockStatement = self.__parse_block_statement()
+            if is_default:
+                expr.default = body
+            else:
+                expr.arms.append((labels, body))
+
+            # Arms may be separated by commas
+            if self.__peek_token_is(TokenType.COMMA):
+                self.__next_token()
+
+        if not self.__expect_peek(TokenType.RBRACE):
+            return None
+
+        return expr
+
     def __parse_function_literal(self) -> Expression:
         lit: FunctionLiteral = FunctionLiteral(token=self.current_token)
 
@@ -390,7 +457,18 @@ class Parser:
         if not self.__expect_peek(TokenType.LBRACE):
             return None
         
-        lit.body = self.__parse_block_statement()
+        if not self.lazy:
+            lit.body = self.__parse_block_statement()
+            return lit
+
+        lit.lazy_body = self.__scan_block_statement()
+
+        # What an import brings in has to be known before anything is compiled, see Compiler.imported_programs
+        if any(t.type == TokenType.IMPORT for t in lit.lazy_body.tokens):
+            p: Parser = Parser(lexer=TokenReplay(lit.lazy_body.tokens), lazy=True)
+            lit.body = p.parse_block()
+            lit.lazy_body = None
+            self.errors += p.errors
 
         return lit
     
@@ -438,6 +516,33 @@ class Parser:
         
         return block_stmt
     
+    def __scan_block_statement(self) -> LazyBody:
+        """ Skips to the `}` closing the current `{`, only noting the tokens and identifiers on the way """
+        tokens: list[Token] = [self.current_token]
+        names: set[str] = set()
+        assigned: set[str] = set()
+
+        depth: int = 1
+        while depth > 0:
+            if self.__peek_token_is(TokenType.EOF):
+                self.__peek_error(TokenType.RBRACE)
+                break
+
+            self.__next_token()
+            tokens.append(self.current_token)
+
+            match self.current_token.type:
+                case TokenType.LBRACE:
+                    depth += 1
+                case TokenType.RBRACE:
+                    depth -= 1
+                case TokenType.IDENT:
+                    names.add(self.current_token.literal)
+                    if self.__peek_token_is(TokenType.ASSIGN) and tokens[-2].type != TokenType.LET:
+                        assigned.add(self.current_token.literal)
+
+        return LazyBody(tokens=tokens, names=names, assigned=assigned)
+
     def __parse_function_parameters(self) -> list[IdentifierLiteral]:
         idents: list[IdentifierLiteral] = []
 
@@ -0,0 +1,390 @@
+from models.Code import OpCode
+from models.IR import ControlFlowGraph, BasicBlock, IRInstruction
+from exec.SSA import SSAForm, SSAValue
+from exec.TypeInference import TypeInference, specialized_opcode, CHECKED_INTEGER_OPCODES
+from models.Object import T_INTEGER_OBJ
+from models.Profile import COLD_BRANCH_RATIO
+from contextlib import contextmanager
+from time import perf_counter
+
+DEFAULT_OPTIMIZATION_LEVEL: int = 1
+MAX_OPTIMIZATION_LEVEL: int = 2
+
+# Instructions that only push a value and have no other effect
+PURE_PUSH_OPCODES: set[OpCode] = {
+    OpCode.OpConstant, OpCode.OpCopyConstant, OpCode.OpTrue, OpCode.OpFalse, OpCode.OpNull, OpCode.OpGetGlobal,
+    OpCode.OpGetLocal, OpCode.OpGetBuiltin, OpCode.OpGetFree, OpCode.OpCurrentClosure
+}
+
+
+class Pass:
+    """ An optimization over the ControlFlowGraph of a single function, enabled from `level` upwards """
+    name: str = ""
+    level: int = 1
+    description: str = ""
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        pass
+
+
+class ASTPass(Pass):
+    """ An optimization the Compiler performs itself while walking the AST, registered here so it can be switched and timed """
+    def __init__(self, name: str, level: int, description: str) -> None:
+        self.name = name
+        self.level = level
+        self.description = description
+
+
+# region IR Passes
+class ConstantBranchFolding(Pass):
+    name = "constant-branches"
+    level = 2
+    description = "Resolve OpJumpNotTruthy on a value pushed just before it, e.g. `while true`"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        for block in cfg.blocks:
+            term: IRInstruction | None = block.terminator()
+            if term is None or term.opcode != OpCode.OpJumpNotTruthy or len(block.instructions) < 2:
+                continue
+
+            # Every constant in the pool (numbers, strings, functions) is truthy
+            match block.instructions[-2].opcode:
+                case OpCode.OpTrue | OpCode.OpConstant | OpCode.OpCopyConstant:
+                    del block.instructions[-2:]
+                case OpCode.OpFalse | OpCode.OpNull:
+                    del block.instructions[-2:]
+                    block.instructions.append(IRInstruction(OpCode.OpJump, target=term.target))
+                    block.fallthrough = None
+
+
+class UnreachableCodeElimination(Pass):
+    name = "unreachable-code"
+    level = 1
+    description = "Drop blocks control never reaches, e.g. code after a return"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        reachable: set[BasicBlock] = set(cfg.reverse_postorder())
+        cfg.blocks = [b for b in cfg.blocks if b in reachable or b is cfg.exit()]
+
+
+class JumpThreading(Pass):
+    name = "jump-threading"
+    level = 1
+    description = "Jump straight to the final destination of a chain of jumps"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        for block in cfg.blocks:
+            term: IRInstruction | None = block.terminator()
+            if term is not None and term.is_jump():
+                term.target = self.final_destination(term.target)
+                if term.targets is not None:
+                    term.targets = [self.final_destination(t) for t in term.targets]
+
+    def final_destination(self, block: BasicBlock) -> BasicBlock:
+        seen: set[BasicBlock] = set()
+        while block not in seen:
+            seen.add(block)
+
+            if len(block.instructions) == 0 and block.fallthrough is not None:
+                block = block.fallthrough
+            elif len(block.instructions) == 1 and block.instructions[0].opcode in (OpCode.OpJump, OpCode.OpLoop):
+                block = block.instructions[0].target
+            else:
+                break
+
+        return block
+
+
+class DeadStoreElimination(Pass):
+    name = "dead-stores"
+    level = 2
+    description = "Remove stores to locals that are never read again (SSA based)"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        ssa: SSAForm = SSAForm(cfg)
+        live: set[SSAValue] = ssa.live_values()
+
+        for block in cfg.blocks:
+            out: list[IRInstruction] = []
+            for ins in block.instructions:
+                value: SSAValue | None = ssa.writes.get(ins)
+                if value is None or value in live or value.variable[0] != "L":
+                    out.append(ins)
+                elif len(out) > 0 and out[-1].opcode in PURE_PUSH_OPCODES:
+                    out.pop()
+                else:
+                    out.append(IRInstruction(OpCode.OpPop))
+            block.instructions = out
+
+
+class TypeSpecialization(Pass):
+    name = "specialize"
+    level = 2
+    description = "Use operators without runtime type checks where the operand types are proven"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        types: TypeInference = TypeInference(cfg)
+
+        for block in cfg.blocks:
+            for ins in block.instructions:
+                operands: list[str] | None = types.operand_types.get(ins)
+                if operands is None:
+                    continue
+
+                specialized: OpCode | None = specialized_opcode(ins.opcode, operands)
+                if specialized is not None:
+                    ins.opcode = specialized
+
+
+class ProfileSpecialization(Pass):
+    name = "profile-specialize"
+    level = 1
+    description = "Use integer fast paths (with a type check) where the profile only ever saw integers"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        if cfg.profile is None:
+            return
+
+        for block in cfg.blocks:
+            for ins in block.instructions:
+                if ins.opcode in CHECKED_INTEGER_OPCODES and cfg.profile.monomorphic_types(ins.site) == (T_INTEGER_OBJ, T_INTEGER_OBJ):
+                    ins.opcode = CHECKED_INTEGER_OPCODES[ins.opcode]
+
+
+class ProfileBlockLayout(Pass):
+    name = "profile-layout"
+    level = 1
+    description = "Move else branches the profile says are (almost) never taken out of line"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        if cfg.profile is None:
+            return
+
+        for block in list(cfg.blocks):
+            term: IRInstruction | None = block.terminator()
+            if term is None or term.opcode != OpCode.OpJumpNotTruthy:
+                continue
+
+            ratio: float | None = cfg.profile.truthy_ratio(term.site)
+            if ratio is None or ratio < 1 - COLD_BRANCH_RATIO:
+                continue
+
+            region: list[BasicBlock] | None = self.cold_region(cfg, block, term.target)
+            if region is not None:
+                # Right in front of the exit block, which has to stay last
+                for b in region:
+                    cfg.blocks.remove(b)
+                cfg.blocks[-1:-1] = region
+
+    def cold_region(self, cfg: ControlFlowGraph, branch: BasicBlock, target: BasicBlock) -> list[BasicBlock] | None:
+        """ The blocks of the `else` that starts at `target`: everything up to where the `then` part jumps to.
+
+        Moving them is only worth it when the `then` part ends in that jump, which then becomes a fallthrough.
+        """
+        start: int = cfg.blocks.index(target)
+        if start == 0:
+            return None
+
+        jump: IRInstruction | None = cfg.blocks[start - 1].terminator()
+        if jump is None or jump.opcode != OpCode.OpJump or jump.target not in cfg.blocks[start + 1:]:
+            return None
+
+        region: list[BasicBlock] = cfg.blocks[start:cfg.blocks.index(jump.target)]
+        if cfg.exit() in region:
+            return None
+
+        # Only code inside the region (and the branch itself) may lead into it
+        preds = cfg.predecessors()
+        for b in region:
+            if any(p not in region and p is not branch for p in preds[b]):
+                return None
+
+        return region
+
+
+class LocalSlotAllocation(Pass):
+    name = "local-slots"
+    level = 1
+    description = "Let locals whose lifetimes do not overlap share a stack slot, shrinking the frame"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        if cfg.is_main or cfg.num_locals <= cfg.num_params:
+            return
+
+        interference: dict[int, set[int]] = self.interference(cfg)
+
+        # Parameters stay where the caller puts them, everything else takes the lowest slot no neighbour has
+        slots: dict[int, int] = {p: p for p in range(cfg.num_params)}
+        for local in range(cfg.num_params, cfg.num_locals):
+            taken: set[int] = {slots[n] for n in interference[local] if n in slots}
+            slot: int = 0
+            while slot in taken:
+                slot += 1
+            slots[local] = slot
+
+        for block in cfg.blocks:
+            for ins in block.instructions:
+                match ins.opcode:
+                    case OpCode.OpGetLocal | OpCode.OpSetLocal:
+                        ins.operands = [slots[ins.operands[0]]]
+                    case OpCode.OpRangeTest | OpCode.OpRangeStep:
+                        if ins.operands[0] == 1:
+                            ins.operands = [1, slots[ins.operands[1]], *ins.operands[2:]]
+
+            # Copies between locals that now share a slot (e.g. an inlined parameter) do nothing
+            out: list[IRInstruction] = []
+            for ins in block.instructions:
+                if ins.opcode == OpCode.OpSetLocal and len(out) > 0 and out[-1].opcode == OpCode.OpGetLocal and out[-1].operands == ins.operands:
+                    out.pop()
+                else:
+                    out.append(ins)
+            block.instructions = out
+
+        cfg.num_locals = max(slots.values()) + 1
+
+    def accesses(self, ins: IRInstruction) -> tuple[list[int], list[int]]:
+        """ The local slots `ins` reads and writes """
+        match ins.opcode:
+            case OpCode.OpGetLocal:
+                return [ins.operands[0]], []
+            case OpCode.OpSetLocal:
+                return [], [ins.operands[0]]
+            case OpCode.OpRangeTest:
+                return ([ins.operands[1]], []) if ins.operands[0] == 1 else ([], [])
+            case OpCode.OpRangeStep:
+                return ([ins.operands[1]], [ins.operands[1]]) if ins.operands[0] == 1 else ([], [])
+        return [], []
+
+    def interference(self, cfg: ControlFlowGraph) -> dict[int, set[int]]:
+        """ Which locals are live at the same time: a local written while another one is live may not share its slot """
+        live_in: dict[BasicBlock, set[int]] = {b: set() for b in cfg.blocks}
+
+        def live_out(block: BasicBlock) -> set[int]:
+            out: set[int] = set()
+            for succ in block.successors():
+                out |= live_in[succ]
+            return out
+
+        changed: bool = True
+        while changed:
+            changed = False
+            for block in reversed(cfg.blocks):
+                live: set[int] = live_out(block)
+                for ins in reversed(block.instructions):
+                    reads, writes = self.accesses(ins)
+                    live.difference_update(writes)
+                    live.update(reads)
+
+                if live != live_in[block]:
+                    live_in[block] = live
+                    changed = True
+
+        interference: dict[int, set[int]] = {local: set() for local in range(cfg.num_locals)}
+
+        def interfere(local: int, others: set[int]):
+            for other in others:
+                if other != local:
+                    interference[local].add(other)
+                    interference[other].add(local)
+
+        for block in cfg.blocks:
+            live: set[int] = live_out(block)
+            for ins in reversed(block.instructions):
+                reads, writes = self.accesses(ins)
+                for local in writes:
+                    interfere(local, live)
+                live.difference_update(writes)
+                live.update(reads)
+
+        # The parameters are all written on entry
+        for param in range(cfg.num_params):
+            interfere(param, live_in[cfg.entry()] | set(range(cfg.num_params)))
+
+        return interference
+
+
+class CompactEncoding(Pass):
+    name = "compact-encoding"
+    level = 2
+    description = "Encode small constant / global indices and short jumps with one-byte operands"
+
+    def run(self, cfg: ControlFlowGraph) -> None:
+        # The operands (jump offsets in particular) are only known once the graph is assembled
+        cfg.compact = True
+# endregion
+
+
+AST_PASSES: list[ASTPass] = [
+    ASTPass("constant-globals", 1, "Load globals that are bound once to a constant and never assigned as that constant"),
+    ASTPass("pure-calls", 1, "Evaluate calls to pure functions with constant arguments at compile time"),
+    ASTPass("inline", 1, "Inline calls to small non-recursive functions"),
+    ASTPass("licm", 1, "Hoist loop-invariant expressions out of loops"),
+    ASTPass("cse", 1, "Reuse identical pure expressions within a block"),
+    ASTPass("constant-collections", 1, "Prebuild array and hash literals made only of constants"),
+    ASTPass("counted-loops", 1, "Run `for (let i = a; i < n; i = i + k)` loops on OpRangeTest / OpRangeStep")
+]
+
+# In the order they run
+IR_PASSES: list[Pass] = [
+    ConstantBranchFolding(),
+    UnreachableCodeElimination(),
+    JumpThreading(),
+    DeadStoreElimination(),
+    TypeSpecialization(),
+    ProfileSpecialization(),
+    ProfileBlockLayout(),
+    LocalSlotAllocation(),
+    CompactEncoding()
+]
+
+
+class PassManager:
+    def __init__(self, level: int = DEFAULT_OPTIMIZATION_LEVEL, enabled: set[str] = None, disabled: set[str] = None) -> None:
+        self.level: int = level
+
+        # Explicit switches win over the level
+        self.enabled: set[str] = set() if enabled is None else enabled
+        self.disabled: set[str] = set() if disabled is None else disabled
+
+        self.timings: dict[str, float] = {}
+        self.runs: dict[str, int] = {}
+
+    def passes(self) -> list[Pass]:
+        return [*AST_PASSES, *IR_PASSES]
+
+    def is_enabled(self, name: str) -> bool:
+        if name in self.disabled:
+            return False
+        if name in self.enabled:
+            return True
+
+        for p in self.passes():
+            if p.name == name:
+                return self.level >= p.level
+        return False
+
+    @contextmanager
+    def timer(self, name: str):
+        start: float = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + perf_counter() - start
+            self.runs[name] = self.runs.get(name, 0) + 1
+
+    def run(self, cfg: ControlFlowGraph) -> ControlFlowGraph:
+        for p in IR_PASSES:
+            if not self.is_enabled(p.name):
+                continue
+
+            with self.timer(p.name):
+                p.run(cfg)
+
+        return cfg
+
+    def report(self) -> str:
+        output: str = f"== Optimization Passes (-O{self.level}) ==\n"
+        for p in self.passes():
+            state: str = "on " if self.is_enabled(p.name) else "off"
+            output += f"[{state}] {p.name:<20} {self.runs.get(p.name, 0):>5} runs {self.timings.get(p.name, 0.0) * 1000:>9.3f} ms  {p.description}\n"
+        return output
@@ -0,0 +1,117 @@
+from exec.Lexer import Lexer
+from exec.Parser import Parser
+from exec.Compiler import Compiler, Bytecode, Module
+from exec.VM import VM
+from exec.PassManager import PassManager
+from models.AST import Program
+from models.Object import Object
+from models.SymbolTable import SymbolTable, Symbol
+from models.Token import TokenType
+from time import time
+
+
+class Repl:
+    """ Evaluates Lime one input at a time, each input seeing what the earlier ones defined.
+
+    One Compiler, with its symbol table and constant pool, and one list of globals last the whole session, so
+    an input only compiles and runs its own code. Globals are never treated as constants, a later input may
+    assign any of them. What a failed input defined is forgotten, unless it was assigned before the failure.
+    """
+    def __init__(self, passes: PassManager = None, search_path: list[str] = None) -> None:
+        self.compiler: Compiler = Compiler(passes=passes, search_path=search_path, interactive=True)
+        self.globals: list[Object] = []
+
+        # Time spent compiling and running the last input, in seconds
+        self.compile_time: float = 0.0
+        self.run_time: float = 0.0
+
+    def evaluate(self, src: str) -> tuple[Object | None, str | None]:
+        """ Compiles and runs `src`, returns the value of its last expression statement (None if it ends with another statement) """
+        self.compile_time = self.run_time = 0.0
+        st = time()
+
+        # The Lexer reads one character past an identifier, which must not be the end of the source
+        src += "\n"
+
+        p: Parser = Parser(lexer=Lexer(source=src))
+        program: Program = p.parse_program()
+        if len(p.errors) > 0:
+            return None, "\n".join(p.errors)
+
+        table: SymbolTable = self.compiler.symbol_table
+        store: dict[str, Symbol] = dict(table.store)
+        num_constants: int = len(self.compiler.constants)
+        modules: dict[str, Module] = dict(self.compiler.modules)
+
+        self.compiler.reset_main()
+        err = self.compiler.compile(program)
+        if err is not None:
+            # Nothing refers to what it added, so the next input starts from where this one did. An error
+            # returns from the middle of a function or branch, whose scope is still entered
+            self.compiler.symbol_table = table
+            table.store = store
+            del self.compiler.constants[num_constants:]
+            self.compiler.modules = modules
+            self.compiler.scopes = self.compiler.scopes[:1]
+            self.compiler.scope_index = 0
+            self.compiler.value_branches = 0
+            self.compile_time = time() - st
+            return None, f"Compiler Error: {err}"
+
+        bytecode: Bytecode = self.compiler.bytecode()
+        ct = time()
+        self.compile_time = ct - st
+
+        machine: VM = VM(bytecode, globs=self.globals)
+        err = machine.run()
+        self.run_time = time() - ct
+        if err is not None:
+            # A name whose value was never stored would read an empty slot
+            for name, symbol in list(table.store.items()):
+                if store.get(name) is not symbol and (symbol.index >= len(self.globals) or self.globals[symbol.index] is None):
+                    if name in store:
+                        table.store[name] = store[name]
+                    else:
+                        del table.store[name]
+            return None, f"Runtime Error: {err}"
+
+        return (machine.stack.last_popped_elem if self.ends_with_value(program) else None), None
+
+    @staticmethod
+    def ends_with_value(program: Program) -> bool:
+        return len(program.statements) > 0 and program.statements[-1].type() == "ExpressionStatement"
+
+    @staticmethod
+    def is_complete(src: str) -> bool:
+        """ Whether every bracket `src` opens is closed, otherwise the input goes on on the next line """
+        depth: int = 0
+        lexer: Lexer = Lexer(source=src + "\n")
+        token = lexer.next_token()
+        while token.type != TokenType.EOF:
+            if token.type in (TokenType.LPAREN, TokenType.LBRACE, TokenType.LBRACKET):
+                depth += 1
+            elif token.type in (TokenType.RPAREN, TokenType.RBRACE, TokenType.RBRACKET):
+                depth -= 1
+            token = lexer.next_token()
+        return depth <= 0
+
+    def run(self) -> None:
+        """ Reads inputs from stdin until it ends, printing the value and timing of each """
+        while True:
+            try:
+                src: str = input(">> ")
+                while not self.is_complete(src):
+                    src += "\n" + input(".. ")
+            except (EOFError, KeyboardInterrupt):
+                print()
+                return
+
+            if src.strip() == "":
+                continue
+
+            result, err = self.evaluate(src)
+            if err is not None:
+                print(err)
+            elif result is not None:
+                print(result.inspect())
+            print(f"== Compiled in {round(self.compile_time * 1000, 2)} ms, executed in {round(self.run_time * 1000, 2)} ms ==")
@@ -0,0 +1,175 @@
+from models.Code import OpCode
+from models.IR import ControlFlowGraph, BasicBlock, IRInstruction
+
+# A variable slot: ("L", index) for locals, ("G", index) for globals
+Variable = tuple[str, int]
+
+# Kinds of SSA values
+V_ENTRY = "ENTRY"      # Whatever the slot held when the function was entered (a parameter, or nothing)
+V_STORE = "STORE"      # An OpSetLocal / OpSetGlobal
+V_CLOBBER = "CLOBBER"  # A call that may have assigned the global
+V_PHI = "PHI"          # The merge of the values reaching a block from its predecessors
+
+
+class SSAValue:
+    def __init__(self, id: int, kind: str, variable: Variable, block: BasicBlock, instruction: IRInstruction = None) -> None:
+        self.id: int = id
+        self.kind: str = kind
+        self.variable: Variable = variable
+        self.block: BasicBlock = block
+        self.instruction: IRInstruction = instruction
+
+        # For phis, the incoming value per predecessor, None for the call entering the function (phis of the entry block)
+        self.operands: dict[BasicBlock | None, SSAValue] = {}
+
+    def __repr__(self) -> str:
+        if self.kind == V_PHI:
+            return f"v{self.id} = phi({', '.join(f'v{o.id}' for o in self.operands.values())})"
+        return f"v{self.id} = {self.kind} {self.variable}"
+
+
+class SSAForm:
+    """ Static single assignment view of the variable slots of a ControlFlowGraph.
+
+    The stack machine keeps temporaries on the VM stack, so only locals (and, in the main program, globals)
+    are renamed. Every OpGet* is mapped to the single SSAValue reaching it, and every OpSet* defines one.
+    Phis are placed on the iterated dominance frontier of the definitions (Cytron et al.).
+    """
+    def __init__(self, cfg: ControlFlowGraph) -> None:
+        self.cfg: ControlFlowGraph = cfg
+
+        self.values: list[SSAValue] = []
+        self.phis: dict[BasicBlock, dict[Variable, SSAValue]] = {}
+
+        self.reads: dict[IRInstruction, SSAValue] = {}
+        self.writes: dict[IRInstruction, SSAValue] = {}
+        self.entry_values: dict[Variable, SSAValue] = {}
+
+        self.idom: dict[BasicBlock, BasicBlock] = cfg.dominators()
+        self.__build()
+
+    # region Construction
+    def __new_value(self, kind: str, variable: Variable, block: BasicBlock, instruction: IRInstruction = None) -> SSAValue:
+        value = SSAValue(id=len(self.values), kind=kind, variable=variable, block=block, instruction=instruction)
+        self.values.append(value)
+        return value
+
+    def __defined_variables(self, ins: IRInstruction) -> list[Variable]:
+        match ins.opcode:
+            case OpCode.OpSetLocal:
+                return [("L", ins.operands[0])]
+            case OpCode.OpSetGlobal:
+                return [("G", ins.operands[0])] if self.cfg.is_main else []
+            case OpCode.OpCall:
+                return [("G", g) for g in self.cfg.clobbered_globals] if self.cfg.is_main else []
+            case OpCode.OpRangeStep:
+                return [self.__counter(ins)] if ins.operands[0] == 1 or self.cfg.is_main else []
+        return []
+
+    def __read_variable(self, ins: IRInstruction) -> Variable | None:
+        match ins.opcode:
+            case OpCode.OpGetLocal:
+                return ("L", ins.operands[0])
+            case OpCode.OpGetGlobal:
+                return ("G", ins.operands[0]) if self.cfg.is_main else None
+            case OpCode.OpRangeTest | OpCode.OpRangeStep:
+                return self.__counter(ins) if ins.operands[0] == 1 or self.cfg.is_main else None
+        return None
+
+    def __counter(self, ins: IRInstruction) -> Variable:
+        """ The counter variable of an OpRangeTest / OpRangeStep """
+        return ("L" if ins.operands[0] == 1 else "G", ins.operands[1])
+
+    def __build(self):
+        blocks: list[BasicBlock] = [b for b in self.cfg.blocks if b in self.idom]
+        entry: BasicBlock = self.cfg.entry()
+
+        variables: set[Variable] = {("L", i) for i in range(self.cfg.num_locals)}
+        def_blocks: dict[Variable, set[BasicBlock]] = {}
+        for block in blocks:
+            for ins in block.instructions:
+                for var in self.__defined_variables(ins):
+                    def_blocks.setdefault(var, set()).add(block)
+                    variables.add(var)
+
+                read: Variable | None = self.__read_variable(ins)
+                if read is not None:
+                    variables.add(read)
+
+        for var in sorted(variables):
+            self.entry_values[var] = self.__new_value(V_ENTRY, var, entry)
+
+        # Phi placement
+        frontiers = self.cfg.dominance_frontiers(self.idom)
+        for var, defined_in in sorted(def_blocks.items()):
+            work: list[BasicBlock] = list(defined_in)
+            placed: set[BasicBlock] = set()
+            while len(work) > 0:
+                block = work.pop()
+                for frontier in frontiers[block]:
+                    if frontier in placed:
+                        continue
+
+                    placed.add(frontier)
+                    self.phis.setdefault(frontier, {})[var] = self.__new_value(V_PHI, var, frontier)
+                    if frontier not in defined_in:
+                        work.append(frontier)
+
+        # Renaming, walking the dominator tree from the entry
+        children: dict[BasicBlock, list[BasicBlock]] = {b: [] for b in blocks}
+        for block, dom in self.idom.items():
+            if block is not entry:
+                children[dom].append(block)
+
+        current: dict[Variable, SSAValue] = dict(self.entry_values)
+        stack: list[tuple[BasicBlock, dict[Variable, SSAValue] | None]] = [(entry, None)]
+        while len(stack) > 0:
+            block, saved = stack.pop()
+            if saved is not None:
+                current = saved
+                continue
+
+            saved_state: dict[Variable, SSAValue] = dict(current)
+
+            for var, phi in self.phis.get(block, {}).items():
+                if block is entry:
+                    phi.operands[None] = current[var]
+                current[var] = phi
+
+            for ins in block.instructions:
+                read = self.__read_variable(ins)
+                if read is not None:
+                    self.reads[ins] = current[read]
+
+                for var in self.__defined_variables(ins):
+                    kind: str = V_CLOBBER if ins.opcode == OpCode.OpCall else V_STORE
+                    value = self.__new_value(kind, var, block, ins)
+                    if ins.opcode in (OpCode.OpSetLocal, OpCode.OpSetGlobal):
+                        self.writes[ins] = value
+                    current[var] = value
+
+            for succ in block.successors():
+                for var, phi in self.phis.get(succ, {}).items():
+                    phi.operands[block] = current[var]
+
+            stack.append((block, saved_state))
+            for child in reversed(children[block]):
+                stack.append((child, None))
+    # endregion
+
+    # region Queries
+    def live_values(self) -> set[SSAValue]:
+        """ Values some instruction reads, directly or through phis """
+        live: set[SSAValue] = set()
+        work: list[SSAValue] = list(self.reads.values())
+        while len(work) > 0:
+            value = work.pop()
+            if value in live:
+                continue
+
+            live.add(value)
+            if value.kind == V_PHI:
+                work += list(value.operands.values())
+
+        return live
+    # endregion
@@ -0,0 +1,238 @@
+from models.Code import OpCode
+from models.IR import ControlFlowGraph, BasicBlock, IRInstruction
+from models.Object import T_INTEGER_OBJ, T_FLOAT_OBJ, T_BOOL_OBJ, T_NULL_OBJ, T_STRING_OBJ, T_ARRAY_OBJ, T_HASH_OBJ
+from models.Object import T_CLOSURE_OBJ, T_BUILTIN_OBJ
+from models.Builtins import Builtin_Functions
+from exec.SSA import Variable
+
+# Nothing is known about the value
+T_ANY = "ANY"
+
+NUMBER_TYPES: set[str] = {T_INTEGER_OBJ, T_FLOAT_OBJ}
+
+# Generic operator -> its variant for integer / float / string operands
+INTEGER_OPCODES: dict[OpCode, OpCode] = {
+    OpCode.OpAdd: OpCode.OpAddInt, OpCode.OpSub: OpCode.OpSubInt, OpCode.OpMul: OpCode.OpMulInt, OpCode.OpDiv: OpCode.OpDivInt
+}
+FLOAT_OPCODES: dict[OpCode, OpCode] = {
+    OpCode.OpAdd: OpCode.OpAddFloat, OpCode.OpSub: OpCode.OpSubFloat, OpCode.OpMul: OpCode.OpMulFloat, OpCode.OpDiv: OpCode.OpDivFloat
+}
+STRING_OPCODES: dict[OpCode, OpCode] = {OpCode.OpAdd: OpCode.OpAddString}
+NUMBER_COMPARISON_OPCODES: dict[OpCode, OpCode] = {
+    OpCode.OpEqual: OpCode.OpEqualNumber, OpCode.OpNotEqual: OpCode.OpNotEqualNumber, OpCode.OpGreaterThan: OpCode.OpGreaterThanNumber
+}
+
+# Generic operator -> its variant that only checks for integer operands, for types known from a profile
+CHECKED_INTEGER_OPCODES: dict[OpCode, OpCode] = {
+    OpCode.OpAdd: OpCode.OpAddIntChecked, OpCode.OpSub: OpCode.OpSubIntChecked, OpCode.OpMul: OpCode.OpMulIntChecked,
+    OpCode.OpDiv: OpCode.OpDivIntChecked, OpCode.OpGreaterThan: OpCode.OpGreaterThanIntChecked
+}
+GENERIC_OPCODES: dict[OpCode, OpCode] = {checked: generic for generic, checked in CHECKED_INTEGER_OPCODES.items()}
+
+
+def builtin_type(index: int) -> str:
+    """ Builtins are tracked by name so calls to them can be typed """
+    return f"{T_BUILTIN_OBJ}:{Builtin_Functions[index].name}"
+
+def builtin_result_type(callee: str, args: list[str]) -> str:
+    match callee.removeprefix(f"{T_BUILTIN_OBJ}:"):
+        case "len":
+            # Anything else makes `len` return an error
+            if len(args) == 1 and args[0] in (T_ARRAY_OBJ, T_STRING_OBJ):
+                return T_INTEGER_OBJ
+    return T_ANY
+
+def arithmetic_result_type(op: OpCode, left: str, right: str) -> str:
+    """ Mirrors the dispatch in VM.execute_binary_operation """
+    if left == T_INTEGER_OBJ and right == T_INTEGER_OBJ:
+        return T_INTEGER_OBJ
+    elif left in NUMBER_TYPES and right in NUMBER_TYPES:
+        return T_FLOAT_OBJ
+    elif op == OpCode.OpAdd and left == T_STRING_OBJ and right == T_STRING_OBJ:
+        return T_STRING_OBJ
+    return T_ANY
+
+def specialized_opcode(op: OpCode, operands: list[str]) -> OpCode | None:
+    """ The variant of `op` that needs no type checks for these operand types, if there is one """
+    if len(operands) != 2:
+        return None
+
+    left, right = operands
+    if left == T_INTEGER_OBJ and right == T_INTEGER_OBJ and op in INTEGER_OPCODES:
+        return INTEGER_OPCODES[op]
+    elif left in NUMBER_TYPES and right in NUMBER_TYPES:
+        if op in FLOAT_OPCODES:
+            return FLOAT_OPCODES[op]
+        return NUMBER_COMPARISON_OPCODES.get(op)
+    elif left == T_STRING_OBJ and right == T_STRING_OBJ:
+        return STRING_OPCODES.get(op)
+    return None
+
+def join(a: str, b: str) -> str:
+    return a if a == b else T_ANY
+
+
+class TypeState:
+    """ The types on the VM stack and in the variable slots at one point of a function """
+    def __init__(self, stack: list[str], variables: dict[Variable, str]) -> None:
+        self.stack: list[str] = stack
+        self.variables: dict[Variable, str] = variables
+
+    def copy(self) -> "TypeState":
+        return TypeState(list(self.stack), dict(self.variables))
+
+    def pop(self, n: int = 1) -> list[str]:
+        popped: list[str] = []
+        for _ in range(n):
+            popped.insert(0, self.stack.pop() if len(self.stack) > 0 else T_ANY)
+        return popped
+
+    def push(self, t: str) -> None:
+        self.stack.append(t)
+
+    def variable(self, var: Variable) -> str:
+        return self.variables.get(var, T_ANY)
+
+    def merge(self, other: "TypeState") -> bool:
+        """ Joins `other` into this state, returns whether anything changed """
+        changed: bool = False
+
+        if len(self.stack) != len(other.stack):
+            depth: int = min(len(self.stack), len(other.stack))
+            self.stack = [T_ANY] * depth
+            changed = True
+
+        for i, t in enumerate(other.stack[:len(self.stack)]):
+            joined: str = join(self.stack[i], t)
+            if joined != self.stack[i]:
+                self.stack[i] = joined
+                changed = True
+
+        for var in set(self.variables) | set(other.variables):
+            joined: str = join(self.variable(var), other.variable(var))
+            if joined != self.variable(var):
+                self.variables[var] = joined
+                changed = True
+
+        return changed
+
+
+class TypeInference:
+    """ Flow-sensitive inference of the types of the operands of every instruction of a ControlFlowGraph.
+
+    The VM stack and the variable slots (locals, and in the main program globals) are simulated block by
+    block and merged at joins until nothing changes. `operand_types` then holds, for each reachable
+    instruction, the types of the values it pops.
+    """
+    def __init__(self, cfg: ControlFlowGraph) -> None:
+        self.cfg: ControlFlowGraph = cfg
+
+        self.operand_types: dict[IRInstruction, list[str]] = {}
+
+        # Set when an instruction with an unknown stack effect shows up, nothing is proven then
+        self.failed: bool = False
+
+        self.__infer()
+
+    def __infer(self) -> None:
+        entry: BasicBlock = self.cfg.entry()
+
+        states: dict[BasicBlock, TypeState] = {entry: TypeState([], {})}
+        work: list[BasicBlock] = [entry]
+        while len(work) > 0 and not self.failed:
+            block: BasicBlock = work.pop()
+
+            state: TypeState = states[block].copy()
+            for ins in block.instructions:
+                self.__step(ins, state)
+
+            for succ in block.successors():
+                if succ not in states:
+                    states[succ] = state.copy()
+                    work.append(succ)
+                elif states[succ].merge(state) and succ not in work:
+                    work.append(succ)
+
+        if self.failed:
+            self.operand_types = {}
+
+    def __step(self, ins: IRInstruction, state: TypeState) -> None:
+        match ins.opcode:
+            case OpCode.OpConstant | OpCode.OpCopyConstant:
+                state.push(self.cfg.constants[ins.operands[0]].type())
+            case OpCode.OpTrue | OpCode.OpFalse:
+                state.push(T_BOOL_OBJ)
+            case OpCode.OpNull:
+                state.push(T_NULL_OBJ)
+            case OpCode.OpAdd | OpCode.OpSub | OpCode.OpMul | OpCode.OpDiv:
+                left, right = self.__operands(ins, state, 2)
+                state.push(arithmetic_result_type(ins.opcode, left, right))
+            case OpCode.OpAddIntChecked | OpCode.OpSubIntChecked | OpCode.OpMulIntChecked | OpCode.OpDivIntChecked:
+                left, right = self.__operands(ins, state, 2)
+                state.push(arithmetic_result_type(GENERIC_OPCODES[ins.opcode], left, right))
+            case OpCode.OpAddInt | OpCode.OpSubInt | OpCode.OpMulInt | OpCode.OpDivInt:
+                self.__operands(ins, state, 2)
+                state.push(T_INTEGER_OBJ)
+            case OpCode.OpAddFloat | OpCode.OpSubFloat | OpCode.OpMulFloat | OpCode.OpDivFloat:
+                self.__operands(ins, state, 2)
+                state.push(T_FLOAT_OBJ)
+            case OpCode.OpAddString:
+                self.__operands(ins, state, 2)
+                state.push(T_STRING_OBJ)
+            case OpCode.OpEqual | OpCode.OpNotEqual | OpCode.OpGreaterThan | OpCode.OpGreaterThanEqual | OpCode.OpEqualNumber | OpCode.OpNotEqualNumber | OpCode.OpGreaterThanNumber | OpCode.OpGreaterThanIntChecked:
+                self.__operands(ins, state, 2)
+                state.push(T_BOOL_OBJ)
+            case OpCode.OpMinus:
+                operand, = self.__operands(ins, state, 1)
+                state.push(operand if operand in NUMBER_TYPES else T_ANY)
+            case OpCode.OpBang:
+                self.__operands(ins, state, 1)
+                state.push(T_BOOL_OBJ)
+            case OpCode.OpPop | OpCode.OpJumpNotTruthy | OpCode.OpReturnValue | OpCode.OpMatch:
+                self.__operands(ins, state, 1)
+            case OpCode.OpJump | OpCode.OpLoop | OpCode.OpReturn | OpCode.OpRangeTest:
+                pass
+            case OpCode.OpRangeStep:
+                if ins.operands[0] == 1 or self.cfg.is_main:
+                    state.variables[("L" if ins.operands[0] == 1 else "G", ins.operands[1])] = T_INTEGER_OBJ
+            case OpCode.OpGetLocal:
+                state.push(state.variable(("L", ins.operands[0])))
+            case OpCode.OpSetLocal:
+                state.variables[("L", ins.operands[0])], = self.__operands(ins, state, 1)
+            case OpCode.OpGetGlobal:
+                state.push(state.variable(("G", ins.operands[0])) if self.cfg.is_main else T_ANY)
+            case OpCode.OpSetGlobal:
+                value, = self.__operands(ins, state, 1)
+                if self.cfg.is_main:
+                    state.variables[("G", ins.operands[0])] = value
+            case OpCode.OpArray:
+                self.__operands(ins, state, ins.operands[0])
+                state.push(T_ARRAY_OBJ)
+            case OpCode.OpHash:
+                self.__operands(ins, state, ins.operands[0])
+                state.push(T_HASH_OBJ)
+            case OpCode.OpIndex:
+                self.__operands(ins, state, 2)
+                state.push(T_ANY)
+            case OpCode.OpCall:
+                callee, *args = self.__operands(ins, state, ins.operands[0] + 1)
+                if self.cfg.is_main:
+                    for g in self.cfg.clobbered_globals:
+                        state.variables[("G", g)] = T_ANY
+                state.push(builtin_result_type(callee, args))
+            case OpCode.OpGetBuiltin:
+                state.push(builtin_type(ins.operands[0]))
+            case OpCode.OpClosure:
+                self.__operands(ins, state, ins.operands[1])
+                state.push(T_CLOSURE_OBJ)
+            case OpCode.OpGetFree:
+                state.push(T_ANY)
+            case OpCode.OpCurrentClosure:
+                state.push(T_CLOSURE_OBJ)
+            case _:
+                self.failed = True
+
+    def __operands(self, ins: IRInstruction, state: TypeState, n: int) -> list[str]:
+        popped: list[str] = state.pop(n)
+        self.operand_types[ins] = popped
+        return popped
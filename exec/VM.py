@@ -1,11 +1,12 @@
 from exec.Compiler import Bytecode
 from models.Stack import VMStack, FrameStack
-from models.Code import Instructions, OpCode, read_uint16, read_uint8
+from models.Code import Instructions, OpCode, read_uint16, read_uint8, read_operands, definitions, WIDE_OPERAND_WIDTH
 from models.Object import Object, IntegerObject, FloatObject, BooleanObject, NullObject, StringObject, ArrayObject, HashObject, ClosureObject
-from models.Object import HashKey, HashPair, Hashable, CompiledFunction
+from models.Object import HashKey, HashPair, Hashable, CompiledFunction, LazyFunction
 from models.Object import T_INTEGER_OBJ, T_FLOAT_OBJ, T_STRING_OBJ, T_ARRAY_OBJ, T_HASH_OBJ
 from models.Builtins import Builtin_Functions, Builtin
 from models.Frame import Frame
+from models.Profile import Profile
 from exec.Lexer import Lexer
 from exec.Parser import Parser
 from exec.Compiler import Compiler
@@ -14,17 +15,35 @@ TRUE_OBJ = BooleanObject(value=True)
 FALSE_OBJ = BooleanObject(value=False)
 NULL_OBJ = NullObject()
 
+def value_size(obj: Object) -> int:
+    """ The characters of a string or bytes of an integer, the values an instruction can double the size of """
+    if type(obj) is StringObject:
+        return len(obj.value)
+    if type(obj) is IntegerObject and type(obj.value) is int:
+        return (obj.value.bit_length() + 7) // 8
+    return 0
+
 class VM:
-    def __init__(self, bytecode: Bytecode, globs: list[Object] = None, debug: bool = False) -> None:
+    def __init__(self, bytecode: Bytecode, globs: list[Object] = None, debug: bool = False, profile: Profile = None, budget: int = None, max_size: int = None) -> None:
         self.debug: bool = debug
 
+        # How many more instructions may run, unlimited when None (the Compiler evaluates calls with a budget)
+        self.budget: int | None = budget
+
+        # Largest value_size an instruction may produce, unlimited when None. Collections only grow by what
+        # an instruction pushes, so strings and integers are the ones that could fill the memory
+        self.max_size: int | None = max_size
+
+        # Filled in while running when given, for the Compiler of the next build
+        self.profile: Profile | None = profile
+
         self.constants: list[Object] = bytecode.constants
 
         self.stack: VMStack = VMStack()
 
         self.globals: list[Object] = [] if globs is None else globs
 
-        main_fn: CompiledFunction = CompiledFunction(instructions=bytecode.instructions)
+        main_fn: CompiledFunction = CompiledFunction(instructions=bytecode.instructions, sites=bytecode.sites)
         main_closure: ClosureObject = ClosureObject(fn=main_fn)
         main_frame: Frame = Frame(cl=main_closure, base_pointer=0)
 
@@ -45,6 +64,18 @@ class VM:
 
             if self.debug:
                 print(f"Stack ({str(op).replace('OpCode.', '')}) -> {[i.inspect() if i is not None else i for i in self.stack.items[0:10]]}")
+
+            if self.profile is not None:
+                self.record_profile(op, ins, ip)
+
+            if self.budget is not None:
+                self.budget -= 1
+                if self.budget < 0:
+                    return "Instruction budget exhausted"
+
+            # Checks what the previous instruction pushed, which is at most twice the size of its operands
+            if self.max_size is not None and value_size(self.stack.top()) > self.max_size:
+                return "Value size limit exceeded"
             
             match op:
                 case OpCode.OpConstant:
@@ -54,6 +85,13 @@ class VM:
                     err = self.push(self.constants[const_index])
                     if err is not None:
                         return err
+                case OpCode.OpCopyConstant:
+                    const_index: int = read_uint16(ins[ip + 1:])
+                    self.current_frame().ip += 2
+
+                    err = self.push(self.copy_collection(self.constants[const_index]))
+                    if err is not None:
+                        return err
                 case OpCode.OpAdd:
                     err = self.execute_binary_operation(op)
                     if err is not None:
@@ -118,10 +156,7 @@ class VM:
                     global_index: int = read_uint16(ins[ip + 1:])
                     self.current_frame().ip += 2
 
-                    if global_index <= len(self.globals) - 1:
-                        self.globals[global_index] = self.pop()
-                    else:
-                        self.globals.append(self.pop())
+                    self.set_global(global_index)
                 case OpCode.OpGetGlobal:
                     global_index: int = read_uint16(ins[ip + 1:])
                     self.current_frame().ip += 2
@@ -133,23 +168,14 @@ class VM:
                     num_elements: int = read_uint16(ins[ip + 1:])
                     self.current_frame().ip += 2
 
-                    array = self.build_array(self.stack.sp - num_elements, self.stack.sp)
-                    self.stack.sp = self.stack.sp - num_elements
-
-                    err = self.push(array)
+                    err = self.push_array(num_elements)
                     if err is not None:
                         return err
                 case OpCode.OpHash:
                     num_elements: int = read_uint16(ins[ip + 1:])
                     self.current_frame().ip += 2
 
-                    h, err = self.build_hash(self.stack.sp - num_elements, self.stack.sp)
-                    if err is not None:
-                        return err
-                    
-                    self.stack.sp = self.stack.sp - num_elements
-
-                    err = self.push(h)
+                    err = self.push_hash(num_elements)
                     if err is not None:
                         return err
                 case OpCode.OpIndex:
@@ -235,6 +261,203 @@ class VM:
                 case OpCode.OpLoop:
                     start_loop_offset: int = read_uint16(ins[ip + 1:])
                     self.current_frame().ip -= start_loop_offset
+                case OpCode.OpRangeTest:
+                    is_local: int = read_uint8(ins[ip + 1:])
+                    counter_index: int = read_uint16(ins[ip + 2:])
+                    pos: int = read_uint16(ins[ip + 4:])
+                    self.current_frame().ip += 5
+
+                    err = self.range_test(is_local, counter_index, pos)
+                    if err is not None:
+                        return err
+                case OpCode.OpRangeStep:
+                    is_local: int = read_uint8(ins[ip + 1:])
+                    counter_index: int = read_uint16(ins[ip + 2:])
+                    step: int = read_uint16(ins[ip + 4:])
+                    pos: int = read_uint16(ins[ip + 6:])
+
+                    self.range_step(is_local, counter_index, step, pos)
+                case OpCode.OpMatch:
+                    const_index: int = read_uint16(ins[ip + 1:])
+                    pos: int = read_uint16(ins[ip + 3:])
+                    self.current_frame().ip += 4
+
+                    self.match(const_index, pos)
+
+                # The Compiler proved the operand types, so none are checked here
+                case OpCode.OpAddInt:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(IntegerObject(value=left.value + right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpSubInt:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(IntegerObject(value=left.value - right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpMulInt:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(IntegerObject(value=left.value * right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpDivInt:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(IntegerObject(value=left.value / right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpAddFloat:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(FloatObject(value=left.value + right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpSubFloat:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(FloatObject(value=left.value - right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpMulFloat:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(FloatObject(value=left.value * right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpDivFloat:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(FloatObject(value=left.value / right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpAddString:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(StringObject(value=left.value + right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpEqualNumber:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(self.native_bool_to_boolean_obj(left.value == right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpNotEqualNumber:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(self.native_bool_to_boolean_obj(left.value != right.value))
+                    if err is not None:
+                        return err
+                case OpCode.OpGreaterThanNumber:
+                    right = self.pop()
+                    left = self.pop()
+
+                    err = self.push(self.native_bool_to_boolean_obj(left.value > right.value))
+                    if err is not None:
+                        return err
+
+                # Chosen from a profile, only the integer case is fast
+                case OpCode.OpAddIntChecked:
+                    right = self.pop()
+                    left = self.pop()
+
+                    if type(left) is IntegerObject and type(right) is IntegerObject:
+                        err = self.push(IntegerObject(value=left.value + right.value))
+                    else:
+                        err = self.execute_unchecked_operation(OpCode.OpAdd, left, right)
+                    if err is not None:
+                        return err
+                case OpCode.OpSubIntChecked:
+                    right = self.pop()
+                    left = self.pop()
+
+                    if type(left) is IntegerObject and type(right) is IntegerObject:
+                        err = self.push(IntegerObject(value=left.value - right.value))
+                    else:
+                        err = self.execute_unchecked_operation(OpCode.OpSub, left, right)
+                    if err is not None:
+                        return err
+                case OpCode.OpMulIntChecked:
+                    right = self.pop()
+                    left = self.pop()
+
+                    if type(left) is IntegerObject and type(right) is IntegerObject:
+                        err = self.push(IntegerObject(value=left.value * right.value))
+                    else:
+                        err = self.execute_unchecked_operation(OpCode.OpMul, left, right)
+                    if err is not None:
+                        return err
+                case OpCode.OpDivIntChecked:
+                    right = self.pop()
+                    left = self.pop()
+
+                    if type(left) is IntegerObject and type(right) is IntegerObject:
+                        err = self.push(IntegerObject(value=left.value / right.value))
+                    else:
+                        err = self.execute_unchecked_operation(OpCode.OpDiv, left, right)
+                    if err is not None:
+                        return err
+                case OpCode.OpGreaterThanIntChecked:
+                    right = self.pop()
+                    left = self.pop()
+
+                    if type(left) is IntegerObject and type(right) is IntegerObject:
+                        err = self.push(self.native_bool_to_boolean_obj(left.value > right.value))
+                    else:
+                        err = self.execute_unchecked_operation(OpCode.OpGreaterThan, left, right)
+                    if err is not None:
+                        return err
+
+                case OpCode.OpWide:
+                    err = self.execute_wide(ins, ip)
+                    if err is not None:
+                        return err
+
+                # The compact encoding's one-byte operand forms
+                case OpCode.OpConstantShort:
+                    const_index: int = ins[ip + 1]
+                    self.current_frame().ip += 1
+
+                    err = self.push(self.constants[const_index])
+                    if err is not None:
+                        return err
+                case OpCode.OpGetGlobalShort:
+                    global_index: int = ins[ip + 1]
+                    self.current_frame().ip += 1
+
+                    err = self.push(self.globals[global_index])
+                    if err is not None:
+                        return err
+                case OpCode.OpSetGlobalShort:
+                    global_index: int = ins[ip + 1]
+                    self.current_frame().ip += 1
+
+                    self.set_global(global_index)
+                case OpCode.OpJumpShort:
+                    self.current_frame().ip = ins[ip + 1] - 1
+                case OpCode.OpJumpNotTruthyShort:
+                    pos: int = ins[ip + 1]
+                    self.current_frame().ip += 1
+
+                    condition = self.pop()
+                    if not self.is_truthy(condition):
+                        self.current_frame().ip = pos - 1
+                case OpCode.OpLoopShort:
+                    self.current_frame().ip -= ins[ip + 1]
 
 
     
@@ -262,15 +485,15 @@ class VM:
     def current_frame(self) -> Frame:
         return self.frames.items[self.frames.fp - 1]
     
-    def push_frame(self, f: Frame):
-        self.frames.push(f)
+    def push_frame(self, f: Frame) -> str:
+        return self.frames.push(f)
     
     def pop_frame(self) -> Frame:
         return self.frames.pop()
     
     def push_closure(self, const_index: int, num_free: int) -> str:
         constant = self.constants[const_index]
-        if not isinstance(constant, CompiledFunction):
+        if not isinstance(constant, (CompiledFunction, LazyFunction)):
             return f"Not a function: {constant}"
         
         free: list[Object] = [None] * num_free
@@ -285,11 +508,23 @@ class VM:
 
     # region Function Helpers
     def call_closure(self, cl: ClosureObject, num_args: int) -> str:
+        # A function of a lazily parsed file is compiled on its first call, every closure over it shares that
+        if isinstance(cl.fn, LazyFunction):
+            fn, err = cl.fn.compile()
+            if err is not None:
+                return err
+            cl.fn = fn
+
         if not num_args == cl.fn.num_parameters:
             return f"Wrong number of arguments: want={cl.fn.num_parameters}, got={num_args}"
         
         frame: Frame = Frame(cl=cl, base_pointer=self.stack.sp - num_args)
-        self.push_frame(frame)
+        if frame.base_pointer + cl.fn.num_locals > self.stack.STACK_SIZE:
+            return "Stack Overflow."
+
+        err = self.push_frame(frame)
+        if err is not None:
+            return err
 
         self.stack.sp = frame.base_pointer + cl.fn.num_locals
 
@@ -305,6 +540,138 @@ class VM:
             self.push(NULL_OBJ)
     # endregion
 
+    # region Operand Helpers
+    # Shared by the run loop and execute_wide, which only differ in how they read the operands
+    def set_global(self, global_index: int):
+        # Globals defined on a branch that never ran leave gaps behind
+        if global_index >= len(self.globals):
+            self.globals.extend([None] * (global_index - len(self.globals) + 1))
+
+        self.globals[global_index] = self.pop()
+
+    def push_array(self, num_elements: int) -> str:
+        array = self.build_array(self.stack.sp - num_elements, self.stack.sp)
+        self.stack.sp = self.stack.sp - num_elements
+
+        return self.push(array)
+
+    def push_hash(self, num_elements: int) -> str:
+        h, err = self.build_hash(self.stack.sp - num_elements, self.stack.sp)
+        if err is not None:
+            return err
+
+        self.stack.sp = self.stack.sp - num_elements
+
+        return self.push(h)
+
+    def range_test(self, is_local: int, counter_index: int, pos: int) -> str:
+        # The limit stays on the stack for the whole loop
+        limit = self.stack.items[self.stack.sp - 1]
+        if limit.type() not in [T_INTEGER_OBJ, T_FLOAT_OBJ]:
+            return f"Unknown Comparison Operator: {OpCode.OpGreaterThan} ({limit.type()}, {T_INTEGER_OBJ})"
+
+        counter = self.stack.items[self.current_frame().base_pointer + counter_index] if is_local else self.globals[counter_index]
+        if not counter.value < limit.value:
+            self.current_frame().ip = pos - 1
+
+    def range_step(self, is_local: int, counter_index: int, step: int, pos: int):
+        if is_local:
+            slot: int = self.current_frame().base_pointer + counter_index
+            self.stack.items[slot] = IntegerObject(value=self.stack.items[slot].value + step)
+        else:
+            self.globals[counter_index] = IntegerObject(value=self.globals[counter_index].value + step)
+
+        self.current_frame().ip = pos - 1
+
+    def match(self, const_index: int, pos: int):
+        subject = self.pop()
+        if isinstance(subject, Hashable):
+            pos = self.constants[const_index].targets.get(subject.hash_key(), pos)
+        self.current_frame().ip = pos - 1
+
+    def execute_wide(self, ins: Instructions, ip: int) -> str:
+        """ Runs the instruction behind the OpWide at `ip`, all of its operands are WIDE_OPERAND_WIDTH bytes """
+        op: OpCode = OpCode(ins[ip + 1])
+        operands, read = read_operands(definitions[op], ins[ip + 2:], wide=True)
+        self.current_frame().ip += 1 + read
+
+        frame = self.current_frame()
+        match op:
+            case OpCode.OpConstant:
+                return self.push(self.constants[operands[0]])
+            case OpCode.OpCopyConstant:
+                return self.push(self.copy_collection(self.constants[operands[0]]))
+            case OpCode.OpJump:
+                frame.ip = operands[0] - 1
+            case OpCode.OpJumpNotTruthy:
+                if not self.is_truthy(self.pop()):
+                    frame.ip = operands[0] - 1
+            case OpCode.OpLoop:
+                # Relative to the OpWide
+                frame.ip = ip - operands[0]
+            case OpCode.OpSetGlobal:
+                self.set_global(operands[0])
+            case OpCode.OpGetGlobal:
+                return self.push(self.globals[operands[0]])
+            case OpCode.OpArray:
+                return self.push_array(operands[0])
+            case OpCode.OpHash:
+                return self.push_hash(operands[0])
+            case OpCode.OpCall:
+                return self.execute_call(operands[0])
+            case OpCode.OpSetLocal:
+                self.stack.items[frame.base_pointer + operands[0]] = self.pop()
+            case OpCode.OpGetLocal:
+                return self.push(self.stack.items[frame.base_pointer + operands[0]])
+            case OpCode.OpGetBuiltin:
+                return self.push(Builtin_Functions[operands[0]].builtin)
+            case OpCode.OpClosure:
+                return self.push_closure(operands[0], operands[1])
+            case OpCode.OpGetFree:
+                return self.push(frame.cl.free[operands[0]])
+            case OpCode.OpRangeTest:
+                return self.range_test(*operands)
+            case OpCode.OpRangeStep:
+                self.range_step(*operands)
+            case OpCode.OpMatch:
+                self.match(*operands)
+            case _:
+                return f"Opcode {op} has no wide form"
+    # endregion
+
+    # region Profiling Helpers
+    def record_profile(self, op: OpCode, ins: Instructions, ip: int):
+        num_args: int = None
+        if op == OpCode.OpWide:
+            op = OpCode(ins[ip + 1])
+            num_args = int.from_bytes(ins[ip + 2:ip + 2 + WIDE_OPERAND_WIDTH], "big")
+
+        if op == OpCode.OpCall:
+            if num_args is None:
+                num_args = read_uint8(ins[ip + 1:])
+
+            callee = self.stack.items[self.stack.sp - 1 - num_args]
+            if isinstance(callee, ClosureObject) and callee.fn.site is not None:
+                self.profile.record_call(callee.fn.site)
+            return
+
+        site: int | None = self.current_frame().cl.fn.sites.get(ip)
+        if site is None:
+            return
+
+        match op:
+            case OpCode.OpJumpNotTruthy | OpCode.OpJumpNotTruthyShort:
+                self.profile.record_branch(site, self.is_truthy(self.stack.items[self.stack.sp - 1]))
+            case OpCode.OpLoop | OpCode.OpLoopShort | OpCode.OpRangeStep:
+                self.profile.record_loop(site)
+            case OpCode.OpRangeTest:
+                pass
+            case _:
+                left = self.stack.items[self.stack.sp - 2]
+                right = self.stack.items[self.stack.sp - 1]
+                self.profile.record_types(site, left.type(), right.type())
+    # endregion
+
     # region VM Builder Helpers
     def build_array(self, start_index: int, end_index: int) -> Object:
         elements: list[Object] = [None] * (end_index - start_index)
@@ -313,6 +680,16 @@ class VM:
         
         return ArrayObject(elements=elements)
 
+    def copy_collection(self, obj: Object) -> Object:
+        """ A copy of a prebuilt array / hash constant, nested ones included. Hash keys are reused as they are """
+        match obj.type():
+            case "ARRAY":
+                return ArrayObject(elements=[self.copy_collection(el) for el in obj.elements])
+            case "HASH":
+                return HashObject(pairs={k: HashPair(key=p.key, value=self.copy_collection(p.value)) for k, p in obj.pairs.items()})
+            case _:
+                return obj
+
     def build_hash(self, start_index: int, end_index: int) -> tuple[Object, str]:
         hashed_pairs: dict[HashKey, HashPair] = {}
 
@@ -365,6 +742,15 @@ class VM:
             case _:
                 return f"Unknown Comparison Operator: {op} ({left_node.type()}, {right_node.type()})"
 
+    def execute_unchecked_operation(self, op: OpCode, left: Object, right: Object) -> str:
+        """ The generic path for an integer fast path that met other types """
+        self.push(left)
+        self.push(right)
+
+        if op == OpCode.OpGreaterThan:
+            return self.execute_comparison(op)
+        return self.execute_binary_operation(op)
+
     def execute_bang_operator(self) -> str:
         operand = self.pop()
 
@@ -1,42 +1,171 @@
 from exec.Lexer import Lexer
 from exec.Parser import Parser
-from exec.Compiler import Compiler
+from exec.Compiler import Compiler, Bytecode, DEFAULT_SEARCH_PATH
 from exec.VM import VM
-from time import time
+from exec.PassManager import PassManager, DEFAULT_OPTIMIZATION_LEVEL, MAX_OPTIMIZATION_LEVEL
+from exec.BytecodeStats import BytecodeStats
+from exec.BytecodeCache import BytecodeCache
+from exec.Builder import Builder
+from exec.Repl import Repl
+from models.Profile import Profile
+from hashlib import sha256
+from time import time, sleep
+from argparse import ArgumentParser
+import os
 
 DEBUG: bool = False
 
+# Seconds between two looks at the mtimes of the watched files
+WATCH_INTERVAL: float = 0.25
+
+def parse_args():
+    arg_parser = ArgumentParser(description="Run a Lime program")
+    arg_parser.add_argument("file", nargs="?", default="debug/test.lime", help="Path to the .lime file to run")
+    arg_parser.add_argument("-O", dest="level", type=int, default=DEFAULT_OPTIMIZATION_LEVEL, choices=range(0, MAX_OPTIMIZATION_LEVEL + 1), help="Optimization level")
+    arg_parser.add_argument("--enable-pass", action="append", default=[], metavar="NAME", help="Run an optimization pass regardless of the level")
+    arg_parser.add_argument("--disable-pass", action="append", default=[], metavar="NAME", help="Skip an optimization pass regardless of the level")
+    arg_parser.add_argument("--report-passes", action="store_true", help="Print which optimization passes ran and how long they took")
+    arg_parser.add_argument("--report-bytecode", action="store_true", help="Print opcode frequencies and the size of every function")
+    arg_parser.add_argument("-j", "--jobs", type=int, metavar="N", help="Compile the file and each file it imports on their own, in N processes")
+    arg_parser.add_argument("--repl", action="store_true", help="Evaluate input line by line instead of running a file")
+    arg_parser.add_argument("--watch", action="store_true", help="Run again whenever the file or a file it imports changes, only recompiling what changed")
+    arg_parser.add_argument("--lazy", action="store_true", help="Only parse and compile function bodies when they are first called")
+    arg_parser.add_argument("-I", dest="search_path", action="append", default=[], metavar="DIR", help="Also look for imports in DIR, before the default search path")
+    arg_parser.add_argument("--cache-dir", metavar="PATH", help="Where compiled bytecode is cached (default: __limecache__ next to the file)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Always compile, neither reading nor writing the bytecode cache")
+    arg_parser.add_argument("--profile-out", metavar="PATH", help="Record a runtime profile of this run into PATH")
+    arg_parser.add_argument("--profile-in", metavar="PATH", help="Optimize using a profile recorded by an earlier run")
+    return arg_parser.parse_args()
+
+def watch(file: str, passes: PassManager, search_path: list[str], jobs: int = None) -> None:
+    """ Builds and runs `file`, then again after every change to it or a file it imports, until interrupted """
+    builder: Builder = Builder(passes=passes, search_path=search_path, jobs=jobs)
+    try:
+        while True:
+            st = time()
+            bytecode, err = builder.build(file)
+            if err is not None:
+                print(f"Compiler Error:\n {err}\n")
+            else:
+                bt = time()
+                machine: VM = VM(bytecode)
+                err = machine.run()
+                if err is not None:
+                    print(f"Runtime Error:\n {err}\n")
+                et = time()
+
+                print(f"\n== Compiled {len(builder.recompiled)} of {len(builder.files)} files in {round((bt - st) * 1000, 2)} ms, executed in {round((et - bt) * 1000, 2)} ms ==")
+
+            print(f"== Watching {len(builder.files)} files for changes ==")
+            while len(builder.changed_files()) == 0:
+                sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        return
+
 if __name__ == '__main__':
-    with open("debug/test.lime", "r") as f:
+    args = parse_args()
+
+    if args.repl:
+        passes: PassManager = PassManager(level=args.level, enabled=set(args.enable_pass), disabled=set(args.disable_pass))
+        Repl(passes=passes, search_path=[*args.search_path, *DEFAULT_SEARCH_PATH]).run()
+        exit(0)
+
+    if args.watch:
+        if args.lazy or args.profile_in is not None or args.profile_out is not None:
+            print("--watch can not be combined with --lazy or profiles")
+            exit(1)
+
+        passes: PassManager = PassManager(level=args.level, enabled=set(args.enable_pass), disabled=set(args.disable_pass))
+        watch(args.file, passes, [*args.search_path, *DEFAULT_SEARCH_PATH], jobs=args.jobs)
+        exit(0)
+
+    with open(args.file, "r") as f:
         code: str = f.read()
-    
-    l: Lexer = Lexer(source=code)
 
-    p: Parser = Parser(lexer=l)
+    source_hash: str = sha256(code.encode()).hexdigest()
 
-    st = time()
-    program = p.parse_program()
-    if len(p.errors) > 0:
-        for err in p.errors:
+    profile: Profile = None
+    if args.profile_in is not None:
+        profile, err = Profile.load(args.profile_in)
+        if err is not None:
             print(err)
-        exit(1)
+            exit(1)
 
-    if DEBUG:
-        for s in program.statements:
-            print(s.string())
-    
-    comp: Compiler = Compiler()
-    err = comp.compile(program)
-    if err is not None:
-        print(f"Compiler Error:\n {err}\n")
-        exit(1)
+        if profile.source_hash != source_hash:
+            print(f"Ignoring profile {args.profile_in}: it was recorded for a different version of {args.file}")
+            profile = None
     
-    machine: VM = VM(comp.bytecode())
+    passes: PassManager = PassManager(level=args.level, enabled=set(args.enable_pass), disabled=set(args.disable_pass))
+    search_path: list[str] = [*args.search_path, *DEFAULT_SEARCH_PATH]
+
+    # Profile guided and lazy builds depend on more than the sources, they are never cached
+    cache: BytecodeCache = None
+    if not args.no_cache and profile is None and not args.lazy:
+        cache_dir: str = args.cache_dir if args.cache_dir is not None else os.path.join(os.path.dirname(args.file), "__limecache__")
+        cache = BytecodeCache(cache_dir, search_path=search_path)
+
+    st = time()
+    bytecode: Bytecode = cache.load(args.file, code, passes) if cache is not None else None
+    if bytecode is None and args.jobs is not None:
+        if args.lazy or profile is not None:
+            print("-j can not be combined with --lazy or --profile-in")
+            exit(1)
+
+        builder: Builder = Builder(passes=passes, search_path=search_path, jobs=args.jobs)
+        bytecode, err = builder.build(args.file)
+        if err is not None:
+            print(f"Compiler Error:\n {err}\n")
+            exit(1)
+
+        if cache is not None:
+            err = cache.save(args.file, code, builder.import_sources, builder.import_paths, bytecode, passes)
+            if err is not None:
+                print(err)
+    elif bytecode is None:
+        l: Lexer = Lexer(source=code)
+
+        p: Parser = Parser(lexer=l, lazy=args.lazy)
+
+        program = p.parse_program()
+        if len(p.errors) > 0:
+            for err in p.errors:
+                print(err)
+            exit(1)
+
+        if DEBUG:
+            for s in program.statements:
+                print(s.string())
+
+        comp: Compiler = Compiler(passes=passes, profile=profile, lazy=args.lazy, path=args.file, search_path=search_path)
+        err = comp.compile(program)
+        if err is not None:
+            print(f"Compiler Error:\n {err}\n")
+            exit(1)
+        
+        bytecode = comp.bytecode()
+
+        if cache is not None:
+            err = cache.save(args.file, code, comp.import_sources, comp.import_paths, bytecode, passes)
+            if err is not None:
+                print(err)
+
+    if args.report_passes:
+        print(passes.report())
+
+    if args.report_bytecode:
+        print(BytecodeStats(bytecode).report())
+
+    recorded: Profile = Profile(source_hash=source_hash) if args.profile_out is not None else None
+
+    machine: VM = VM(bytecode, profile=recorded)
     err = machine.run()
     if err is not None:
         print(f"Runtime Error:\n {err}\n")
         exit(1)
     et = time()
+
+    if recorded is not None:
+        recorded.save(args.profile_out)
     execution_time = et - st
 
     if DEBUG:
@@ -156,6 +156,32 @@ class ReturnStatement(Statement):
     def type(self) -> str:
         return "ReturnStatement"
     
+class BreakStatement(Statement):
+    def __init__(self, token: Token) -> None:
+        self.token = token
+
+    def token_literal(self) -> str:
+        return self.token.literal
+
+    def string(self) -> str:
+        return "break;"
+
+    def type(self) -> str:
+        return "BreakStatement"
+
+class ContinueStatement(Statement):
+    def __init__(self, token: Token) -> None:
+        self.token = token
+
+    def token_literal(self) -> str:
+        return self.token.literal
+
+    def string(self) -> str:
+        return "continue;"
+
+    def type(self) -> str:
+        return "ContinueStatement"
+
 class WhileStatement(Statement):
     def __init__(self, token: Token, condition: Expression = None, body: BlockStatement = None) -> None:
         self.token = token
@@ -281,6 +307,26 @@ class IfExpression(Expression):
     def type(self) -> str:
         return "IfExpression"
     
+class MatchExpression(Expression):
+    def __init__(self, token: Token, subject: Expression = None, arms: list[tuple[list[Expression], BlockStatement]] = None, default: BlockStatement = None) -> None:
+        self.token = token
+        self.subject = subject
+        self.arms = arms if arms is not None else []
+        self.default = default
+
+    def token_literal(self) -> str:
+        return self.token.literal
+
+    def string(self) -> str:
+        arms: list[str] = [f"{', '.join(l.string() for l in labels)} => {body.string()}" for labels, body in self.arms]
+        if self.default is not None:
+            arms.append(f"_ => {self.default.string()}")
+
+        return f"match {self.subject.string()} {{ {', '.join(arms)} }}"
+
+    def type(self) -> str:
+        return "MatchExpression"
+
 class CallExpression(Expression):
     def __init__(self, token: Token, function: Expression = None, arguments: list[Expression] = None) -> None:
         self.token = token
@@ -445,13 +491,26 @@ class HashLiteral(Expression):
     def type(self) -> str:
         return "HashLiteral"
     
+class LazyBody:
+    """ The tokens of a function body that was only scanned, not parsed, see Parser(lazy=True) """
+    def __init__(self, tokens: list[Token], names: set[str], assigned: set[str]) -> None:
+        # From the opening to the closing brace
+        self.tokens: list[Token] = tokens
+
+        # Every identifier in the body, and the ones some `=` (not a `let`) assigns
+        self.names: set[str] = names
+        self.assigned: set[str] = assigned
+
 class FunctionLiteral(Expression):
-    def __init__(self, token: Token, parameters: list[IdentifierLiteral] = None, body: BlockStatement = None, name: str = "") -> None:
+    def __init__(self, token: Token, parameters: list[IdentifierLiteral] = None, body: BlockStatement = None, name: str = "", lazy_body: LazyBody = None) -> None:
         self.token = token
         self.parameters = parameters
         self.body = body
         self.name: str = name
 
+        # Set instead of `body` until the body is parsed
+        self.lazy_body: LazyBody | None = lazy_body
+
     def token_literal(self) -> str:
         return self.token.literal
     
@@ -469,7 +528,7 @@ class FunctionLiteral(Expression):
         output += ",".join(params)
         output += ") "
         output += "{ "
-        output += self.body.string()
+        output += self.body.string() if self.body is not None else "..."
         output += " }"
         
         return output
@@ -37,6 +37,48 @@ class OpCode(Enum):
     OpCurrentClosure = auto()
     OpLoop = auto()
 
+    # Type-specialized operators, only emitted where the operand types are proven
+    OpAddInt = auto()
+    OpSubInt = auto()
+    OpMulInt = auto()
+    OpDivInt = auto()
+    OpAddFloat = auto()
+    OpSubFloat = auto()
+    OpMulFloat = auto()
+    OpDivFloat = auto()
+    OpAddString = auto()
+    OpEqualNumber = auto()
+    OpNotEqualNumber = auto()
+    OpGreaterThanNumber = auto()
+
+    # Integer fast paths chosen from a profile, they fall back to the generic operator on other types
+    OpAddIntChecked = auto()
+    OpSubIntChecked = auto()
+    OpMulIntChecked = auto()
+    OpDivIntChecked = auto()
+    OpGreaterThanIntChecked = auto()
+
+    # Pushes a fresh copy of a prebuilt array / hash constant
+    OpCopyConstant = auto()
+
+    # Counted for loops: <is local> <counter index> [<step>] <jump target>
+    OpRangeTest = auto()
+    OpRangeStep = auto()
+
+    # Match dispatch: <jump table constant> <default target>
+    OpMatch = auto()
+
+    # Prefix for an instruction whose operands do not fit their usual widths, see `make`
+    OpWide = auto()
+
+    # One-byte operand forms for the compact encoding, see SHORT_OPCODES
+    OpConstantShort = auto()
+    OpGetGlobalShort = auto()
+    OpSetGlobalShort = auto()
+    OpJumpShort = auto()
+    OpJumpNotTruthyShort = auto()
+    OpLoopShort = auto()
+
 
 class Definition(NamedTuple):
     name: str
@@ -74,9 +116,50 @@ definitions: Dict[OpCode, Definition] = {
     OpCode.OpClosure: Definition("OpClosure", [2, 1]),
     OpCode.OpGetFree: Definition("OpGetFree", [1]),
     OpCode.OpCurrentClosure: Definition("OpCurrentClosure", []),
-    OpCode.OpLoop: Definition("OpLoop", [2])
+    OpCode.OpLoop: Definition("OpLoop", [2]),
+    OpCode.OpAddInt: Definition("OpAddInt", []),
+    OpCode.OpSubInt: Definition("OpSubInt", []),
+    OpCode.OpMulInt: Definition("OpMulInt", []),
+    OpCode.OpDivInt: Definition("OpDivInt", []),
+    OpCode.OpAddFloat: Definition("OpAddFloat", []),
+    OpCode.OpSubFloat: Definition("OpSubFloat", []),
+    OpCode.OpMulFloat: Definition("OpMulFloat", []),
+    OpCode.OpDivFloat: Definition("OpDivFloat", []),
+    OpCode.OpAddString: Definition("OpAddString", []),
+    OpCode.OpEqualNumber: Definition("OpEqualNumber", []),
+    OpCode.OpNotEqualNumber: Definition("OpNotEqualNumber", []),
+    OpCode.OpGreaterThanNumber: Definition("OpGreaterThanNumber", []),
+    OpCode.OpAddIntChecked: Definition("OpAddIntChecked", []),
+    OpCode.OpSubIntChecked: Definition("OpSubIntChecked", []),
+    OpCode.OpMulIntChecked: Definition("OpMulIntChecked", []),
+    OpCode.OpDivIntChecked: Definition("OpDivIntChecked", []),
+    OpCode.OpGreaterThanIntChecked: Definition("OpGreaterThanIntChecked", []),
+    OpCode.OpCopyConstant: Definition("OpCopyConstant", [2]),
+    OpCode.OpRangeTest: Definition("OpRangeTest", [1, 2, 2]),
+    OpCode.OpRangeStep: Definition("OpRangeStep", [1, 2, 2, 2]),
+    OpCode.OpMatch: Definition("OpMatch", [2, 2]),
+    OpCode.OpWide: Definition("OpWide", []),
+    OpCode.OpConstantShort: Definition("OpConstantShort", [1]),
+    OpCode.OpGetGlobalShort: Definition("OpGetGlobalShort", [1]),
+    OpCode.OpSetGlobalShort: Definition("OpSetGlobalShort", [1]),
+    OpCode.OpJumpShort: Definition("OpJumpShort", [1]),
+    OpCode.OpJumpNotTruthyShort: Definition("OpJumpNotTruthyShort", [1]),
+    OpCode.OpLoopShort: Definition("OpLoopShort", [1])
+}
+
+# Instruction -> its form with one-byte operands, used by the compact encoding when the operand fits
+SHORT_OPCODES: dict[OpCode, OpCode] = {
+    OpCode.OpConstant: OpCode.OpConstantShort,
+    OpCode.OpGetGlobal: OpCode.OpGetGlobalShort,
+    OpCode.OpSetGlobal: OpCode.OpSetGlobalShort,
+    OpCode.OpJump: OpCode.OpJumpShort,
+    OpCode.OpJumpNotTruthy: OpCode.OpJumpNotTruthyShort,
+    OpCode.OpLoop: OpCode.OpLoopShort
 }
 
+# Width of every operand of an instruction behind an OpWide
+WIDE_OPERAND_WIDTH: int = 4
+
 def lookup(op: int) -> tuple[Definition, str]:
     defin = definitions.get(op)
     if defin is None:
@@ -87,9 +170,14 @@ def lookup(op: int) -> tuple[Definition, str]:
 Instructions = bytearray
 
 def make(op: OpCode, *operands: int) -> bytearray:
+    """ Encodes an instruction. When an operand is too big for its width (e.g. the 257th local, or a jump
+    past 64 KiB), the instruction is prefixed with OpWide and all its operands are WIDE_OPERAND_WIDTH bytes instead """
     defin: Definition = definitions.get(op)
     if defin is None:
         return b''
+
+    if not fits(defin, operands):
+        return make_wide(op, *operands)
     
     instruction_len: int = 1 + sum(defin.operand_widths)    
     instruction: bytearray = bytearray(instruction_len)
@@ -108,22 +196,45 @@ def make(op: OpCode, *operands: int) -> bytearray:
     
     return instruction
 
+def make_wide(op: OpCode, *operands: int) -> bytearray:
+    instruction: bytearray = bytearray([OpCode.OpWide.value, op.value])
+    for o in operands:
+        instruction += struct.pack(">I", o)
+
+    return instruction
+
+def fits(defin: Definition, operands: tuple[int, ...]) -> bool:
+    return all(0 <= o < 1 << (8 * width) for width, o in zip(defin.operand_widths, operands))
+
 def as_string(ins: Instructions) -> str:
     output: str = ""
 
+    for i, defin, operands, _, wide in walk_instructions(ins):
+        prefix: str = "OpWide " if wide else ""
+        output += f"{i:04d} {prefix}{fmt_instruction(defin, operands)}\n"
+
+    return output
+
+def walk_instructions(ins: Instructions):
+    """ Yields (offset, definition, operands, size, is wide) for every instruction. An OpWide and the
+    instruction behind it count as one, with the definition of the latter """
     i = 0
     while i < len(ins):
         defin, err = lookup(OpCode(ins[i]))
         if err is not None:
-            output += "ERROR: {err}\n"
+            return
+
+        if defin.name == "OpWide":
+            defin, _ = lookup(OpCode(ins[i + 1]))
+            operands, read = read_operands(defin, ins[i + 2:], wide=True)
+            yield i, defin, operands, 2 + read, True
+            i = i + 2 + read
             continue
 
         operands, read = read_operands(defin, ins[i + 1:])
-        output += f"{i:04d} {fmt_instruction(defin, operands)}\n"
+        yield i, defin, operands, 1 + read, False
         i = i + 1 + read
 
-    return output
-
 def fmt_instruction(defin: Definition, operands: list[int]) -> str:
     operand_count: int = len(defin.operand_widths)
     if len(operands) != operand_count:
@@ -136,15 +247,24 @@ def fmt_instruction(defin: Definition, operands: list[int]) -> str:
             return f"{defin.name} {operands[0]}"
         case 2:
             return f"{defin.name} {operands[0]} {operands[1]}"
+        case 3:
+            return f"{defin.name} {operands[0]} {operands[1]} {operands[2]}"
+        case 4:
+            return f"{defin.name} {operands[0]} {operands[1]} {operands[2]} {operands[3]}"
         case _:
             return f"ERROR: Unhandled operand_count ({operand_count}) for {defin.name}"
 
-def read_operands(defin: Definition, ins: Instructions) -> tuple[list[int], int]:
+def read_operands(defin: Definition, ins: Instructions, wide: bool = False) -> tuple[list[int], int]:
     operands: list[int] = []
     offset: int = 0
 
     for i, width in enumerate(defin.operand_widths):
+        if wide:
+            width = WIDE_OPERAND_WIDTH
+
         match width:
+            case 4:
+                operands.append(read_uint32(ins[offset:]))
             case 2:
                 operands.append(read_uint16(ins[offset:]))
             case 1:
@@ -153,6 +273,9 @@ def read_operands(defin: Definition, ins: Instructions) -> tuple[list[int], int]
     
     return operands, offset
 
+def read_uint32(ins: Instructions) -> int:
+    return struct.unpack(">I", ins[:4])[0]
+
 def read_uint16(ins: Instructions) -> int:
     return struct.unpack(">H", ins[:2])[0]
 
@@ -0,0 +1,302 @@
+from models.Code import Instructions, OpCode, definitions, make, fits, SHORT_OPCODES
+
+
+# Jumps whose last operand is a jump target
+JUMP_OPCODES: set[OpCode] = {OpCode.OpJump, OpCode.OpJumpNotTruthy, OpCode.OpLoop, OpCode.OpRangeTest, OpCode.OpRangeStep, OpCode.OpMatch}
+CONDITIONAL_JUMP_OPCODES: set[OpCode] = {OpCode.OpJumpNotTruthy, OpCode.OpRangeTest}
+RETURN_OPCODES: set[OpCode] = {OpCode.OpReturnValue, OpCode.OpReturn}
+
+
+class IRInstruction:
+    """ A single VM instruction before it is encoded into bytes.
+
+    Jumps keep their destination in `target` (and only their other operands in `operands`): while the
+    Compiler is emitting, that is the index of the instruction jumped to, inside a ControlFlowGraph it is
+    the BasicBlock jumped to. An OpMatch also has the starts of its cases in `targets`, `target` is its default.
+    """
+    def __init__(self, opcode: OpCode, operands: list[int] = None, target = None, site: int = None, targets: list = None) -> None:
+        self.opcode: OpCode = opcode
+        self.operands: list[int] = [] if operands is None else operands
+        self.target = target
+        self.targets: list | None = targets
+
+        # The profiling site (see models.Profile) of the AST node this was compiled from
+        self.site: int | None = site
+
+    def is_jump(self) -> bool:
+        return self.opcode in JUMP_OPCODES
+
+    def ends_block(self) -> bool:
+        return self.opcode in JUMP_OPCODES or self.opcode in RETURN_OPCODES
+
+    def all_targets(self) -> list:
+        """ Every place a jump may go to """
+        return [self.target, *(self.targets or [])] if self.is_jump() else []
+
+    def size(self, compact: bool = False) -> int:
+        """ The smallest this can encode to: the short form in the compact encoding, else the usual one """
+        opcode: OpCode = SHORT_OPCODES.get(self.opcode, self.opcode) if compact else self.opcode
+        return 1 + sum(definitions[opcode].operand_widths)
+
+    def __repr__(self) -> str:
+        name: str = definitions[self.opcode].name
+        if self.is_jump():
+            targets = [t.id if isinstance(t, BasicBlock) else t for t in self.all_targets()]
+            return " ".join([name, *[str(o) for o in self.operands], f"-> {', '.join(str(t) for t in targets)}"])
+        return " ".join([name, *[str(o) for o in self.operands]])
+
+
+class BasicBlock:
+    def __init__(self, id: int, instructions: list[IRInstruction] = None) -> None:
+        self.id: int = id
+        self.instructions: list[IRInstruction] = [] if instructions is None else instructions
+
+        # The block control continues with when the last instruction does not jump away for good
+        self.fallthrough: BasicBlock | None = None
+
+    def terminator(self) -> IRInstruction | None:
+        if len(self.instructions) > 0 and self.instructions[-1].ends_block():
+            return self.instructions[-1]
+        return None
+
+    def successors(self) -> list["BasicBlock"]:
+        succs: list[BasicBlock] = []
+        if self.fallthrough is not None:
+            succs.append(self.fallthrough)
+
+        term: IRInstruction | None = self.terminator()
+        if term is not None:
+            for target in term.all_targets():
+                if target not in succs:
+                    succs.append(target)
+
+        return succs
+
+    def __repr__(self) -> str:
+        return f"Block{self.id}"
+
+
+class ControlFlowGraph:
+    """ The instructions of one function (or the main program) split into basic blocks.
+
+    `blocks` is the layout order: the first block is the entry, the last one is an empty exit block that
+    jumps to the end of the code land in. Fallthrough edges may only be broken by inserting a jump, which
+    `linearize` does on its own.
+    """
+    def __init__(self, blocks: list[BasicBlock], num_locals: int = 0, num_params: int = 0, is_main: bool = False, clobbered_globals: set[int] = None, constants: list = None, profile = None) -> None:
+        self.blocks: list[BasicBlock] = blocks
+        self.num_locals: int = num_locals
+        self.num_params: int = num_params
+        self.is_main: bool = is_main
+
+        # Use the one-byte operand forms of SHORT_OPCODES wherever the operand fits, see the compact-encoding pass
+        self.compact: bool = False
+
+        # The constant pool OpConstant operands index into
+        self.constants: list = [] if constants is None else constants
+
+        # A models.Profile from an earlier run, if the build is profile guided
+        self.profile = profile
+
+        # Bytecode offset -> profiling site, filled in by `assemble`
+        self.sites: dict[int, int] = {}
+
+        # Globals some function may assign, i.e. the globals any call can change
+        self.clobbered_globals: set[int] = set() if clobbered_globals is None else clobbered_globals
+
+    @staticmethod
+    def from_instructions(instructions: list[IRInstruction], **kwargs) -> "ControlFlowGraph":
+        """ Builds the graph from Compiler output, where jump targets are instruction indices. The input is left untouched """
+        leaders: set[int] = {0, len(instructions)}
+        for i, ins in enumerate(instructions):
+            leaders.update(ins.all_targets())
+            if ins.ends_block():
+                leaders.add(i + 1)
+
+        starts: list[int] = sorted(leaders)
+        blocks: list[BasicBlock] = []
+        block_at: dict[int, BasicBlock] = {}
+        for i, start in enumerate(starts):
+            block = BasicBlock(id=i)
+            if i < len(starts) - 1:
+                block.instructions = [
+                    IRInstruction(ins.opcode, list(ins.operands), ins.target, ins.site, None if ins.targets is None else list(ins.targets))
+                    for ins in instructions[start:starts[i + 1]]
+                ]
+            blocks.append(block)
+            block_at[start] = block
+
+        for i, block in enumerate(blocks):
+            term: IRInstruction | None = block.terminator()
+            if term is not None and term.is_jump():
+                term.target = block_at[term.target]
+                if term.targets is not None:
+                    term.targets = [block_at[t] for t in term.targets]
+
+            if i < len(blocks) - 1 and (term is None or term.opcode in CONDITIONAL_JUMP_OPCODES):
+                block.fallthrough = blocks[i + 1]
+
+        return ControlFlowGraph(blocks, **kwargs)
+
+    # region Graph Helpers
+    def entry(self) -> BasicBlock:
+        return self.blocks[0]
+
+    def exit(self) -> BasicBlock:
+        return self.blocks[-1]
+
+    def predecessors(self) -> dict[BasicBlock, list[BasicBlock]]:
+        preds: dict[BasicBlock, list[BasicBlock]] = {b: [] for b in self.blocks}
+        for block in self.blocks:
+            for succ in block.successors():
+                preds[succ].append(block)
+        return preds
+
+    def reverse_postorder(self) -> list[BasicBlock]:
+        """ The blocks reachable from the entry, each one before its successors (back edges aside) """
+        order: list[BasicBlock] = []
+        visited: set[BasicBlock] = set()
+
+        stack: list[tuple[BasicBlock, int]] = [(self.entry(), 0)]
+        visited.add(self.entry())
+        while len(stack) > 0:
+            block, i = stack.pop()
+            succs: list[BasicBlock] = block.successors()
+            if i < len(succs):
+                stack.append((block, i + 1))
+                if succs[i] not in visited:
+                    visited.add(succs[i])
+                    stack.append((succs[i], 0))
+            else:
+                order.append(block)
+
+        order.reverse()
+        return order
+
+    def dominators(self) -> dict[BasicBlock, BasicBlock]:
+        """ Immediate dominator of every reachable block (the entry dominates itself), after Cooper, Harvey and Kennedy """
+        rpo: list[BasicBlock] = self.reverse_postorder()
+        index: dict[BasicBlock, int] = {b: i for i, b in enumerate(rpo)}
+        preds = self.predecessors()
+
+        idom: dict[BasicBlock, BasicBlock] = {self.entry(): self.entry()}
+
+        def intersect(a: BasicBlock, b: BasicBlock) -> BasicBlock:
+            while a is not b:
+                while index[a] > index[b]:
+                    a = idom[a]
+                while index[b] > index[a]:
+                    b = idom[b]
+            return a
+
+        changed: bool = True
+        while changed:
+            changed = False
+            for block in rpo[1:]:
+                new_idom: BasicBlock = None
+                for p in preds[block]:
+                    if p not in idom:
+                        continue
+                    new_idom = p if new_idom is None else intersect(p, new_idom)
+
+                if idom.get(block) is not new_idom:
+                    idom[block] = new_idom
+                    changed = True
+
+        return idom
+
+    def dominance_frontiers(self, idom: dict[BasicBlock, BasicBlock]) -> dict[BasicBlock, set[BasicBlock]]:
+        """ The blocks where the dominance of every block ends. The entry is also entered by the call of the
+        function, as if from a block before it that dominates every block (None here) """
+        frontiers: dict[BasicBlock, set[BasicBlock]] = {b: set() for b in idom}
+        preds = self.predecessors()
+        entry: BasicBlock = self.entry()
+
+        for block in idom:
+            reachable_preds = [p for p in preds[block] if p in idom]
+            if len(reachable_preds) + (1 if block is entry else 0) < 2:
+                continue
+
+            stop: BasicBlock | None = None if block is entry else idom[block]
+            for p in reachable_preds:
+                runner: BasicBlock | None = p
+                while runner is not stop:
+                    frontiers[runner].add(block)
+                    runner = None if runner is entry else idom[runner]
+
+        return frontiers
+    # endregion
+
+    # region Code Generation
+    def linearize(self) -> list[tuple[BasicBlock, list[IRInstruction]]]:
+        """ Lays the blocks out in order, adding jumps for fallthroughs that are no longer adjacent and dropping jumps to the next block """
+        layout: list[tuple[BasicBlock, list[IRInstruction]]] = []
+
+        for i, block in enumerate(self.blocks):
+            next_block: BasicBlock | None = self.blocks[i + 1] if i + 1 < len(self.blocks) else None
+            instructions: list[IRInstruction] = list(block.instructions)
+
+            term: IRInstruction | None = block.terminator()
+            if term is not None and term.opcode in (OpCode.OpJump, OpCode.OpLoop) and term.target is next_block:
+                instructions.pop()
+
+            if block.fallthrough is not None and block.fallthrough is not next_block:
+                instructions.append(IRInstruction(OpCode.OpJump, target=block.fallthrough))
+
+            layout.append((block, instructions))
+
+        return layout
+
+    def assemble(self) -> Instructions:
+        layout = self.linearize()
+
+        # Encoded size of the instructions that came out bigger than their smallest form (a short form that
+        # did not fit, or one that went wide, see models.Code.make). Every instruction starts out at its
+        # smallest, and since sizes only ever grow, re-encoding until none changes settles
+        sizes: dict[IRInstruction, int] = {}
+        while True:
+            offsets: dict[BasicBlock, int] = {}
+            position: int = 0
+            for block, instructions in layout:
+                offsets[block] = position
+                position += sum(sizes.get(ins, ins.size(self.compact)) for ins in instructions)
+
+            out: Instructions = self.encode(layout, offsets, sizes)
+            if len(out) == position:
+                return out
+
+    def encode(self, layout: list[tuple[BasicBlock, list[IRInstruction]]], offsets: dict[BasicBlock, int], sizes: dict[IRInstruction, int]) -> Instructions:
+        """ Encodes the layout with jumps resolved through `offsets`, recording instructions that came out bigger in `sizes` """
+        out: Instructions = Instructions()
+        self.sites = {}
+        for block, instructions in layout:
+            for ins in instructions:
+                if ins.site is not None:
+                    self.sites[len(out)] = ins.site
+
+                operands: list[int] = ins.operands
+                opcode: OpCode = ins.opcode
+                if opcode == OpCode.OpLoop and offsets[ins.target] > len(out):
+                    # OpLoop only jumps backwards, a pass may have pointed it further down
+                    opcode = OpCode.OpJump
+
+                if opcode == OpCode.OpLoop:
+                    # Relative to the OpLoop itself, see the VM
+                    operands = [len(out) - offsets[ins.target] + 1]
+                elif ins.is_jump():
+                    operands = [*ins.operands, offsets[ins.target]]
+
+                if opcode == OpCode.OpMatch:
+                    table = self.constants[ins.operands[0]]
+                    table.targets = {key: offsets[ins.targets[case]] for key, case in table.cases.items()}
+
+                if self.compact and opcode in SHORT_OPCODES and fits(definitions[SHORT_OPCODES[opcode]], operands):
+                    opcode = SHORT_OPCODES[opcode]
+
+                encoded: bytearray = make(opcode, *operands)
+                if len(encoded) != sizes.get(ins, ins.size(self.compact)):
+                    sizes[ins] = len(encoded)
+                out += encoded
+
+        return out
+    # endregion
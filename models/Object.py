@@ -15,6 +15,8 @@ T_STRING_OBJ = "STRING"
 T_ARRAY_OBJ = "ARRAY"
 T_HASH_OBJ = "HASH"
 T_BUILTIN_OBJ = "BUILTIN"
+T_JUMP_TABLE_OBJ = "JUMP_TABLE"
+T_LAZY_FUNCTION_OBJ = "LAZY_FUNCTION"
 
 class Object(ABC):
     @abstractmethod
@@ -115,6 +117,7 @@ class ArrayObject(Object):
     
 
 class HashObject(Object):
+    """ Pairs keep insertion order (the order of the literal), a repeated key keeps its first position and its last value """
     def __init__(self, pairs: dict[HashKey, HashPair] = None) -> None:
         self.pairs = {} if pairs is None else pairs
     
@@ -152,17 +155,55 @@ class ErrorObject(Object):
         return f"ERROR: {self.message}"
     
 class CompiledFunction(Object):
-    def __init__(self, instructions: Instructions = None, num_locals: int = None, num_params: int = None) -> None:
+    def __init__(self, instructions: Instructions = None, num_locals: int = None, num_params: int = None, site: int = None, sites: dict[int, int] = None, name: str = None) -> None:
         self.instructions: Instructions = instructions
         self.num_locals: int = 0 if num_locals is None else num_locals
         self.num_parameters: int = 0 if num_params is None else num_params
 
+        # The name it was bound to with `let`, if any
+        self.name: str | None = name
+
+        # Profiling site of the function literal, and of the instructions by offset
+        self.site: int | None = site
+        self.sites: dict[int, int] = {} if sites is None else sites
+
     def type(self) -> str:
         return T_COMPILED_FUNCTION_OBJ
     
     def inspect(self) -> str:
         return f"CompiledFunction[{self}]"
     
+class LazyFunction(Object):
+    """ A function whose body is only parsed and compiled when it is first called, see Compiler.compile_lazy_function """
+    def __init__(self, literal = None, captured: list[str] = None, globals: dict = None, compiler = None, site: int = None) -> None:
+        # The FunctionLiteral, with its body still a LazyBody
+        self.literal = literal
+
+        # Names of the free variables, in the order the closure holds them
+        self.captured: list[str] = [] if captured is None else captured
+
+        # The globals and builtins the body may refer to, as they were where the function was defined
+        self.globals: dict = {} if globals is None else globals
+
+        self.compiler = compiler
+        self.site: int | None = site
+
+        self.compiled: CompiledFunction | None = None
+
+    def compile(self) -> tuple[CompiledFunction | None, str | None]:
+        if self.compiled is None:
+            compiled, err = self.compiler.compile_lazy_body(self)
+            if err is not None:
+                return None, err
+            self.compiled = compiled
+        return self.compiled, None
+
+    def type(self) -> str:
+        return T_LAZY_FUNCTION_OBJ
+
+    def inspect(self) -> str:
+        return f"LazyFunction[{self}]"
+    
 class ClosureObject(Object):
     def __init__(self, fn: CompiledFunction = None, free: list[Object] = None) -> None:
         self.fn = fn
@@ -174,6 +215,21 @@ class ClosureObject(Object):
     def inspect(self) -> str:
         return f"Closure[{self}]"
 
+class JumpTable(Object):
+    """ The cases of an OpMatch: the hash key of every label -> index of its case.
+
+    `targets` (label hash key -> bytecode offset of the case) is filled in when the function is assembled.
+    """
+    def __init__(self, cases: dict[HashKey, int]) -> None:
+        self.cases: dict[HashKey, int] = cases
+        self.targets: dict[HashKey, int] = {}
+
+    def type(self) -> str:
+        return T_JUMP_TABLE_OBJ
+
+    def inspect(self) -> str:
+        return f"JumpTable[{len(self.cases)} labels]"
+
 
 BuiltinFunction = Callable
 
@@ -0,0 +1,109 @@
+import json
+
+# Minimum number of calls for a function to count as hot
+HOT_CALL_COUNT: int = 1000
+
+# Minimum number of samples before a branch or operand site is trusted
+MIN_SAMPLES: int = 100
+
+# Share of executions below which a branch direction counts as cold
+COLD_BRANCH_RATIO: float = 0.05
+
+
+class Profile:
+    """ What a run of the VM observed, keyed by the site ids the Compiler hands out to AST nodes.
+
+    `calls`: site of a function literal -> number of calls
+    `branches`: site of an if / loop condition -> [times it was truthy, times it was falsy]
+    `types`: site of an infix operator -> "LEFT,RIGHT" operand types -> count
+    `loops`: site of a loop -> number of iterations (back edges taken)
+    """
+    VERSION: int = 1
+
+    def __init__(self, source_hash: str = None) -> None:
+        # Ties the profile to the program it was recorded for, sites are meaningless for any other
+        self.source_hash: str = source_hash
+
+        self.calls: dict[int, int] = {}
+        self.branches: dict[int, list[int]] = {}
+        self.types: dict[int, dict[str, int]] = {}
+        self.loops: dict[int, int] = {}
+
+    # region Recording
+    def record_call(self, site: int) -> None:
+        self.calls[site] = self.calls.get(site, 0) + 1
+
+    def record_branch(self, site: int, truthy: bool) -> None:
+        counts: list[int] = self.branches.setdefault(site, [0, 0])
+        counts[0 if truthy else 1] += 1
+
+    def record_types(self, site: int, left: str, right: str) -> None:
+        seen: dict[str, int] = self.types.setdefault(site, {})
+        key: str = f"{left},{right}"
+        seen[key] = seen.get(key, 0) + 1
+
+    def record_loop(self, site: int) -> None:
+        self.loops[site] = self.loops.get(site, 0) + 1
+    # endregion
+
+    # region Queries
+    def is_hot(self, site: int | None) -> bool:
+        return site is not None and self.calls.get(site, 0) >= HOT_CALL_COUNT
+
+    def truthy_ratio(self, site: int | None) -> float | None:
+        """ How often the condition at `site` was truthy, None without enough samples """
+        counts: list[int] | None = self.branches.get(site)
+        if counts is None or sum(counts) < MIN_SAMPLES:
+            return None
+        return counts[0] / sum(counts)
+
+    def monomorphic_types(self, site: int | None) -> tuple[str, str] | None:
+        """ The only operand types ever seen at `site`, None if there were several or too few samples """
+        seen: dict[str, int] | None = self.types.get(site)
+        if seen is None or len(seen) != 1:
+            return None
+
+        key, count = next(iter(seen.items()))
+        if count < MIN_SAMPLES:
+            return None
+
+        left, right = key.split(",")
+        return left, right
+    # endregion
+
+    # region Files
+    def save(self, path: str) -> None:
+        data = {
+            "version": self.VERSION,
+            "source": self.source_hash,
+            "calls": self.calls,
+            "branches": self.branches,
+            "types": self.types,
+            "loops": self.loops
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path: str) -> tuple["Profile", str]:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+
+            if data.get("version") != Profile.VERSION:
+                return None, f"Unsupported profile version in {path}: {data.get('version')}"
+
+            profile: Profile = Profile(source_hash=data.get("source"))
+
+            # JSON object keys are always strings
+            profile.calls = {int(k): v for k, v in data.get("calls", {}).items()}
+            profile.branches = {int(k): v for k, v in data.get("branches", {}).items()}
+            profile.types = {int(k): v for k, v in data.get("types", {}).items()}
+            profile.loops = {int(k): v for k, v in data.get("loops", {}).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            return None, f"Could not read profile {path}: {e}"
+
+        return profile, None
+    # endregion
@@ -11,7 +11,7 @@ class VMStack:
         self.last_popped_elem: Object = None
     
     def push(self, item: Object) -> str | None:
-        if len(self.items) > self.STACK_SIZE:
+        if self.sp >= self.STACK_SIZE:
             return "Stack Overflow."
         self.items[self.sp] = item
         self.sp += 1
@@ -48,6 +48,8 @@ class FrameStack:
         self.last_popped_frame: Frame = None
     
     def push(self, item: Frame) -> str | None:
+        if self.fp >= self.MAX_FRAMES:
+            return "Stack Overflow."
         self.items[self.fp] = item
         self.fp += 1
         return None
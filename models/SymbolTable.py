@@ -57,6 +57,16 @@ class SymbolTable:
         self.store[name] = symbol
         return symbol
     
+    def lookup(self, name: str) -> Symbol | None:
+        """ Like `resolve`, but never defines free symbols along the way """
+        table: SymbolTable = self
+        while table is not None:
+            obj: Symbol | None = table.store.get(name)
+            if obj is not None:
+                return obj
+            table = table.outer
+        return None
+
     def resolve(self, name: str) -> tuple[Symbol, bool]:
         obj: Symbol | None = self.store.get(name)
         if obj is None and self.outer is not None:
@@ -64,7 +74,7 @@ class SymbolTable:
             if not ok:
                 return obj, ok
             
-            if obj.scope == ScopeType.GLOBAL_SCOPE or obj.count == ScopeType.BUILTIN_SCOPE:
+            if obj.scope == ScopeType.GLOBAL_SCOPE or obj.scope == ScopeType.BUILTIN_SCOPE:
                 return obj, ok
             
             free = self.define_free(obj)
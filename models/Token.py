@@ -31,6 +31,10 @@ class TokenType(Enum):
     LT_EQ = '<='
     GT_EQ = '>='
 
+    # Logical
+    AND = '&&'
+    OR = '||'
+
     # Symbols
     SEMICOLON = ";"
     LPAREN = "("
@@ -41,6 +45,7 @@ class TokenType(Enum):
     LBRACKET = "["
     RBRACKET = "]"
     COLON = ":"
+    ARROW = "=>"
 
     # Keywords
     FUNCTION = "FUNCTION"
@@ -53,6 +58,9 @@ class TokenType(Enum):
     IMPORT = "IMPORT"
     WHILE = "WHILE"
     FOR = "FOR"
+    MATCH = "MATCH"
+    BREAK = "BREAK"
+    CONTINUE = "CONTINUE"
 
 class Token:
     def __init__(self, token_type: TokenType, literal: str | None) -> None:
@@ -73,7 +81,10 @@ KEYWORDS: dict[str, TokenType] = {
     "return": TokenType.RETURN,
     "import": TokenType.IMPORT,
     "while": TokenType.WHILE,
-    "for": TokenType.FOR
+    "for": TokenType.FOR,
+    "match": TokenType.MATCH,
+    "break": TokenType.BREAK,
+    "continue": TokenType.CONTINUE
 }
 
 GENZ_KEYWORDS: dict[str, TokenType] = {
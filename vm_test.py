@@ -0,0 +1,443 @@
+from typing import NamedTuple
+from models.Object import Object
+from models.AST import Program
+from exec.Lexer import Lexer
+from exec.Parser import Parser
+from exec.Compiler import Compiler, EVALUATION_SIZE_LIMIT
+from exec.VM import VM
+from exec.PassManager import MAX_OPTIMIZATION_LEVEL
+from models.Profile import Profile
+from exec.BytecodeCache import BytecodeCache
+from exec.PassManager import PassManager
+from exec.Builder import Builder, compile_module
+from exec.Repl import Repl
+from exec.Linker import Linker, CompiledModule
+from tempfile import TemporaryDirectory
+from contextlib import redirect_stdout
+from io import StringIO
+import os
+
+class VMTestCase(NamedTuple):
+    input_src: str
+    expected: object
+
+
+def test_builder():
+    tests: list[VMTestCase] = [
+        VMTestCase("1 + 2", 3),
+        VMTestCase("let a = 5; a * 2", 10),
+        VMTestCase("if 1 > 2 { let x = 1; } let y = 2; y;", 2),
+        VMTestCase("if 1 > 2 { 10; } else { 20; }", 20),
+        VMTestCase("let s = 0; for (let i = 0; i < 4; i = i + 1) { s = s + i; } s;", 6),
+        VMTestCase("let xs = [1, 2, 3]; let t = 0; let i = 0; while i < len(xs) { t = t + xs[i] * len(xs); i = i + 1; } t;", 18),
+        VMTestCase("let f = fn(a) { let s = 0; let j = 0; while j < len(a) { s = s + a[j] + len(a); j = j + 1; } s; }; f([1, 2])", 7),
+        VMTestCase("let i = 0; while i < 0 { i = i + len(5 + \"x\"); } i;", 0),
+        VMTestCase("let add = fn(a, b) { let t = a + b; return t; }; let sq = fn(x) { x * x }; add(sq(2), 1);", 5),
+        VMTestCase("let add = fn(a, b) { a + b }; let f = fn(add) { add(1, 2) }; f(fn(a, b) { a * b });", 2),
+        VMTestCase("let g = 1; let inc = fn() { g = g + 1; }; inc(); inc(); g;", 3),
+        VMTestCase("let fact = fn(n) { if n < 2 { 1 } else { n * fact(n - 1) } }; fact(5);", 120),
+        VMTestCase("let a = [3, 4]; let i = 1; let r = a[i] + a[i] * a[i]; i = 0; r + a[i] + a[i];", 26),
+        VMTestCase("let f = fn(n) { let i = 0; let unused = n * 2; while true { if i > n { return i; } i = i + 1; } }; f(3);", 4),
+        VMTestCase("let g = fn(x) { if x > 1 { return 1; } else { return 2; } }; g(0) * 10 + g(5);", 21),
+        VMTestCase("let f = fn(n) { let i = 0; let s = 0.5; while n > i { s = s + i * 2; i = i + 1; } s; }; f(3);", 6.5),
+        VMTestCase("let t = \"\"; let i = 0; while 3 > i { t = t + \"ab\"; i = i + 1; } t;", "ababab"),
+        VMTestCase("let x = 2; let y = 2.0; if x == y { x > 1.5; } else { false; };", True),
+        VMTestCase("let t = 0; let i = 0; while 200 > i { if 199 > i { t = t + 2; 0; } else { t = t + 1000; 0; } i = i + 1; } t;", 1398),
+        VMTestCase("let add = fn(a, b) { a + b }; let i = 0; let s = 0; while 150 > i { s = add(s, i); i = i + 1; } add(s, 0.5);", 11175.5),
+        VMTestCase("let n = 0; let i = 0; while 10 > i { if i > 6 { n = n + 1; } else { n = n + 2; } i = i + 1; } n;", 17),
+        VMTestCase("let f = fn(x) { let y = 0; if x > 1 { y = 5; } y; }; let g = fn(x) { if x > 1 { 5 } }; [f(3), f(0), g(3), g(0)];", [5, 0, 5, None]),
+        VMTestCase("let x = 0; let v = if true { x = 3; }; v;", None),
+        VMTestCase("let s = 0; for (let i = 0; i < 10; i = i + 3) { for (let j = 0; j < i; j = j + 1) { s = s + 1; } } s;", 18),
+        VMTestCase("let s = 0; for (let i = 1; i < 2.5; i = 1 + i) { s = s + i; } s;", 3),
+        VMTestCase("let n = 3; let s = 0; for (let i = 0; i < n; i = i + 1) { n = 5; s = s + i; } s;", 10),
+        VMTestCase("let f = fn(n) { for (let i = 0; n > i; i = i + 1) { if i > 2 { return i * 10; } } 0; }; f(9) + f(2);", 30),
+        VMTestCase("let apply = fn(f, x) { f(x) }; let s = 0; let i = 0; while 3 > i { s = s + apply(fn(v) { v * len([1, 2]) }, i); i = i + 1; } s;", 6),
+        VMTestCase("let adder = fn(a) { fn(b) { a + b } }; let addTwo = adder(2); let addFive = adder(5); addTwo(1) * 10 + addFive(1);", 36),
+        VMTestCase("let f = fn(k) { let t = {\"a\": [1, -2], \"b\": [3]}; t[k][0] + len(t[k]) }; f(\"a\") * 10 + f(\"b\");", 34),
+        VMTestCase("let g = fn() { [1, [2, 3]] }; let a = g(); let b = g(); [a[1][0], len(b), a == b, a[1] == b[1]];", [2, 2, False, False]),
+        VMTestCase("let h = {\"k\": 2}; let set = fn() { h = {\"k\": 5}; }; let x = h[\"k\"]; set(); x + h[\"k\"];", 7),
+        VMTestCase("let n = 0; let f = fn(v) { n = n * 10 + v; v }; let h = {\"b\": f(1), \"a\": f(2), \"b\": f(3)}; [n, h[\"a\"], h[\"b\"]];", [123, 2, 3]),
+        VMTestCase("let fib = fn(n) { if n < 2 { n } else { fib(n - 1) + fib(n - 2) } }; let pair = fn(x, big) { [fib(x), big > 1] }; [fib(12), pair(5, 3)[1], fib(16) > 0];", [144, True, True]),
+        VMTestCase("let d = fn(x) { 10 / x }; let f = fn(n) { f(n + 1) }; let t = 0; let r = if t > 0 { f(d(0)) } else { d(5) }; r;", 2),
+        VMTestCase("let rate = 3; let scale = fn(x) { let t = 0; while t < 1 { t = t + 1; } x * rate }; let base = 4; let big = scale(base); let f = fn() { big + 1 }; f();", 13),
+        VMTestCase("let one = 1; let set = fn() { one = 2; }; let before = one; set(); [before, one];", [1, 2]),
+        VMTestCase("let nil = if false { 1 }; let f = fn(a, b) { if a > 0 && b > 0 || a == 5 { 1 } else { 2 } }; let g = fn(a, b) { [a && b, a || b] }; [f(1, 1), f(1, 0), f(5, 0), g(1, nil)[0], g(0, false)[1]];", [1, 2, 1, False, True]),
+        VMTestCase("let n = 0; let bump = fn() { n = n + 1; true }; let a = false && bump(); let b = true || bump(); let c = true && bump(); let i = 0; while i < 5 && bump() { i = i + 1; } [a, b, c, n];", [False, True, True, 6]),
+        VMTestCase("let f = fn(x, s) { let i = 0; while i > 5 && 10 / x > 1 { i = i + 1; } [x == 0 || len(s) + 1 > 1, len(s) + 1 > 1, i] }; f(0, \"ab\");", [True, True, 0]),
+        VMTestCase("let f = fn(x) { match x { 1, 2 => { \"small\" }, \"a\" => { \"str\" }, true => { \"yes\" }, _ => { \"other\" } } }; let g = fn(x) { match x { -1 => { 1 } } }; [f(2), f(\"a\"), f(true), f(-1), f([1]), g(-1), g(1)];", ["small", "str", "yes", "other", "other", 1, None]),
+        VMTestCase("let s = 0; for (let i = 0; i < 10; i = i + 1) { if i == 2 { continue; } if i > 5 { break; } s = s + i; } let k = 0; for (let a = 0; a < 3; a = a + 1) { for (let b = 0; b < 3; b = b + 1) { if b == 1 { break; } k = k + 1; } } [s, k];", [13, 3]),
+        VMTestCase("let f = fn(xs) { let found = -1; let i = 0; while i < len(xs) { i = i + 1; if xs[i - 1] != 7 { continue; } found = i - 1; break; } found }; [f([1, 7, 7]), f([])];", [1, -1]),
+        VMTestCase("let s = 0; let codes = [0, 1, 2, 0, 1, 2]; for (let i = 0; i < 6; i = i + 1) { match codes[i] { 0 => { s = s + 100; }, 1 => { s = s + 10; } } } s;", 220)
+    ]
+
+    tests += [
+        VMTestCase("let f = fn(n) { let a = n + 1; let g = fn() { a * 10 }; let b = g() + n; let h = fn() { b }; let c = 0; for (let i = 0; i < 3; i = i + 1) { let t = i * 2; c = c + t; } [g(), h(), c, a, n] }; f(2);", [30, 32, 6, 3, 2]),
+        VMTestCase("let fact = fn(n) { let m = n - 1; if n < 2 { 1 } else { let r = fact(m); r * n } }; fact(6);", 720)
+    ]
+
+    tests += [
+        VMTestCase("let total = 0; let add = fn(v) { total = total + v; }; let twice = fn(f) { fn(v) { f(v); f(v); } }; let g = twice(add); for (let i = 0; i < 3; i = i + 1) { g(i); } total;", 6),
+        VMTestCase("let f = fn(n) { while n > 0 { n = n - 1; } 7 }; f(3);", 7),
+        VMTestCase("let h = {\"1\": 1, 1: 2}; h[\"1\"] * 10 + h[1] * 100 + h[1];", 212),
+        VMTestCase("let h = {\"a\": 1, \"b\": 2}; let a = \"b\"; let x = 0; let y = 0; let i = 0; while i < 2 { x = h[\"a\"]; y = h[a]; i = i + 1; } [x, y];", [1, 2]),
+        VMTestCase("let t = 5; t = 5; let f = fn() { let a = t; let t = 2; a + t }; f();", 7),
+        VMTestCase("let f = fn() { [1 > 0, 2] }; let a = f(); a[0] == true;", True),
+        VMTestCase("let f = fn(x) { match x { 1 => { 10 }, 1 => { 20 }, 2 => { 30 } } }; [f(1), f(2), f(3)];", [10, 30, None]),
+        VMTestCase("let b = \"x\"; let p = \"a\" + b + b; [(\"a\" + b + b) == (\"a\" + b + b), p == \"a\" + b + b, len(\"a\" + b + b) + len(\"a\" + b + b)];", [False, False, 6]),
+        VMTestCase("let b = \"x\"; let prev = \"\"; let r = 5; for (let i = 0; i < 2; i = i + 1) { let s = \"a\" + b + b; if i == 0 { prev = s; } else { r = prev == s; } } r;", False)
+    ]
+
+    # More locals than a 1-byte operand holds, and jumps past the 64 KiB a 2-byte target reaches: both need OpWide
+    names: list[str] = ["v" + chr(97 + i // 26) + chr(97 + i % 26) for i in range(300)]
+    tests += [
+        VMTestCase("let f = fn(x) { " + " ".join(f"let {n} = {i};" for i, n in enumerate(names)) + f" {names[-1]} + x }}; f(1);", 300),
+        VMTestCase("let g = fn(x) { let s = 0; while s < 3 { if x { " + "7; " * 17000 + "s = s + 1; } else { s = s + 2; } } s }; [g(true), g(false)];", [3, 4])
+    ]
+
+    return tests
+
+
+def parse(input_src: str, lazy: bool = False) -> Program:
+    l = Lexer(input_src)
+    p = Parser(l, lazy=lazy)
+    return p.parse_program()
+
+def test_expected_object(expected, actual: Object) -> str:
+    if isinstance(expected, bool):
+        if actual.type() != "BOOL" or actual.value != expected:
+            return f"Object is not {expected}. got={actual.inspect()}"
+    elif isinstance(expected, int):
+        if actual.type() != "INTEGER" or actual.value != expected:
+            return f"Object is not Integer {expected}. got={actual.type()} ({actual.inspect()})"
+    elif isinstance(expected, float):
+        if actual.type() != "FLOAT" or actual.value != expected:
+            return f"Object is not Float {expected}. got={actual.type()} ({actual.inspect()})"
+    elif isinstance(expected, str):
+        if actual.type() != "STRING" or actual.value != expected:
+            return f"Object is not String {expected}. got={actual.type()} ({actual.inspect()})"
+    elif expected is None:
+        if actual.type() != "NULL":
+            return f"Object is not Null. got={actual.type()} ({actual.inspect()})"
+    elif isinstance(expected, list):
+        if actual.type() != "ARRAY" or len(actual.elements) != len(expected):
+            return f"Object is not Array {expected}. got={actual.inspect()}"
+
+        for i, el in enumerate(expected):
+            err = test_expected_object(el, actual.elements[i])
+            if err is not None:
+                return f"element {i}: {err}"
+
+    return None
+
+def run():
+    tests: list[VMTestCase] = [t for t in test_builder()]
+
+    # Every optimization level has to agree on the result
+    for level in range(0, MAX_OPTIMIZATION_LEVEL + 1):
+        for t in tests:
+            program = parse(t.input_src)
+
+            compiler = Compiler(level=level)
+            err = compiler.compile(program)
+            if err is not None:
+                print(f"Compiler error (-O{level}): {err}")
+                exit(1)
+
+            vm = VM(compiler.bytecode())
+            err = vm.run()
+            if err is not None:
+                print(f"VM error (-O{level}): {err}")
+                exit(1)
+
+            err = test_expected_object(t.expected, vm.stack.last_popped_elem)
+            if err is not None:
+                print(f"testExpectedObject failed for `{t.input_src}` (-O{level}): {err}")
+                exit(1)
+
+    # So does a build guided by the profile of an earlier run
+    for t in tests:
+        profile: Profile = Profile()
+        for build_profile, run_profile in [(None, profile), (profile, None)]:
+            compiler = Compiler(profile=build_profile)
+            err = compiler.compile(parse(t.input_src))
+            if err is not None:
+                print(f"Compiler error (profiled): {err}")
+                exit(1)
+
+            vm = VM(compiler.bytecode(), profile=run_profile)
+            err = vm.run()
+            if err is not None:
+                print(f"VM error (profiled): {err}")
+                exit(1)
+
+            err = test_expected_object(t.expected, vm.stack.last_popped_elem)
+            if err is not None:
+                print(f"testExpectedObject failed for `{t.input_src}` (profiled): {err}")
+                exit(1)
+
+    # A profile file that is not what a run records is reported, not raised
+    with TemporaryDirectory() as profile_dir:
+        for i, content in enumerate(["[]", '{"version": 1, "calls": {"x": 1}}', '{"version": 1, "loops": []}']):
+            path: str = os.path.join(profile_dir, f"bad{i}.json")
+            with open(path, "w") as f:
+                f.write(content)
+
+            profile, err = Profile.load(path)
+            if profile is not None or err is None:
+                print(f"Malformed profile `{content}` loaded")
+                exit(1)
+
+    # And bytecode that went through the on-disk cache
+    with TemporaryDirectory() as cache_dir:
+        cache: BytecodeCache = BytecodeCache(cache_dir)
+        for i, t in enumerate(tests):
+            passes: PassManager = PassManager(level=MAX_OPTIMIZATION_LEVEL)
+            compiler = Compiler(passes=passes)
+            err = compiler.compile(parse(t.input_src))
+            if err is not None:
+                print(f"Compiler error (cached): {err}")
+                exit(1)
+
+            err = cache.save(f"test{i}.lime", t.input_src, {}, {}, compiler.bytecode(), passes)
+            if err is not None:
+                print(err)
+                exit(1)
+
+            bytecode = cache.load(f"test{i}.lime", t.input_src, passes)
+            if bytecode is None or cache.load(f"test{i}.lime", t.input_src + " ", passes) is not None:
+                print(f"Cache entry of `{t.input_src}` did not load, or loaded for another source")
+                exit(1)
+
+            vm = VM(bytecode)
+            err = vm.run()
+            if err is not None:
+                print(f"VM error (cached): {err}")
+                exit(1)
+
+            err = test_expected_object(t.expected, vm.stack.last_popped_elem)
+            if err is not None:
+                print(f"testExpectedObject failed for `{t.input_src}` (cached): {err}")
+                exit(1)
+
+    # And one that only compiles function bodies once they are called
+    for t in tests:
+        compiler = Compiler(lazy=True)
+        err = compiler.compile(parse(t.input_src, lazy=True))
+        if err is not None:
+            print(f"Compiler error (lazy): {err}")
+            exit(1)
+
+        vm = VM(compiler.bytecode())
+        err = vm.run()
+        if err is not None:
+            print(f"VM error (lazy): {err}")
+            exit(1)
+
+        err = test_expected_object(t.expected, vm.stack.last_popped_elem)
+        if err is not None:
+            print(f"testExpectedObject failed for `{t.input_src}` (lazy): {err}")
+            exit(1)
+
+    # A body nobody calls is never compiled, so its mistakes only show up when it is
+    compiler = Compiler(lazy=True)
+    err = compiler.compile(parse("let broken = fn() { missing + 1 }; let ok = fn(x) { x * 2 }; ok(21);", lazy=True))
+    if err is not None:
+        print(f"Compiler error (lazy): {err}")
+        exit(1)
+
+    vm = VM(compiler.bytecode())
+    err = vm.run()
+    if err is not None or test_expected_object(42, vm.stack.last_popped_elem) is not None:
+        print(f"Uncalled lazy function was compiled: {err}")
+        exit(1)
+
+    # An invariant expression that fails is not hoisted past the output printed before it
+    failing: str = "let n = 5; let i = 0; while (i < 2) { print(i); let z = n[0]; i = i + 1; }\n0;"
+    for level in range(0, MAX_OPTIMIZATION_LEVEL + 1):
+        for lazy in (False, True):
+            compiler = Compiler(level=level, lazy=lazy)
+            err = compiler.compile(parse(failing, lazy=lazy))
+            if err is not None:
+                print(f"Compiler error (-O{level}): {err}")
+                exit(1)
+
+            output: StringIO = StringIO()
+            with redirect_stdout(output):
+                err = VM(compiler.bytecode()).run()
+            if err is None or output.getvalue() != "0\n":
+                print(f"Failing loop (-O{level}, lazy={lazy}) printed {output.getvalue()!r} before {err}")
+                exit(1)
+
+    # A call evaluated at compile time that computes something too big is left to runtime
+    for n, folded in [(3, True), (16, False)]:
+        compiler = Compiler(level=MAX_OPTIMIZATION_LEVEL)
+        err = compiler.compile(parse(f"let grow = fn(s, n) {{ let i = 0; while i < n {{ s = s + s; i = i + 1; }} s }}; grow(\"ab\", {n});"))
+        if err is not None:
+            print(f"Compiler error (evaluated): {err}")
+            exit(1)
+
+        vm = VM(compiler.bytecode())
+        err = vm.run()
+        if err is None:
+            err = test_expected_object("ab" * 2 ** n, vm.stack.last_popped_elem)
+        strings: list[int] = [len(c.value) for c in compiler.constants if c.type() == "STRING"]
+        if err is None and (max(strings) > EVALUATION_SIZE_LIMIT or (2 ** (n + 1) in strings) != folded):
+            err = f"string constants of length {strings}"
+        if err is not None:
+            print(f"Evaluated call growing a string {n} times: {err}")
+            exit(1)
+
+    # REPL inputs see what earlier ones defined, a later input may reassign a global earlier code read
+    repl: Repl = Repl(passes=PassManager(level=MAX_OPTIMIZATION_LEVEL))
+    inputs: list[tuple[str, object]] = [
+        ("let c = 3; let g = fn() { c * 2 };", None),
+        ("g()", 6),
+        ("c = 4; g()", 8),
+        ("let k = fn() { c = c + 1; c };", None),
+        ("let t = 0; for (let i = 0; i < 3; i = i + 1) { k(); t = t + c }", None),
+        ("t", 18),
+        ("let bad = [1][0] + true;", "Runtime Error"),
+        ("bad", "Compiler Error"),
+        ("let runs = 0;", None),
+        ("let broken = fn() { nope };", "Compiler Error"),
+        ("runs = runs + 1;", None),
+        ("let after = 1;", None),
+        ("after + runs", 2)
+    ]
+    for src, expected in inputs:
+        result, err = repl.evaluate(src)
+        if isinstance(expected, str):
+            err = None if err is not None and err.startswith(expected) else f"expected a {expected}, got {err}"
+        elif err is None and expected is not None:
+            err = test_expected_object(expected, result)
+        if err is not None:
+            print(f"REPL input `{src}`: {err}")
+            exit(1)
+
+    # Imports resolve next to the importing file, then on the search path, and every module runs once
+    with TemporaryDirectory() as root:
+        files: dict[str, str] = {
+            "app/main.lime": 'import "lib/a.lime"; import "lib/b.lime"; import "util.lime"; [count, fromA, fromB, triple(2)];',
+            "app/lib/a.lime": 'import "c.lime"; let fromA = count;',
+            "app/lib/b.lime": 'import "c.lime"; let fromB = count + 10;',
+            "app/lib/c.lime": 'let count = 0; count = count + 1;',
+            "shared/util.lime": 'let triple = fn(x) { x * 3 };',
+            "cycle/x.lime": 'import "y.lime"; let x = 1;',
+            "cycle/y.lime": 'import "x.lime"; let y = 1;'
+        }
+        for name, src in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+            with open(os.path.join(root, name), "w") as f:
+                f.write(src)
+
+        compiler = Compiler(path=os.path.join(root, "app/main.lime"), search_path=[os.path.join(root, "shared")])
+        err = compiler.compile(parse(files["app/main.lime"]))
+        if err is not None:
+            print(f"Compiler error (modules): {err}")
+            exit(1)
+
+        vm = VM(compiler.bytecode())
+        err = vm.run()
+        if err is None:
+            err = test_expected_object([1, 1, 11, 6], vm.stack.last_popped_elem)
+        if err is not None:
+            print(f"Modules: {err}")
+            exit(1)
+
+        # Built file by file in a process pool and linked, the program computes the same
+        builder: Builder = Builder(passes=PassManager(level=MAX_OPTIMIZATION_LEVEL), search_path=[os.path.join(root, "shared")], jobs=2)
+        bytecode, err = builder.build(os.path.join(root, "app/main.lime"))
+        if err is not None:
+            print(f"Build error: {err}")
+            exit(1)
+
+        vm = VM(bytecode)
+        err = vm.run()
+        if err is None:
+            err = test_expected_object([1, 1, 11, 6], vm.stack.last_popped_elem)
+        if err is not None:
+            print(f"Built modules: {err}")
+            exit(1)
+
+        # Building again only compiles the modified file and the files importing it
+        b: str = os.path.join(root, "app/lib/b.lime")
+        with open(b, "w") as f:
+            f.write('import "c.lime"; let fromB = count + 20;')
+        os.utime(b, (os.path.getatime(b), os.path.getmtime(b) + 1))
+
+        bytecode, err = builder.build(os.path.join(root, "app/main.lime"))
+        if err is None:
+            vm = VM(bytecode)
+            err = vm.run()
+        if err is None:
+            err = test_expected_object([1, 1, 21, 6], vm.stack.last_popped_elem)
+        if err is None and sorted(os.path.basename(p) for p in builder.recompiled) != ["b.lime", "main.lime"]:
+            err = f"recompiled {builder.recompiled}"
+        if err is not None:
+            print(f"Rebuilt modules: {err}")
+            exit(1)
+
+        _, err = Builder(passes=PassManager(), search_path=[], jobs=2).build(os.path.join(root, "cycle/x.lime"))
+        if err is None or "Import cycle: x.lime -> y.lime -> x.lime" not in err:
+            print(f"Import cycle not reported by the build: {err}")
+            exit(1)
+
+        # Linking decodes and re-encodes every function, which has to keep its jumps, constants and globals intact
+        for i, t in enumerate(tests):
+            path: str = os.path.join(root, f"test{i}.lime")
+            with open(path, "w") as f:
+                f.write(t.input_src)
+
+            passes: PassManager = PassManager(level=MAX_OPTIMIZATION_LEVEL)
+            module: CompiledModule = compile_module(path, [], [], set(), set(), passes, [])
+            if module.error is not None:
+                print(f"Compiler error (linked): {module.error}")
+                exit(1)
+
+            vm = VM(Linker(compact=True).link([module]))
+            err = vm.run()
+            if err is None:
+                err = test_expected_object(t.expected, vm.stack.last_popped_elem)
+            if err is not None:
+                print(f"Linked `{t.input_src}`: {err}")
+                exit(1)
+
+        compiler = Compiler(path=os.path.join(root, "cycle/x.lime"))
+        err = compiler.compile(parse(files["cycle/x.lime"]))
+        if err is None or "Import cycle: x.lime -> y.lime -> x.lime" not in err:
+            print(f"Import cycle not reported: {err}")
+            exit(1)
+
+        # A cached program is stale once one of its imports would find another file first
+        shared: list[str] = [os.path.join(root, "shared")]
+        main: str = os.path.join(root, "app/main.lime")
+        shadow: str = os.path.join(root, "app/util.lime")
+        for build in ("compiler", "builder"):
+            passes: PassManager = PassManager()
+            if build == "compiler":
+                compiler = Compiler(passes=passes, path=main, search_path=shared)
+                err = compiler.compile(parse(files["app/main.lime"]))
+                bytecode, sources, paths = compiler.bytecode(), compiler.import_sources, compiler.import_paths
+            else:
+                builder = Builder(passes=passes, search_path=shared, jobs=2)
+                bytecode, err = builder.build(main)
+                sources, paths = builder.import_sources, builder.import_paths
+
+            cache: BytecodeCache = BytecodeCache(os.path.join(root, "cache"), search_path=shared)
+            if err is None:
+                err = cache.save(main, files["app/main.lime"], sources, paths, bytecode, passes)
+            if err is None and cache.load(main, files["app/main.lime"], passes) is None:
+                err = "the entry did not load"
+
+            with open(shadow, "w") as f:
+                f.write(files["shared/util.lime"])
+            if err is None and cache.load(main, files["app/main.lime"], passes) is not None:
+                err = "the entry loaded although util.lime now resolves next to main.lime"
+            os.remove(shadow)
+
+            if err is not None:
+                print(f"Cached modules ({build}): {err}")
+                exit(1)
+
+if __name__ == '__main__':
+    run()